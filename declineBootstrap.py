@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Confidence intervals of the declines with a stationary block bootstrap
+
+Usage:
+
+    ./declineBootstrap.py index percentage paths source
+    where
+        index: spx, nasdaq or a ticker (store or db sources)
+        percentage: the decline percentage
+        paths: number of synthetic paths (10000 by default)
+        source: csv (data/ folder, default), store (local columnar store) or db (Postgres)
+
+    The daily log returns are resampled in blocks of random (geometric) length
+    into synthetic paths as long as the history; the declines of every path are
+    found at once on 2-D arrays and the percentiles over the paths give the
+    confidence intervals of the number of declines, their depths and durations.
+"""
+
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+PATHS = 10000
+
+# Mean block length in trading days (about one month keeps volatility clustering)
+MEAN_BLOCK = 21
+
+# Cells (paths x days) of a batch: bounds the memory of every worker
+BATCH_CELLS = 4_000_000
+
+PERCENTILES = (2.5, 25, 50, 75, 97.5)
+
+METRICS = ('declines', 'meanDepth', 'maxDepth', 'meanDuration', 'maxDuration', 'underDeclineShare')
+
+
+def stationaryBootstrapIndices(n, paths, meanBlock, rng, length=None):
+    """Indices of a stationary block bootstrap (Politis & Romano), one row per path
+
+    Every day starts a new block with probability 1 / meanBlock at a random
+    position, otherwise it takes the day after the previous one (wrapping
+    around the end). Computed for all paths at once: the start of the current
+    block comes from a running maximum and the offset inside it from a
+    subtraction.
+
+      Args:
+          n: Number of observations to resample
+          paths: Number of paths
+          meanBlock: Mean block length
+          rng: NumPy Generator
+          length: Days per path (n by default)
+
+      Returns:
+          A (paths, length) NumPy array of indices into the observations
+    """
+    length = n if length is None else length
+    starts = rng.random((paths, length)) < 1.0 / meanBlock
+    starts[:, 0] = True
+    days = np.arange(length)
+    blockStart = np.maximum.accumulate(np.where(starts, days, 0), axis=1)
+    origins = rng.integers(0, n, size=(paths, length))
+    first = np.take_along_axis(origins, blockStart, axis=1)
+    return (first + days - blockStart) % n
+
+
+def syntheticPaths(returns, paths, meanBlock, rng, start=1.0):
+    """Price paths built from resampled log returns (paths x (len(returns) + 1))"""
+    indices = stationaryBootstrapIndices(len(returns), paths, meanBlock, rng)
+    logValues = np.cumsum(returns[indices], axis=1)
+    values = np.empty((paths, len(returns) + 1))
+    values[:, 0] = start
+    values[:, 1:] = start * np.exp(logValues)
+    return values
+
+
+def detectDeclines2D(values, percentage):
+    """Declines of every row of a 2-D array in one vectorized pass
+
+    Same rules as findDeclines on every row: each value at or above the all
+    time high of the row starts a group, so a return to the high ends a
+    decline, and a group is a decline when it falls percentage% below its high
+    (on a flat top the group starts on its last day). The rows are flattened and every row starts a new group, so the
+    groups of all the rows are handled by the same cumulative sums and
+    reductions as a single series.
+
+      Args:
+          values: (rows, days) NumPy array of values
+          percentage: Decline percentage
+
+      Returns:
+          A dict of NumPy arrays with one entry per decline: row, start (index of
+          the high), depth (fraction), duration (days until the next high or the
+          end of the row) and open (no new high yet)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rows, days = values.shape
+    high = np.maximum.accumulate(values, axis=1)
+    newHigh = np.empty(values.shape, dtype=bool)
+    newHigh[:, 0] = True
+    newHigh[:, 1:] = values[:, 1:] >= high[:, :-1]
+
+    flatValues = values.ravel()
+    flatHigh = high.ravel()
+    group = np.cumsum(newHigh.ravel()) - 1
+    groupStart = np.flatnonzero(newHigh.ravel())
+
+    below = np.flatnonzero(flatValues <= flatHigh * (1.0 - percentage / 100.0))
+    declineGroups = np.unique(group[below])
+
+    minimum = np.minimum.reduceat(flatValues, groupStart)[declineGroups]
+    start = groupStart[declineGroups]
+    row = start // days
+    # The group ends at the next group start unless it is the last one of its row
+    rowEnd = (row + 1) * days
+    nextStart = np.r_[groupStart, rows * days][declineGroups + 1]
+    open_ = nextStart >= rowEnd
+    end = np.where(open_, rowEnd - 1, nextStart)
+    return {
+        'row': row,
+        'start': start - row * days,
+        'depth': 1.0 - minimum / flatValues[start],
+        'duration': end - start,
+        'open': open_
+    }
+
+
+def pathMetrics(declines, rows, days):
+    """Per path statistics of detectDeclines2D (NaN depths and durations for paths without declines)"""
+    row = declines['row']
+    count = np.bincount(row, minlength=rows)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        meanDepth = np.bincount(row, declines['depth'], minlength=rows) / count
+        meanDuration = np.bincount(row, declines['duration'], minlength=rows) / count
+    maxDepth = np.full(rows, np.nan)
+    maxDuration = np.full(rows, np.nan)
+    if len(row):
+        maxDepth[count > 0] = 0.0
+        maxDuration[count > 0] = 0.0
+        np.fmax.at(maxDepth, row, declines['depth'])
+        np.fmax.at(maxDuration, row, declines['duration'])
+    underDecline = np.bincount(row, declines['duration'], minlength=rows) / days
+    return {
+        'declines': count.astype(np.float64),
+        'meanDepth': 100 * meanDepth,
+        'maxDepth': 100 * maxDepth,
+        'meanDuration': meanDuration,
+        'maxDuration': maxDuration,
+        'underDeclineShare': underDecline
+    }
+
+
+def _simulateBatch(args):
+    returns, paths, meanBlock, percentage, seed = args
+    rng = np.random.default_rng(seed)
+    values = syntheticPaths(returns, paths, meanBlock, rng)
+    return pathMetrics(detectDeclines2D(values, percentage), paths, values.shape[1])
+
+
+def bootstrapDeclines(values, percentage, paths=PATHS, meanBlock=MEAN_BLOCK, seed=None, processes=None):
+    """Decline statistics of every synthetic path, batches spread over processes
+
+      Args:
+          values: NumPy array of historical values in chronological order
+          percentage: Decline percentage
+          paths: Number of synthetic paths
+          meanBlock: Mean block length of the bootstrap (trading days)
+          seed: Seed of the random generator (reproducible runs)
+          processes: Worker processes (one per CPU by default)
+
+      Returns:
+          A dict {metric: NumPy array with one value per path} (see METRICS)
+    """
+    returns = np.diff(np.log(np.asarray(values, dtype=np.float64)))
+    batchPaths = max(1, BATCH_CELLS // (len(returns) + 1))
+    sizes = [min(batchPaths, paths - start) for start in range(0, paths, batchPaths)]
+    # Independent streams per batch: the result does not depend on the number of processes
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(returns, size, meanBlock, percentage, s) for size, s in zip(sizes, seeds)]
+    if len(tasks) <= 1 or processes == 1:
+        results = [_simulateBatch(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_simulateBatch, tasks))
+    return {metric: np.concatenate([r[metric] for r in results]) for metric in METRICS}
+
+
+def confidenceIntervals(metrics, percentiles=PERCENTILES):
+    """Percentiles of every metric over the paths as a DataFrame (metrics x percentiles)"""
+    import pandas as pd
+    return pd.DataFrame({
+        metric: np.nanpercentile(values, percentiles) if np.isfinite(values).any() else np.full(len(percentiles), np.nan)
+        for metric, values in metrics.items()
+    }, index=["p" + str(p) for p in percentiles]).T
+
+
+def historicalMetrics(values, percentage):
+    """The same metrics on the historical series, to compare with the intervals"""
+    values = np.asarray(values, dtype=np.float64)[np.newaxis, :]
+    return {metric: array[0] for metric, array in pathMetrics(detectDeclines2D(values, percentage), 1, values.shape[1]).items()}
+
+
+def main(index, percentage, paths = PATHS, source = "csv"):
+    import pandas as pd
+    from periodsAnalysis import readArrays
+    dates, values = readArrays(index, source)
+    table = confidenceIntervals(bootstrapDeclines(values, percentage, paths))
+    table.insert(0, 'historical', pd.Series(historicalMetrics(values, percentage)))
+    print("Declines of " + str(percentage) + "% or more in " + str(paths) + " paths of " + str(len(values)) + " days (durations in trading days)")
+    with pd.option_context('display.max_columns', None, 'display.width', 200, 'display.float_format', '{:.2f}'.format):
+        print(table)
+
+
+if __name__ == '__main__' :
+    main(sys.argv[1], float(sys.argv[2]),
+         int(sys.argv[3]) if len(sys.argv) > 3 else PATHS,
+         sys.argv[4] if len(sys.argv) > 4 else "csv")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Stores the declines, periods and current drawdown of every asset in the database
+
+Usage:
+
+    ./declineResults.py source [threshold ...]
+    where
+        source: db (datos_historicos, default) or store (local columnar store)
+        threshold: decline percentages (5 10 15 20 30 40 50 by default)
+
+    Only the assets whose prices changed since the last run are recomputed; their
+    rows are written with bulk upserts keyed by (asset, threshold, peak date) in
+    the resultados_caidas and caida_actual tables.
+"""
+
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+from periodsAnalysis import detectPeriods
+
+THRESHOLDS = (5, 10, 15, 20, 30, 40, 50)
+
+
+def _nullable(array):
+    """Python values for the database: None instead of NaN and NaT"""
+    values = array.tolist()
+    if array.dtype.kind == 'f':
+        return [None if value != value else value for value in values]
+    return values
+
+
+def periodRows(asset, dates, values, threshold):
+    """Rows of resultados_caidas for one asset and threshold (closed and open declines)"""
+    columns = detectPeriods(dates, values, threshold)
+    if len(columns['depth']) == 0:
+        return []
+    fields = [
+        columns['maximum1Date'].tolist(), columns['maximum1Value'].tolist(),
+        columns['declineDate'].tolist(), columns['declineValue'].tolist(),
+        columns['minimumDate'].tolist(), columns['minimumValue'].tolist(),
+        columns['declineEndDate'].tolist(),
+        columns['maximum2Date'].tolist(), _nullable(columns['maximum2Value']),
+        np.round(columns['depth'], 4).tolist(),
+        columns['declineDuration'].tolist(),
+        [None if days < 0 else days for days in columns['periodDuration'].tolist()],
+        columns['inDecline'].tolist()
+    ]
+    return [(asset, threshold) + row for row in zip(*fields)]
+
+
+def currentDrawdownRows(asset, dates, values, thresholds):
+    """Rows of caida_actual: distance of the last value to the all time high for every threshold"""
+    if len(values) == 0:
+        return []
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    high = int(np.argmax(values))
+    drawdown = round(float(100 * (1 - values[-1] / values[high])), 4)
+    rows = []
+    for threshold in thresholds:
+        # The open decline starts the first day under the threshold after the high
+        under = np.flatnonzero(values[high:] <= values[high] * (1 - threshold / 100.0))
+        declineDate = dates[high + under[0]].tolist() if len(under) else None
+        rows.append((asset, threshold, dates[-1].tolist(), float(values[-1]), dates[high].tolist(),
+                     float(values[high]), drawdown, declineDate is not None, declineDate))
+    return rows
+
+
+def _versionKey(version, thresholds):
+    """The stored version also depends on the thresholds: changing them recomputes everything"""
+    return str(version) + "|" + ",".join(str(t) for t in thresholds)
+
+
+def _changedSeries(source, cur, stored, thresholds, conn):
+    """(asset, version, dates, values) of the assets whose version differs from the stored one"""
+    if source == "store":
+        from almacen.almacen_series import listar_activos, leer_cierres, version_serie
+        for asset in listar_activos():
+            version = _versionKey(version_serie(asset), thresholds)
+            if stored.get(asset) != version:
+                yield (asset, version) + leer_cierres(asset)
+    else:
+        from db_utils.lectura_streaming import leer_activo
+        from db_utils.resultados import versiones_historicos
+        for asset, version in versiones_historicos(cur).items():
+            version = _versionKey(version, thresholds)
+            if stored.get(asset) != version:
+                yield (asset, version) + leer_activo(conn, asset)
+
+
+def refreshResults(source="db", thresholds=THRESHOLDS, batchAssets=50):
+    """Recomputes and stores the results of the assets whose prices changed
+
+      Args:
+          source: db (datos_historicos) or store (local columnar store)
+          thresholds: Decline percentages
+          batchAssets: Assets written per transaction
+
+      Returns:
+          The number of assets refreshed
+    """
+    from db_utils.db_connection import obtener_conexion
+    from db_utils.resultados import guardar_resultados, leer_versiones
+    thresholds = tuple(sorted(thresholds))
+    conn = obtener_conexion('neon', "HISTORICAL")
+    refreshed = 0
+    try:
+        with conn.cursor() as cur:
+            stored = leer_versiones(cur)
+            periods, current, versions = [], [], {}
+            for asset, version, dates, values in _changedSeries(source, cur, stored, thresholds, conn):
+                for threshold in thresholds:
+                    periods += periodRows(asset, dates, values, threshold)
+                current += currentDrawdownRows(asset, dates, values, thresholds)
+                versions[asset] = version
+                if len(versions) >= batchAssets:
+                    guardar_resultados(cur, periods, current, versions)
+                    conn.commit()
+                    refreshed += len(versions)
+                    periods, current, versions = [], [], {}
+            if versions:
+                guardar_resultados(cur, periods, current, versions)
+                conn.commit()
+                refreshed += len(versions)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return refreshed
+
+
+def main(source = "db", thresholds = THRESHOLDS):
+    refreshed = refreshResults(source, thresholds)
+    print("Assets refreshed: " + str(refreshed))
+
+
+if __name__ == '__main__' :
+    main(sys.argv[1] if len(sys.argv) > 1 else "db",
+         tuple(float(t) for t in sys.argv[2:]) or THRESHOLDS)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Forward returns after declines (event study)
+
+Usage:
+
+    ./forwardReturns.py index source
+    where
+        index: spx, nasdaq, a ticker (store or db sources) or all (every asset in the db)
+        source: csv (data/ folder, default), store (local columnar store) or db (Postgres)
+
+    Prints the percentiles of the returns 1, 3, 6 and 12 months after the first
+    day of every decline, for every threshold of the grid.
+"""
+
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+# Decline thresholds in percentage
+THRESHOLDS = (5, 10, 15, 20, 25, 30, 40, 50)
+
+# Horizons in trading days: 1, 3, 6 and 12 months
+HORIZONS = {'1m': 21, '3m': 63, '6m': 126, '12m': 252}
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def declineTriggers(values, thresholds=THRESHOLDS):
+    """First day of every decline for every threshold, all thresholds at once
+
+    Same rule as findDeclines: each new all time high starts a group and the
+    decline is triggered the first day the value falls threshold% below it.
+
+      Args:
+          values: NumPy array of values in chronological order
+          thresholds: Decline percentages
+
+      Returns:
+          Two NumPy arrays: the position of the threshold in thresholds and the
+          index of the trigger day, ordered by threshold and date
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    previousHigh = np.r_[-np.inf, np.maximum.accumulate(values)[:-1]]
+    newHigh = values > previousHigh
+    group = np.cumsum(newHigh)
+    high = np.maximum.accumulate(values)
+    limits = 1.0 - np.asarray(thresholds, dtype=np.float64)[:, np.newaxis] / 100.0
+    rows, days = np.nonzero(values <= high * limits)
+    # nonzero is ordered by threshold and day: keep the first day of each (threshold, group)
+    keys = rows * (group[-1] + 1) + group[days]
+    first = np.r_[True, keys[1:] != keys[:-1]] if len(keys) else np.empty(0, dtype=bool)
+    return rows[first], days[first]
+
+
+def forwardReturnEvents(dates, values, thresholds=THRESHOLDS, horizons=HORIZONS):
+    """Forward returns of every decline trigger at every horizon
+
+      Args:
+          dates: NumPy array of datetime64 dates in chronological order
+          values: NumPy array of values
+          thresholds: Decline percentages
+          horizons: Dict {name: trading days}
+
+      Returns:
+          A DataFrame with one row per trigger: threshold, date, value and one
+          column per horizon (NaN when the horizon goes past the last date)
+    """
+    import pandas as pd
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    values = np.asarray(values, dtype=np.float64)
+    rows, days = declineTriggers(values, thresholds)
+    events = {
+        'threshold': np.asarray(thresholds)[rows],
+        'date': dates[days],
+        'value': values[days]
+    }
+    for name, offset in horizons.items():
+        target = days + offset
+        inside = target < len(values)
+        returns = np.full(len(days), np.nan)
+        returns[inside] = values[target[inside]] / values[days[inside]] - 1
+        events[name] = returns
+    return pd.DataFrame(events)
+
+
+def summarize(events, horizons=HORIZONS, percentiles=PERCENTILES):
+    """Percentiles of the forward returns per (threshold, horizon)
+
+      Returns:
+          A DataFrame indexed by (threshold, horizon) with the number of events,
+          the mean, the share of positive returns and the percentiles
+    """
+    import pandas as pd
+    long = events.melt(id_vars=['threshold'], value_vars=list(horizons), var_name='horizon', value_name='return')
+    long = long.dropna(subset=['return'])
+    long['positive'] = long['return'] > 0
+    grouped = long.groupby(['threshold', 'horizon'], sort=False)['return']
+    table = pd.DataFrame({
+        'events': grouped.size(),
+        'mean': grouped.mean(),
+        'positive': long.groupby(['threshold', 'horizon'], sort=False)['positive'].mean()
+    })
+    for p in percentiles:
+        table["p" + str(p)] = grouped.quantile(p / 100.0)
+    return table.sort_index(level=0, sort_remaining=False)
+
+
+def universeForwardReturns(thresholds=THRESHOLDS, horizons=HORIZONS, percentiles=PERCENTILES):
+    """Forward return percentiles of every asset of datos_historicos, streamed one asset at a time
+
+      Returns:
+          A DataFrame indexed by (ticker, threshold, horizon)
+    """
+    import pandas as pd
+    from db_utils.db_connection import obtener_conexion
+    from db_utils.lectura_streaming import iterar_activos
+    conn = obtener_conexion('neon', "HISTORICAL")
+    tables = {}
+    try:
+        for ticker, dates, values in iterar_activos(conn):
+            events = forwardReturnEvents(dates, values, thresholds, horizons)
+            if len(events):
+                tables[ticker] = summarize(events, horizons, percentiles)
+    finally:
+        conn.close()
+    return pd.concat(tables, names=['ticker']) if tables else pd.DataFrame()
+
+
+def main(index, source = "csv"):
+    import pandas as pd
+    if index == "all":
+        table = universeForwardReturns()
+    else:
+        from periodsAnalysis import readArrays
+        table = summarize(forwardReturnEvents(*readArrays(index, source)))
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200, 'display.float_format', '{:.4f}'.format):
+        print(table)
+
+
+if __name__ == '__main__' :
+    main(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "csv")
@@ -4,18 +4,32 @@
 Usage:
 
     Make the python script executable (chmod +x historyAnalysis.py) and call it as follows
-    ./historyAnalysis index percentage function
+    ./historyAnalysis index percentage function source resolution
     where 
-        index: spx, nasdaq
+        index: spx, nasdaq, a ticker (store or db sources) or all (every asset in the db)
         percentage: the percentage
-        function: the function (declines by default, currently the only one available)
+        function: decline (default), sqldecline (drawdowns computed inside Postgres) or
+                  bootstrap (confidence intervals from synthetic paths, see declineBootstrap.py)
+        source: csv (data/ folder, default), store (local columnar store) or db (Postgres)
+        resolution: daily (default), weekly, monthly or yearly closes (store or db sources)
 """
 
 
+import os
 import csv
 import sys
 import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+# Resolution name -> resolucion of the rollup tables (db_utils/agregados.py)
+RESOLUTIONS = {
+    'daily': None,
+    'weekly': 'semanal',
+    'monthly': 'mensual',
+    'yearly': 'anual'
+}
+
 
 def readFile(fileName):
     """Reads a csv file in an inverted order and stores it in a collection
@@ -31,6 +45,86 @@ def readFile(fileName):
         return data
 
 
+def readStore(index, resolution='daily'):
+    """Reads the closing prices of an index from the local columnar store
+
+      Args:
+          index: The index name (spx, nasdaq) or a ticker
+          resolution: daily, weekly, monthly or yearly (last close of each period)
+
+      Returns:
+          A collection of [date, close] rows in chronological order, dates in a monkey format (%m/%d/%Y)
+    """
+    from almacen.almacen_series import INDICES, leer_cierres
+    dates, values = leer_cierres(INDICES.get(index, index))
+    if RESOLUTIONS[resolution]:
+        from db_utils.agregados import agregar_cierres
+        dates, values = agregar_cierres(dates, values, RESOLUTIONS[resolution])
+    return toRows(dates, values)
+
+
+def toRows(dates, values):
+    """Converts date and value arrays into [date, value] rows
+
+      Args:
+          dates: NumPy array of datetime64 dates
+          values: NumPy array of values
+
+      Returns:
+          A collection of [date, value] rows, dates in a monkey format (%m/%d/%Y)
+    """
+    import pandas as pd
+    return zip(pd.DatetimeIndex(dates).strftime('%m/%d/%Y'), values)
+
+
+def readDatabase(index, resolution='daily'):
+    """Streams the closing prices of an index or ticker from Postgres
+
+      Args:
+          index: The index name (spx, nasdaq, read from its own table) or a ticker of datos_historicos
+          resolution: daily, weekly, monthly or yearly (read from the rollup tables)
+
+      Returns:
+          A collection of [date, close] rows in chronological order, dates in a monkey format (%m/%d/%Y)
+    """
+    from db_utils.db_connection import obtener_conexion
+    from db_utils.lectura_streaming import TABLAS_INDICES, leer_indice, leer_activo
+    conn = obtener_conexion('neon', "INDICE" if index in TABLAS_INDICES else "HISTORICAL")
+    try:
+        if index in TABLAS_INDICES:
+            dates, values = leer_indice(conn, TABLAS_INDICES[index], resolucion=RESOLUTIONS[resolution])
+        else:
+            dates, values = leer_activo(conn, index, resolucion=RESOLUTIONS[resolution])
+    finally:
+        conn.close()
+    return toRows(dates, values)
+
+
+def readSeries(index, path='data/HistoricalData_', source='csv', resolution='daily'):
+    """Reads the chronological [date, close] rows of an index from the selected source
+
+      Args:
+          index: The index name (spx, nasdaq)
+          path: The path where the csv file is located (only used by the csv source)
+          source: csv, store or db
+          resolution: daily, weekly, monthly or yearly (store and db sources)
+
+      Returns:
+          A collection of [date, close] rows in chronological order
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError("Unknown resolution: " + resolution)
+    if source == 'store':
+        return readStore(index, resolution)
+    if source == 'db':
+        return readDatabase(index, resolution)
+    if RESOLUTIONS[resolution]:
+        raise ValueError("The csv source only has daily data, use the store or db sources")
+    fileExtension = ".csv"
+    qualifiedName = path + index + fileExtension
+    return readFile(qualifiedName)
+
+
 def printRows(data):
     """Prints all the rows in a collection.
 
@@ -76,20 +170,102 @@ def findLastDate():
 def updateHistoricalData():
     pass
 
-def findDeclines(index, percentage, path='data/HistoricalData_'):
+def findDeclines(index, percentage, path='data/HistoricalData_', source='csv', resolution='daily'):
     """Finds the number of declines given a percentage
 
       Args:
           fileName: The name of the file
           percentage: Decline percentage to search in the historic data
           path: The path where the file is located (data/ folder if not specified)
+          source: csv (default), store or db
+          resolution: daily (default), weekly, monthly or yearly
 
       Returns:
           Nothing at the moment
     """
-    fileExtension = ".csv"
-    qualifiedName = path + index + fileExtension
-    data = readFile(qualifiedName)
+    data = readSeries(index, path, source, resolution)
+    analyseDeclines(data, percentage)
+
+
+def findDeclinesUniverse(percentage):
+    """Finds the declines of every asset in the datos_historicos table
+
+    The table is streamed ordered by asset through a server-side cursor, so only
+    the asset being analysed is kept in memory.
+
+      Args:
+          percentage: Decline percentage to search in the historic data
+    """
+    from db_utils.db_connection import obtener_conexion
+    from db_utils.lectura_streaming import iterar_activos
+    conn = obtener_conexion('neon', "HISTORICAL")
+    try:
+        for ticker, dates, values in iterar_activos(conn):
+            print("##################################################")
+            print("Asset: " + str(ticker))
+            # One asset with bad data must not stop the rest of the stream
+            try:
+                analyseDeclines(toRows(dates, values), percentage)
+            except Exception as e:
+                print("Error analysing " + str(ticker) + ": " + str(e))
+    finally:
+        conn.close()
+
+
+def findDeclinesSQL(index, percentage):
+    """Finds the declines with window functions inside Postgres, only the events are transferred
+
+      Args:
+          index: spx, nasdaq (their own tables), a ticker or all (datos_historicos)
+          percentage: Decline percentage to search in the historic data
+
+      Returns:
+          A DataFrame with one row per decline
+    """
+    from db_utils.db_connection import obtener_conexion
+    from db_utils.caidas_sql import caidas_sql
+    from db_utils.lectura_streaming import TABLAS_INDICES
+    isIndex = index in TABLAS_INDICES
+    conn = obtener_conexion('neon', "INDICE" if isIndex else "HISTORICAL")
+    try:
+        if isIndex:
+            declines = caidas_sql(conn, percentage, origen=TABLAS_INDICES[index])
+        else:
+            declines = caidas_sql(conn, percentage, ticker=None if index == "all" else index)
+    finally:
+        conn.close()
+
+    for ticker, assetDeclines in declines.groupby('ticker', sort=False):
+        print("**************************************************")
+        print("Asset: " + str(ticker))
+        print("Searching declines greater or equal to " + str(percentage) + "%")
+        for decline in assetDeclines.itertuples():
+            print("**************************************************")
+            print("Maximum: " + str(decline.maximo) + " at " + decline.fecha_maximo.strftime('%d.%m.%Y'))
+            print("Decline found at " + decline.fecha_caida.strftime('%d.%m.%Y'))
+            print("Minimum: " + str(decline.minimo) + " at " + decline.fecha_minimo.strftime('%d.%m.%Y'))
+            print("Decline of: " + str(decline.caida_porcentaje) + "%")
+            if decline.en_curso:
+                print("Decline in progress, elapsed days: " + str(decline.duracion_dias) + " days")
+            else:
+                print("Decline end at " + decline.fecha_fin.strftime('%d.%m.%Y'))
+                print("Decline duration: " + str(decline.duracion_dias) + " days")
+        print("**************************************************")
+        print("Total number of declines: " + str(len(assetDeclines)))
+        completed = assetDeclines[~assetDeclines['en_curso']]
+        if len(completed):
+            print("Average decline duration: " + str(int(getAverage(list(completed['duracion_dias'])))) + " days")
+        print("**************************************************")
+    return declines
+
+
+def analyseDeclines(data, percentage):
+    """Prints the declines found in a chronological collection of [date, value] rows
+
+      Args:
+          data: The [date, value] rows, dates in a monkey format (%m/%d/%Y)
+          percentage: Decline percentage to search in the historic data
+    """
     inDecline = False
     declineFound = False
     i = 0
@@ -108,8 +284,10 @@ def findDeclines(index, percentage, path='data/HistoricalData_'):
             # initialize data
             if i == 0 :
                 allTimeHigh = currentValue
+                allTimeHighDate = currentDate
                 maximumValue = currentValue
                 allTimeMinimum = currentValue
+                allTimeMinimumDate = currentDate
                 minimumValue = currentValue
                 declineValue = maximumValue * (1.0 - percentage/100.0)
                 print("**************************************************")
@@ -174,23 +352,29 @@ def findDeclines(index, percentage, path='data/HistoricalData_'):
         except :
             #print("Exception found: " + str(i))
             #print(row[0] + "    " + row[1])
-            if inDecline :
-                print("Minimum: " + str(minimumValue) + " at " + humanReadableDate(minimumDate))
-                maximumDecline = 100 * (1 - minimumValue/allTimeHigh)
-                print("Maximum decline of: " + str(round(maximumDecline, 2)) + "% until now")
-                currentDecline = 100 * (1 - currentValue/allTimeHigh)
-                print("Current decline of " + str(round(currentDecline, 2)) + "% with " + str(currentValue) + " at the " + humanReadableDate(endDate))
-                declineDuration = calculateDuration(allTimeHighDate, endDate)
-                print("Elapsed days: " + str(declineDuration) + " days")
             continue
 
+    if i == 0 :
+        print("No data to analyse")
+        return
+
+    if inDecline :
+        print("Minimum: " + str(minimumValue) + " at " + humanReadableDate(minimumDate))
+        maximumDecline = 100 * (1 - minimumValue/allTimeHigh)
+        print("Maximum decline of: " + str(round(maximumDecline, 2)) + "% until now")
+        currentDecline = 100 * (1 - currentValue/allTimeHigh)
+        print("Current decline of " + str(round(currentDecline, 2)) + "% with " + str(currentValue) + " at the " + humanReadableDate(endDate))
+        declineDuration = calculateDuration(allTimeHighDate, endDate)
+        print("Elapsed days: " + str(declineDuration) + " days")
+
     print("**************************************************")
     print("Start date: " + humanReadableDate(startDate))
     print("End date: " + humanReadableDate(endDate))
     print("All time high: " + str(allTimeHigh) + " at " + humanReadableDate(allTimeHighDate))
     print("All time minimum: " + str(allTimeMinimum) + " at " + humanReadableDate(allTimeMinimumDate))
     print("Total number of declines: " + str(numberOfDeclines))
-    print("Average decline duration: " + str(int(getAverage(declinesDuration))) + " days")
+    if len(declinesDuration):
+        print("Average decline duration: " + str(int(getAverage(declinesDuration))) + " days")
     print("**************************************************")
 
 def findPeriods():
@@ -219,14 +403,24 @@ def printArguments():
     print(sys.argv[2])
 
 
-def main(index, percentage, function = "decline"):
+def main(index, percentage, function = "decline", source = "csv", resolution = "daily"):
     printArguments()
     if function == "decline":
-        findDeclines(index, percentage)
+        if index == "all":
+            findDeclinesUniverse(percentage)
+        else:
+            findDeclines(index, percentage, source=source, resolution=resolution)
+    elif function == "sqldecline":
+        findDeclinesSQL(index, percentage)
+    elif function == "bootstrap":
+        import declineBootstrap
+        declineBootstrap.main(index, percentage, source=source)
 
 
 if __name__ == '__main__' :
     index = sys.argv[1]
     percentage = float(sys.argv[2])
-    function = "decline"
-    main(index, percentage, function)
+    function = sys.argv[3] if len(sys.argv) > 3 else "decline"
+    source = sys.argv[4] if len(sys.argv) > 4 else "csv"
+    resolution = sys.argv[5] if len(sys.argv) > 5 else "daily"
+    main(index, percentage, function, source, resolution)
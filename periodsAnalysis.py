@@ -1,12 +1,26 @@
 #!/usr/bin/env python3
-"""
+"""Find the peak-to-peak periods and waves of financial assets
+
+Usage:
+
+    ./periodsAnalysis.py index percentage waveAmplitude source
+    where
+        index: spx, nasdaq or a ticker (store or db sources)
+        percentage: the decline percentage that defines a period
+        waveAmplitude: minimum swing in percentage of the waves inside each period (optional)
+        source: csv (data/ folder, default), store (local columnar store) or db (Postgres)
 """
 
 
+import os
 import csv
 import sys
 import datetime
 
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
 
 class Instant:
     """A date and value"""
@@ -22,12 +36,15 @@ class Instant:
 class Period:
     """Class to store and analyse relevant information from maximum to maximum"""
 
-    def __init__(self, maximum1 = 0, decline = 0, minimum = 0, declineEnd = 0, maximum2 = 0):
+    def __init__(self, maximum1 = 0, decline = 0, minimum = 0, declineEnd = 0, maximum2 = 0, waves = None):
         self.maximum1 = maximum1
         self.decline = decline
         self.minimum = minimum
         self.declineEnd = declineEnd
         self.maximum2 = maximum2
+        self.waves = waves if waves is not None else []
+        self.periodDuration = None
+        self.declineDuration = None
 
     def __str__(self) -> str:
         info = "Initial maximum: " + str(self.maximum1) + "\n" \
@@ -35,8 +52,23 @@ class Period:
             "Minimum: " + str(self.minimum) + "\n" \
             "Decline end: " + str(self.declineEnd) + "\n" \
             "Final maximum: " + str(self.maximum2)
+        if self.waves:
+            info += "\nWaves: " + ", ".join(str(wave) for wave in self.waves)
         return info
 
+    def calculateDurations(self):
+        """Calculates the period (maximum1 to maximum2) and decline (maximum1 to declineEnd) durations
+
+        Returns:
+            The period and decline durations as timedelta, None when the end instant is not known
+        """
+        start = toDatetime64(self.maximum1.date)
+        if isinstance(self.maximum2, Instant):
+            self.periodDuration = (toDatetime64(self.maximum2.date) - start).astype(datetime.timedelta)
+        if isinstance(self.declineEnd, Instant):
+            self.declineDuration = (toDatetime64(self.declineEnd.date) - start).astype(datetime.timedelta)
+        return self.periodDuration, self.declineDuration
+
     def calculateDuration(self, date1, date2):
         """Calculates duration in days between to dates
 
@@ -53,6 +85,92 @@ class Period:
         timeDelta = dateVar2 - dateVar1
         return timeDelta.days
 
+    def instants(self):
+        """The defined instants of the period with their names, in chronological order"""
+        names = ['maximum1', 'decline', 'minimum', 'declineEnd', 'maximum2']
+        return [(name, getattr(self, name)) for name in names if isinstance(getattr(self, name), Instant)]
+
+    def toChart(self, dates, values, name='period'):
+        """Describes the period as a chart for the plotting layer (scripts/graficos)
+
+        Args:
+            dates: NumPy array of datetime64 dates of the whole series
+            values: NumPy array of values of the whole series
+            name: The name of the chart (used as file name)
+
+        Returns:
+            A chart description with the series between maximum1 and maximum2 and the instants marked
+        """
+        marks = [(toDatetime64(instant.date), instant.value, key) for key, instant in self.instants()]
+        start = marks[0][0] if marks else dates[0]
+        end = marks[-1][0] if marks else dates[-1]
+        inside = (dates >= start) & (dates <= end)
+        return {
+            'nombre': name,
+            'titulo': name + ": " + str(start) + " - " + str(end),
+            'series': [(dates[inside], values[inside], 'value')],
+            'marcas': marks
+        }
+
+    def plotPeriod(self, dates, values, fileName=None, ax=None, widthPx=None):
+        """Plots the period, the series is downsampled to the pixel width of the chart
+
+        Args:
+            dates: NumPy array of datetime64 dates of the whole series
+            values: NumPy array of values of the whole series
+            fileName: Image file to write (format taken from the extension); the chart is drawn on ax or shown if not given
+            ax: Matplotlib axes to draw on
+            widthPx: Width of the chart in pixels (graficos.ANCHO_PX if not given)
+
+        Returns:
+            The axes the period was drawn on
+        """
+        from graficos import graficos
+        widthPx = widthPx or graficos.ANCHO_PX
+        chart = self.toChart(dates, values, os.path.splitext(os.path.basename(fileName))[0] if fileName else 'period')
+        if fileName:
+            imageFormat = os.path.splitext(fileName)[1][1:] or 'png'
+            graficos.renderizar_lote([chart], os.path.dirname(os.path.abspath(fileName)), ancho_px=widthPx, formato=imageFormat)
+            return None
+        if ax is None:
+            import matplotlib.pyplot as plt
+            fig, ax = plt.subplots(figsize=(widthPx / graficos.DPI, graficos.ALTO_PX / graficos.DPI))
+            graficos.dibujar(ax, chart, widthPx)
+            plt.show()
+            return ax
+        graficos.dibujar(ax, chart, widthPx)
+        return ax
+
+
+def toDatetime64(date):
+    """Converts a date (datetime64, date or a string in %d.%m.%Y, %m/%d/%Y or ISO format) into datetime64[D]"""
+    if isinstance(date, str):
+        for dateFormat in ('%d.%m.%Y', '%m/%d/%Y'):
+            try:
+                return np.datetime64(datetime.datetime.strptime(date, dateFormat).date(), 'D')
+            except ValueError:
+                pass
+    return np.datetime64(date, 'D')
+
+
+def plotPeriods(periods, dates, values, folder=None, prefix='period', processes=None):
+    """Renders many periods of a series to image files in a batch
+
+      Args:
+          periods: A collection of Period objects
+          dates: NumPy array of datetime64 dates of the whole series
+          values: NumPy array of values of the whole series
+          folder: The output folder (data/graficos if not specified)
+          prefix: File name prefix, files are named <prefix>_<n>.png
+          processes: Number of processes used to render
+
+      Returns:
+          The list of written files
+    """
+    from graficos import graficos
+    charts = [period.toChart(dates, values, prefix + "_" + str(n)) for n, period in enumerate(periods, 1)]
+    return graficos.renderizar_lote(charts, folder or graficos.RUTA_GRAFICOS, procesos=processes)
+
 
 def readFile(fileName):
     """Reads a csv file in an inverted order and stores it in a collection
@@ -100,6 +218,216 @@ def calculateDuration(date1, date2):
     dateVar2 = datetime.datetime.strptime(date2, '%m/%d/%Y').date()
     timeDelta = dateVar2 - dateVar1
     return timeDelta.days
+
+
+def _firstPerGroup(indices, groups):
+    """First index of each group, indices must be ascending (linear, no sorting)
+
+      Returns:
+          The groups found and their first index
+    """
+    if len(indices) == 0:
+        return indices, indices
+    first = np.r_[True, groups[1:] != groups[:-1]]
+    return groups[first], indices[first]
+
+
+def detectPeriods(dates, values, percentage):
+    """Finds every peak-to-peak period with a decline greater or equal to a percentage
+
+    Same rules as findDeclines: a value at or above the all time high starts a
+    group (on a flat top, its last day), a group is a decline when its values
+    fall percentage% below its high and it ends when the value returns to the
+    high (declineEnd). maximum2 is the highest value before the
+    next decline starts. Everything is computed with a running maximum and
+    cumulative sums, a constant number of passes over the series.
+
+      Args:
+          dates: NumPy array of datetime64 dates in chronological order
+          values: NumPy array of values
+          percentage: Decline percentage
+
+      Returns:
+          A dict of NumPy arrays, one entry per period: the index, date and value of
+          maximum1, decline, minimum, declineEnd and maximum2 (index -1 and NaT
+          while the decline or the period are still open), depth (%),
+          declineDuration and periodDuration (days) and inDecline
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        return _periodColumns(dates, values, *([np.empty(0, dtype=np.int64)] * 5))
+
+    previousHigh = np.r_[-np.inf, np.maximum.accumulate(values)[:-1]]
+    newHigh = values >= previousHigh
+    group = np.cumsum(newHigh) - 1
+    groupStart = np.flatnonzero(newHigh)
+    high = values[groupStart][group]
+
+    # Groups with a decline and the first value at or under the threshold
+    below = np.flatnonzero(values <= high * (1.0 - percentage / 100.0))
+    declineGroups, declineIndex = _firstPerGroup(below, group[below])
+
+    # First minimum of each group
+    groupMinimum = np.minimum.reduceat(values, groupStart)
+    atMinimum = np.flatnonzero(values == groupMinimum[group])
+    minimumGroups, minimumIndex = _firstPerGroup(atMinimum, group[atMinimum])
+    minimumIndex = minimumIndex[np.searchsorted(minimumGroups, declineGroups)]
+
+    maximum1Index = groupStart[declineGroups]
+    nextGroup = declineGroups + 1
+    closed = nextGroup < len(groupStart)
+    declineEndIndex = np.where(closed, groupStart[np.minimum(nextGroup, len(groupStart) - 1)], -1)
+
+    # maximum2: the high of the next decline or, for the last one, the last all time high
+    maximum2Index = np.r_[maximum1Index[1:], groupStart[-1]] if len(maximum1Index) else maximum1Index
+    maximum2Index = np.where(closed, maximum2Index, -1)
+    return _periodColumns(dates, values, maximum1Index, declineIndex, minimumIndex, declineEndIndex, maximum2Index)
+
+
+def _periodColumns(dates, values, maximum1Index, declineIndex, minimumIndex, declineEndIndex, maximum2Index):
+    """Columnar result of detectPeriods"""
+    columns = {}
+    for name, index in (('maximum1', maximum1Index), ('decline', declineIndex), ('minimum', minimumIndex),
+                        ('declineEnd', declineEndIndex), ('maximum2', maximum2Index)):
+        index = np.asarray(index, dtype=np.int64)
+        known = index >= 0
+        columns[name + 'Index'] = index
+        columns[name + 'Date'] = np.where(known, dates[index], np.datetime64('NaT', 'D'))
+        columns[name + 'Value'] = np.where(known, values[index], np.nan)
+    lastDate = dates[-1] if len(dates) else np.datetime64('NaT', 'D')
+    end = np.where(columns['declineEndIndex'] >= 0, columns['declineEndDate'], lastDate)
+    columns['depth'] = 100 * (1 - columns['minimumValue'] / columns['maximum1Value'])
+    columns['declineDuration'] = (end - columns['maximum1Date']).astype(np.int64)
+    columns['periodDuration'] = np.where(columns['maximum2Index'] >= 0,
+                                         (columns['maximum2Date'] - columns['maximum1Date']).astype(np.int64), -1)
+    columns['inDecline'] = columns['declineEndIndex'] < 0
+    return columns
+
+
+def detectWaves(dates, values, amplitude, periods=None):
+    """Finds the local swings (waves) greater or equal to an amplitude with a zigzag
+
+    A single forward pass keeps the current extreme; a peak (trough) is confirmed
+    when the series moves amplitude% below (above) it.
+
+      Args:
+          dates: NumPy array of datetime64 dates in chronological order
+          values: NumPy array of values
+          amplitude: Minimum swing in percentage
+          periods: Result of detectPeriods, to assign each wave to its period
+
+      Returns:
+          A dict of NumPy arrays, one entry per wave between two confirmed pivots:
+          start/end index, date and value, change (%), duration (days) and period
+          (position in periods, -1 outside any period)
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    series = np.asarray(values, dtype=np.float64)
+    values = series.tolist()
+    up = 1.0 + amplitude / 100.0
+    down = 1.0 - amplitude / 100.0
+    pivots = []
+    direction = 0
+    highIndex = lowIndex = extreme = 0
+    for i in range(1, len(values)):
+        value = values[i]
+        if direction > 0:
+            if value > values[extreme]:
+                extreme = i
+            elif value <= values[extreme] * down:
+                pivots.append(extreme)
+                direction, extreme = -1, i
+        elif direction < 0:
+            if value < values[extreme]:
+                extreme = i
+            elif value >= values[extreme] * up:
+                pivots.append(extreme)
+                direction, extreme = 1, i
+        else:
+            # Until the first swing it is unknown whether a peak or a trough comes first
+            if value > values[highIndex]:
+                highIndex = i
+            if value < values[lowIndex]:
+                lowIndex = i
+            if lowIndex < highIndex and values[highIndex] >= values[lowIndex] * up:
+                pivots.append(lowIndex)
+                direction, extreme = 1, highIndex
+            elif highIndex < lowIndex and values[lowIndex] <= values[highIndex] * down:
+                pivots.append(highIndex)
+                direction, extreme = -1, lowIndex
+
+    pivots = np.asarray(pivots, dtype=np.int64)
+    start, end = pivots[:-1], pivots[1:]
+    waves = {
+        'startIndex': start,
+        'startDate': dates[start],
+        'startValue': series[start],
+        'endIndex': end,
+        'endDate': dates[end],
+        'endValue': series[end],
+        'change': 100 * (series[end] / series[start] - 1),
+        'duration': (dates[end] - dates[start]).astype(np.int64),
+        'period': np.full(len(start), -1, dtype=np.int64)
+    }
+    if periods is not None and len(periods['maximum1Index']):
+        period = np.searchsorted(periods['maximum1Index'], start, side='right') - 1
+        periodEnd = np.where(periods['maximum2Index'] >= 0, periods['maximum2Index'], len(series))
+        inside = (period >= 0) & (end <= periodEnd[np.maximum(period, 0)])
+        waves['period'] = np.where(inside, period, -1)
+    return waves
+
+
+def toPeriods(periods, waves=None):
+    """Builds Period objects (with their waves and durations) from the columnar results
+
+      Args:
+          periods: Result of detectPeriods
+          waves: Result of detectWaves called with periods
+
+      Returns:
+          A list of Period objects, dates in a human readable format (%d.%m.%Y)
+    """
+    def instant(name, i):
+        if periods[name + 'Index'][i] < 0:
+            return None
+        return Instant(periods[name + 'Date'][i].item().strftime('%d.%m.%Y'), float(periods[name + 'Value'][i]))
+
+    result = []
+    for i in range(len(periods['maximum1Index'])):
+        period = Period(*(instant(name, i) for name in ('maximum1', 'decline', 'minimum', 'declineEnd', 'maximum2')))
+        if waves is not None:
+            for w in np.flatnonzero(waves['period'] == i):
+                period.waves.append(Instant(waves['endDate'][w].item().strftime('%d.%m.%Y'), float(waves['endValue'][w])))
+        period.calculateDurations()
+        result.append(period)
+    return result
+
+
+def readArrays(index, source='csv', path='data/HistoricalData_'):
+    """Reads the dates and closes of an index as NumPy arrays
+
+      Args:
+          index: The index name (spx, nasdaq) or a ticker (store and db sources)
+          source: csv, store or db
+          path: The path where the csv file is located (only used by the csv source)
+
+      Returns:
+          datetime64[D] dates and float64 values in chronological order
+    """
+    from historyAnalysis import readSeries
+    dates = []
+    values = []
+    for row in readSeries(index, path, source):
+        try:
+            values.append(float(row[1]))
+            dates.append(datetime.datetime.strptime(row[0], '%m/%d/%Y').date())
+        # skip titles
+        except (ValueError, IndexError):
+            if len(dates) < len(values):
+                values.pop()
+    return np.array(dates, dtype='datetime64[D]'), np.array(values, dtype=np.float64)
     
 
 def findDeclines(index, percentage, path='data/HistoricalData_'):
@@ -235,8 +563,23 @@ def findDeclines(index, percentage, path='data/HistoricalData_'):
     print("**************************************************")
 
 
-def main():
-    pass
+def main(index, percentage, amplitude = None, source = "csv"):
+    dates, values = readArrays(index, source)
+    periods = detectPeriods(dates, values, percentage)
+    waves = detectWaves(dates, values, amplitude, periods) if amplitude else None
+    for period in toPeriods(periods, waves):
+        print("**************************************************")
+        print(period)
+        if period.declineDuration is not None:
+            print("Decline duration: " + str(period.declineDuration.days) + " days")
+        if period.periodDuration is not None:
+            print("Period duration: " + str(period.periodDuration.days) + " days")
+    print("**************************************************")
+    print("Total number of periods: " + str(len(periods['maximum1Index'])))
+    if len(periods['depth']):
+        print("Average depth: " + str(round(float(np.mean(periods['depth'])), 2)) + "%")
+    if waves is not None:
+        print("Total number of waves: " + str(int(np.sum(waves['period'] >= 0))))
 
 
 def test():
@@ -246,4 +589,10 @@ def test():
 
 
 if __name__ == '__main__' :
-    test()
\ No newline at end of file
+    if len(sys.argv) > 2:
+        # ./periodsAnalysis.py index percentage [waveAmplitude] [source]
+        main(sys.argv[1], float(sys.argv[2]),
+             float(sys.argv[3]) if len(sys.argv) > 3 else None,
+             sys.argv[4] if len(sys.argv) > 4 else "csv")
+    else:
+        test()
\ No newline at end of file
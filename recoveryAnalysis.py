@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Time under water and recovery time of financial assets
+
+Usage:
+
+    ./recoveryAnalysis.py index source
+    where
+        index: spx, nasdaq, a ticker (store or db sources) or all (every asset in the db)
+        source: csv (data/ folder, default), store (local columnar store) or db (Postgres)
+
+    Prints the distribution of the days needed to regain each day's price and of
+    the days spent under the previous all time high.
+"""
+
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+PERCENTILES = (50, 75, 90, 95, 99)
+
+
+def nextRecovery(values):
+    """Index of the first later day whose value regains each day's value (next greater or equal element)
+
+    A stack keeps the days still waiting for their recovery; their values are
+    strictly decreasing, so each day is pushed and popped once: O(n).
+
+      Args:
+          values: NumPy array of values in chronological order
+
+      Returns:
+          A NumPy array of indices, -1 for the days not recovered yet
+    """
+    values = np.asarray(values, dtype=np.float64).tolist()
+    recovery = [-1] * len(values)
+    stack = []
+    for i, value in enumerate(values):
+        while stack and values[stack[-1]] <= value:
+            recovery[stack.pop()] = i
+        stack.append(i)
+    return np.array(recovery, dtype=np.int64)
+
+
+def recoveryTimes(dates, values):
+    """Days until each day's value is regained
+
+      Args:
+          dates: NumPy array of datetime64 dates in chronological order
+          values: NumPy array of values
+
+      Returns:
+          Calendar days and trading days until the recovery, and a mask of the
+          recovered days. For the days not recovered yet the elapsed days until
+          the last date are returned (a lower bound).
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    recovery = nextRecovery(values)
+    recovered = recovery >= 0
+    positions = np.arange(len(recovery))
+    end = np.where(recovered, recovery, len(recovery) - 1)
+    calendarDays = (dates[end] - dates).astype(np.int64) if len(dates) else np.empty(0, dtype=np.int64)
+    return calendarDays, end - positions, recovered
+
+
+def underwaterDuration(dates, values):
+    """Calendar days since the last all time high for every day (0 on a new high)"""
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int64)
+    atHigh = values >= np.maximum.accumulate(values)
+    lastHigh = np.maximum.accumulate(np.where(atHigh, np.arange(len(values)), 0))
+    return (dates - dates[lastHigh]).astype(np.int64)
+
+
+def _percentiles(values, percentiles):
+    if len(values) == 0:
+        return {"p" + str(p): np.nan for p in percentiles}
+    return dict(zip(("p" + str(p) for p in percentiles), np.percentile(values, percentiles)))
+
+
+def recoveryStatistics(dates, values, percentiles=PERCENTILES):
+    """Distribution of recovery and underwater times over all days of a series
+
+      Args:
+          dates: NumPy array of datetime64 dates in chronological order
+          values: NumPy array of values
+          percentiles: Percentiles to report
+
+      Returns:
+          A dict with the number of days, the recovered share, the recovery time
+          percentiles (calendar days, recovered days only), the longest recovery,
+          the days still waiting, the underwater time percentiles and the current
+          underwater duration
+    """
+    calendarDays, tradingDays, recovered = recoveryTimes(dates, values)
+    underwater = underwaterDuration(dates, values)
+    statistics = {
+        'days': len(recovered),
+        'recoveredShare': float(recovered.mean()) if len(recovered) else np.nan,
+        'recoveryMean': float(calendarDays[recovered].mean()) if recovered.any() else np.nan,
+        'recoveryMax': int(calendarDays[recovered].max()) if recovered.any() else 0,
+        'pendingDays': int((~recovered).sum()),
+        'pendingMax': int(calendarDays[~recovered].max()) if (~recovered).any() else 0,
+        'underwaterShare': float((underwater > 0).mean()) if len(underwater) else np.nan,
+        'currentUnderwater': int(underwater[-1]) if len(underwater) else 0,
+    }
+    statistics.update({"recovery_" + k: v for k, v in _percentiles(calendarDays[recovered], percentiles).items()})
+    statistics.update({"underwater_" + k: v for k, v in _percentiles(underwater[underwater > 0], percentiles).items()})
+    return statistics
+
+
+def universeRecovery(percentiles=PERCENTILES):
+    """Recovery statistics of every asset of datos_historicos, streamed one asset at a time
+
+      Returns:
+          A DataFrame with one row per ticker
+    """
+    import pandas as pd
+    from db_utils.db_connection import obtener_conexion
+    from db_utils.lectura_streaming import iterar_activos
+    conn = obtener_conexion('neon', "HISTORICAL")
+    try:
+        rows = {ticker: recoveryStatistics(dates, values, percentiles) for ticker, dates, values in iterar_activos(conn)}
+    finally:
+        conn.close()
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def main(index, source = "csv"):
+    import pandas as pd
+    if index == "all":
+        table = universeRecovery()
+    else:
+        from periodsAnalysis import readArrays
+        table = pd.DataFrame.from_dict({index: recoveryStatistics(*readArrays(index, source))}, orient='index')
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(table.T)
+
+
+if __name__ == '__main__' :
+    main(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "csv")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Rolling pairwise correlation of the asset universe
+
+Usage:
+
+    ./rollingCorrelation.py window [ticker ...]
+    where
+        window: window size in trading days (for instance 63)
+        ticker: tickers of the local columnar store (every asset of
+                stock_symbols.json by default)
+
+    Prints the correlation matrix of the last date and saves the whole
+    (date, asset, asset) cube in the cache folder.
+"""
+
+
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+CACHE_PATH = os.getenv("ROLLING_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cache_estadisticas'))
+
+# Steps between two exact recomputations of the window sums (bounds the rounding drift)
+RESYNC_STEPS = 10000
+
+
+def returnsMatrix(tickers):
+    """Daily log returns of every asset of the local columnar store, one column per asset
+
+    Every return is computed over the asset's own consecutive sessions, so a
+    holiday in one market does not create a multi-day return; the dates where an
+    asset did not trade are NaN.
+
+      Returns:
+          The union of the dates (datetime64) and a dates x assets NumPy array
+    """
+    from almacen.alineacion import alinear
+    matrix = alinear(tickers, columna='cierre')
+    return matrix.fechas, matrix.rendimientos(logaritmicos=True, sesiones_propias=True)
+
+
+def _windowSums(left, right):
+    """Sums of the outer products of the rows of left and right (one whole window at once)"""
+    return left.T @ right
+
+
+def rollingCorrelation(returns, window, minPeriods=None, dtype=np.float32, resyncSteps=RESYNC_STEPS):
+    """Pairwise correlation of every window of returns, updated with incremental sums
+
+    For each pair the window keeps the sums of x, y, x^2, y^2, x*y and the
+    count of the days both assets traded. They are the blocks of a single
+    (3N x 2N) matrix of sums of outer products of [x, x^2, m] and [m, x]
+    (m is 1 when the asset traded): sliding the window adds the outer product
+    of the row that enters and subtracts the one that leaves, O(N^2) per step
+    instead of O(window * N^2).
+
+      Args:
+          returns: NumPy array dates x assets, NaN where an asset did not trade
+          window: Window size in rows
+          minPeriods: Minimum days with both assets in the window (window // 2 by default)
+          dtype: Type of the result
+          resyncSteps: Steps between two exact recomputations of the sums
+
+      Returns:
+          A NumPy array (rows - window + 1, N, N): the correlation matrix of the
+          window ending in each row from window - 1 on, NaN for the pairs with
+          less than minPeriods common days
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    rows, n = returns.shape
+    minPeriods = window // 2 if minPeriods is None else minPeriods
+    result = np.full((max(rows - window + 1, 0), n, n), np.nan, dtype=dtype)
+    if rows < window:
+        return result
+
+    traded = np.isfinite(returns)
+    # Centred returns keep the subtraction of the sums numerically stable
+    x = np.where(traded, returns - np.nanmean(returns, axis=0), 0.0)
+    m = traded.astype(np.float64)
+    left = np.hstack([x, x * x, m])
+    right = np.hstack([m, x])
+
+    sums = _windowSums(left[:window], right[:window])
+    for step in range(rows - window + 1):
+        end = step + window
+        if step:
+            if step % resyncSteps == 0:
+                sums = _windowSums(left[step:end], right[step:end])
+            else:
+                sums += np.outer(left[end - 1], right[end - 1]) - np.outer(left[step - 1], right[step - 1])
+        sumX = sums[:n, :n]             # sum of x_i over the days j traded
+        sumSquares = sums[n:2 * n, :n]  # sum of x_i^2 over the days j traded
+        count = sums[2 * n:, :n]        # days both traded
+        products = sums[:n, n:]         # sum of x_i * x_j
+        with np.errstate(invalid='ignore', divide='ignore'):
+            covariance = count * products - sumX * sumX.T
+            varianceI = count * sumSquares - sumX * sumX
+            correlation = covariance / np.sqrt(varianceI * varianceI.T)
+        correlation[count < minPeriods] = np.nan
+        result[step] = np.clip(correlation, -1.0, 1.0)
+    return result
+
+
+class CorrelationCube:
+    """Rolling correlation matrices of a universe stored as one (date, asset, asset) array
+
+    The float32 cube keeps every matrix contiguous, so one date is a single
+    slice and one pair over time is a strided view.
+    """
+
+    def __init__(self, dates, tickers, values, window):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.tickers = list(tickers)
+        self.values = values
+        self.window = window
+        self._positions = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+    @classmethod
+    def compute(cls, tickers, window, minPeriods=None):
+        """Reads the returns of the universe and computes its rolling correlations"""
+        dates, returns = returnsMatrix(tickers)
+        values = rollingCorrelation(returns, window, minPeriods)
+        return cls(dates[window - 1:], tickers, values, window)
+
+    def pair(self, first, second):
+        """Correlation of two assets over time (dates and a NumPy view)"""
+        return self.dates, self.values[:, self._positions[first], self._positions[second]]
+
+    def onDate(self, date):
+        """Correlation matrix of the last date on or before date as a DataFrame"""
+        import pandas as pd
+        position = np.searchsorted(self.dates, np.datetime64(date, 'D'), side='right') - 1
+        if position < 0:
+            raise ValueError("No correlation matrix on or before " + str(date))
+        return pd.DataFrame(self.values[position], index=self.tickers, columns=self.tickers)
+
+    def latest(self):
+        return self.onDate(self.dates[-1])
+
+    def save(self, fileName):
+        os.makedirs(os.path.dirname(fileName) or '.', exist_ok=True)
+        temporary = fileName + ".tmp.npz"
+        np.savez(temporary, dates=self.dates, tickers=np.array(self.tickers), values=self.values, window=np.array(self.window))
+        os.replace(temporary, fileName)
+
+    @classmethod
+    def load(cls, fileName):
+        with np.load(fileName) as saved:
+            return cls(saved['dates'], saved['tickers'].tolist(), saved['values'], int(saved['window']))
+
+
+def universeTickers():
+    """Tickers of stock_symbols.json"""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stock_symbols.json'), 'r') as f:
+        return [asset['ticker'] for asset in json.load(f)]
+
+
+def main(window, tickers=None):
+    import pandas as pd
+    tickers = tickers or universeTickers()
+    cube = CorrelationCube.compute(tickers, window)
+    cube.save(os.path.join(CACHE_PATH, "correlation_" + str(window) + ".npz"))
+    print("Correlations on " + str(cube.dates[-1]) + " (" + str(window) + " day window)")
+    with pd.option_context('display.max_columns', None, 'display.width', 200, 'display.float_format', '{:.3f}'.format):
+        print(cube.latest())
+
+
+if __name__ == '__main__' :
+    main(int(sys.argv[1]), sys.argv[2:])
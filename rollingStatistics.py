@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Rolling statistics of financial assets
+
+Usage:
+
+    ./rollingStatistics.py ticker [ticker ...]
+    where
+        ticker: spx, nasdaq or any ticker of the local columnar store
+
+    Prints the latest rolling return, volatility, maximum drawdown and moving
+    average of every window for each asset.
+"""
+
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+# Trading days: 1 month, 3 months, 6 months and 1 year
+WINDOWS = (21, 63, 126, 252)
+STATISTICS = ('return', 'volatility', 'maxDrawdown', 'movingAverage')
+TRADING_DAYS = 252
+
+CACHE_PATH = os.getenv("ROLLING_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cache_estadisticas'))
+
+# Windows per block when the windows are materialised (maximum drawdown)
+BLOCK_ROWS = 4096
+
+
+def _padded(values, result):
+    """Puts result at the end of an array of NaN with the size of values"""
+    padded = np.full(len(values), np.nan)
+    padded[len(values) - len(result):] = result
+    return padded
+
+
+def movingAverage(values, window):
+    """Moving average with a cumulative sum, the first window - 1 days are NaN"""
+    if len(values) < window:
+        return np.full(len(values), np.nan)
+    sums = np.cumsum(np.r_[0.0, values])
+    return _padded(values, (sums[window:] - sums[:-window]) / window)
+
+
+def rollingReturn(values, window):
+    """Return over the last window days"""
+    result = np.full(len(values), np.nan)
+    if len(values) > window:
+        result[window:] = values[window:] / values[:-window] - 1
+    return result
+
+
+def rollingVolatility(values, window, annualize=True):
+    """Standard deviation of the daily log returns of the last window days
+
+    Uses running sums of the returns and their squares; the returns are
+    centred first to keep the subtraction of the sums numerically stable.
+    """
+    result = np.full(len(values), np.nan)
+    if len(values) <= window:
+        return result
+    returns = np.diff(np.log(values))
+    returns = returns - returns.mean()
+    sums = np.cumsum(np.r_[0.0, returns])
+    squares = np.cumsum(np.r_[0.0, returns * returns])
+    total = sums[window:] - sums[:-window]
+    variance = (squares[window:] - squares[:-window] - total * total / window) / (window - 1)
+    result[window:] = np.sqrt(np.maximum(variance, 0.0))
+    if annualize:
+        result *= np.sqrt(TRADING_DAYS)
+    return result
+
+
+def rollingMaxDrawdown(values, window, blockRows=BLOCK_ROWS):
+    """Largest decline from a maximum inside each window of window days (as a positive fraction)
+
+    The windows are strided views over the array; they are materialised in blocks
+    of blockRows windows so memory stays bounded for long series.
+    """
+    result = np.full(len(values), np.nan)
+    if len(values) < window:
+        return result
+    windows = np.lib.stride_tricks.sliding_window_view(values, window)
+    for start in range(0, len(windows), blockRows):
+        block = windows[start:start + blockRows]
+        drawdowns = 1 - block / np.maximum.accumulate(block, axis=1)
+        result[window - 1 + start:window - 1 + start + len(block)] = drawdowns.max(axis=1)
+    return result
+
+
+FUNCTIONS = {
+    'return': rollingReturn,
+    'volatility': rollingVolatility,
+    'maxDrawdown': rollingMaxDrawdown,
+    'movingAverage': movingAverage
+}
+
+
+def computeStatistics(values, windows=WINDOWS, statistics=STATISTICS):
+    """Computes every statistic for every window of one series
+
+      Args:
+          values: NumPy array of prices in chronological order
+          windows: Window sizes in trading days
+          statistics: Names of the statistics (see STATISTICS)
+
+      Returns:
+          A dict {(statistic, window): NumPy array aligned with values}
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return {(statistic, window): FUNCTIONS[statistic](values, window)
+            for window in windows for statistic in statistics}
+
+
+def _cacheFile(ticker, window, path=CACHE_PATH):
+    return os.path.join(path, ticker.replace('^', '_') + "_" + str(window) + ".npz")
+
+
+def _readCache(ticker, window, version, statistics, path=CACHE_PATH):
+    """Cached statistics of one (asset, window) if they were computed for this data version"""
+    fileName = _cacheFile(ticker, window, path)
+    if version is None or not os.path.exists(fileName):
+        return None
+    with np.load(fileName) as cached:
+        if str(cached['version']) != version or any(statistic not in cached.files for statistic in statistics):
+            return None
+        return {(statistic, window): cached[statistic] for statistic in statistics}
+
+
+def _writeCache(ticker, window, version, results, path=CACHE_PATH):
+    os.makedirs(path, exist_ok=True)
+    fileName = _cacheFile(ticker, window, path)
+    arrays = {statistic: array for (statistic, size), array in results.items() if size == window}
+    temporary = fileName + ".tmp.npz"
+    np.savez(temporary, version=np.array(version), **arrays)
+    os.replace(temporary, fileName)
+
+
+def assetStatistics(ticker, windows=WINDOWS, statistics=STATISTICS, path=CACHE_PATH):
+    """Rolling statistics of an asset of the local columnar store, cached per (asset, window, data version)
+
+      Args:
+          ticker: spx, nasdaq or a ticker of the store
+          windows: Window sizes in trading days
+          statistics: Names of the statistics (see STATISTICS)
+          path: The cache folder
+
+      Returns:
+          The dates and a dict {(statistic, window): NumPy array aligned with the dates}
+    """
+    from almacen.almacen_series import INDICES, leer_cierres, version_serie
+    ticker = INDICES.get(ticker, ticker)
+    version = version_serie(ticker)
+    dates, values = leer_cierres(ticker)
+    results = {}
+    missing = []
+    for window in windows:
+        cached = _readCache(ticker, window, version, statistics, path)
+        if cached is None:
+            missing.append(window)
+        else:
+            results.update(cached)
+    if missing:
+        computed = computeStatistics(values, missing, statistics)
+        results.update(computed)
+        if version is not None:
+            for window in missing:
+                _writeCache(ticker, window, version, computed, path)
+    return dates, results
+
+
+def universeStatistics(tickers, windows=WINDOWS, statistics=STATISTICS, processes=None):
+    """Rolling statistics of many assets, each asset read once and spread over processes
+
+      Returns:
+          A dict {ticker: (dates, {(statistic, window): array})}
+    """
+    tickers = list(tickers)
+    count = len(tickers)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = executor.map(assetStatistics, tickers, [windows] * count, [statistics] * count)
+        return dict(zip(tickers, results))
+
+
+def latestTable(results):
+    """Last value of every statistic and window per asset as a DataFrame"""
+    import pandas as pd
+    rows = {}
+    for ticker, (dates, statistics) in results.items():
+        row = {'date': dates[-1] if len(dates) else None}
+        for (statistic, window), array in statistics.items():
+            row[statistic + "_" + str(window)] = array[-1] if len(array) else np.nan
+        rows[ticker] = row
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+if __name__ == '__main__' :
+    import pandas as pd
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(latestTable(universeStatistics(sys.argv[1:])))
@@ -0,0 +1,198 @@
+import os
+import sys
+import glob
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Añadir la ruta del almacén local manualmente
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from almacen.almacen_series import RAIZ_REPO, INDICES, leer_serie, version_serie
+
+# ==========================================================
+# Alineación de activos de distintas bolsas en una matriz densa
+# ==========================================================
+RUTA_CACHE = os.getenv("ALINEACION_CACHE_DIR", os.path.join(RAIZ_REPO, 'data', 'cache_alineacion'))
+TAMANO_MAXIMO_CACHE = int(os.getenv("ALINEACION_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+
+def _ultimo_observado(observado):
+    """Posición de la última observación en o antes de cada fila, por columna (-1 si no hay)"""
+    filas = np.arange(observado.shape[0])[:, np.newaxis]
+    return np.maximum.accumulate(np.where(observado, filas, -1), axis=0)
+
+
+class MatrizAlineada:
+    """Precios de varios activos sobre un mismo eje de fechas (fechas x activos, float64)
+
+    observado indica las celdas con dato propio del activo; el resto son NaN
+    o, después de rellenar, el último precio conocido.
+    """
+
+    def __init__(self, fechas, tickers, valores, observado):
+        self.fechas = np.asarray(fechas, dtype='datetime64[D]')
+        self.tickers = list(tickers)
+        self.valores = valores
+        self.observado = observado
+
+    def rellenar(self, limite=None):
+        """Arrastra el último precio conocido hasta limite filas (sin límite con None)
+
+        Devuelve una matriz nueva; observado no cambia, así que siempre se
+        puede distinguir un precio real de uno arrastrado.
+        """
+        if limite == 0:
+            return self
+        ultimo = _ultimo_observado(self.observado)
+        validos = ultimo >= 0
+        if limite is not None:
+            validos &= np.arange(len(self.fechas))[:, np.newaxis] - ultimo <= limite
+        columnas = np.broadcast_to(np.arange(len(self.tickers)), ultimo.shape)
+        valores = np.where(validos, self.valores[np.maximum(ultimo, 0), columnas], np.nan)
+        return MatrizAlineada(self.fechas, self.tickers, valores, self.observado)
+
+    def filas_completas(self):
+        """Filas con precio (propio o arrastrado) para todos los activos"""
+        return np.isfinite(self.valores).all(axis=1)
+
+    def rendimientos(self, logaritmicos=False, sesiones_propias=False):
+        """Rendimientos diarios alineados con las fechas (la primera fila es NaN)
+
+        Con sesiones_propias cada rendimiento va de la observación anterior del
+        activo a la actual y solo existe en los días en que el activo cotizó:
+        un feriado de una bolsa no produce un rendimiento de varios días
+        compartido con las demás.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if sesiones_propias:
+                anterior = np.full(self.observado.shape, -1)
+                anterior[1:] = _ultimo_observado(self.observado)[:-1]
+                columnas = np.broadcast_to(np.arange(len(self.tickers)), anterior.shape)
+                previos = np.where(anterior >= 0, self.valores[np.maximum(anterior, 0), columnas], np.nan)
+                actuales = np.where(self.observado, self.valores, np.nan)
+            else:
+                previos = np.vstack([np.full((1, len(self.tickers)), np.nan), self.valores[:-1]])
+                actuales = self.valores
+            if logaritmicos:
+                return np.log(actuales) - np.log(previos)
+            return actuales / previos - 1
+
+    def a_dataframe(self, valores=None):
+        """La matriz (o valores alineados con ella) como DataFrame indexado por fecha"""
+        return pd.DataFrame(
+            self.valores if valores is None else valores,
+            index=pd.DatetimeIndex(self.fechas, name='fecha'),
+            columns=self.tickers
+        )
+
+
+def _combinar_fechas(series):
+    """Unión ordenada de las fechas de todas las series (cada una ya viene ordenada)"""
+    fechas = np.empty(0, dtype='datetime64[D]')
+    for f, _ in series:
+        fechas = np.union1d(fechas, f)
+    return fechas
+
+
+def construir_matriz(tickers, desde=None, hasta=None, columna='cierre_ajustado', calendario=None):
+    """Matriz sin rellenar: se lee cada activo una vez y se ubica con un merge ordenado
+
+    Con calendario (p. ej. 'NYSE') las filas son las sesiones de esa bolsa y se
+    descartan las observaciones en otros días; sin él, la unión de las fechas
+    de todos los activos.
+    """
+    series = []
+    for ticker in tickers:
+        datos = leer_serie(INDICES.get(ticker, ticker), desde, hasta, [columna])[columna].dropna()
+        series.append((datos.index.to_numpy(dtype='datetime64[D]'), datos.to_numpy(dtype=np.float64)))
+
+    if calendario is not None:
+        from almacen.calendario import obtener_calendario
+        todas = np.concatenate([f for f, _ in series]) if series else np.empty(0, dtype='datetime64[D]')
+        inicio = np.datetime64(desde, 'D') if desde is not None else (todas.min() if len(todas) else None)
+        fin = np.datetime64(hasta, 'D') if hasta is not None else (todas.max() if len(todas) else None)
+        fechas = todas
+        if inicio is not None:
+            bolsa = obtener_calendario(calendario)
+            # Fuera del rango del calendario (p. ej. antes de 1970) las filas son las fechas observadas
+            fechas = np.concatenate([
+                np.unique(todas[todas < bolsa.inicio]),
+                bolsa.sesiones_entre(inicio, fin),
+                np.unique(todas[todas > bolsa.fin])
+            ])
+    else:
+        fechas = _combinar_fechas(series)
+
+    valores = np.full((len(fechas), len(series)), np.nan)
+    observado = np.zeros((len(fechas), len(series)), dtype=bool)
+    for columna_matriz, (f, v) in enumerate(series):
+        posiciones = np.searchsorted(fechas, f)
+        dentro = posiciones < len(fechas)
+        dentro[dentro] = fechas[posiciones[dentro]] == f[dentro]
+        valores[posiciones[dentro], columna_matriz] = v[dentro]
+        observado[posiciones[dentro], columna_matriz] = True
+    return MatrizAlineada(fechas, tickers, valores, observado)
+
+
+def _clave_cache(tickers, desde, hasta, columna, calendario):
+    """Clave de la consulta y clave de las versiones de sus series
+
+    Una escritura en el almacén cambia la segunda: la entrada anterior de la
+    misma consulta queda obsoleta y se borra al guardar la nueva.
+    """
+    consulta = f"{'|'.join(tickers)}|{desde}|{hasta}|{columna}|{calendario}"
+    versiones = '|'.join(str(version_serie(INDICES.get(t, t))) for t in tickers)
+    return hashlib.sha1(consulta.encode()).hexdigest()[:16], hashlib.sha1(versiones.encode()).hexdigest()[:16]
+
+
+def _guardar_cache(archivo, consulta, matriz, tamano_maximo=TAMANO_MAXIMO_CACHE):
+    """Guarda la matriz, borra las versiones anteriores de la consulta y aplica el límite de tamaño (LRU)"""
+    os.makedirs(RUTA_CACHE, exist_ok=True)
+    temporal = archivo + '.tmp.npz'
+    np.savez(temporal, fechas=matriz.fechas, valores=matriz.valores, observado=matriz.observado)
+    os.replace(temporal, archivo)
+    for anterior in glob.glob(os.path.join(RUTA_CACHE, f"matriz_{consulta}_*.npz")):
+        if anterior != archivo:
+            os.remove(anterior)
+    # Las lecturas actualizan la fecha de acceso (ver alinear): se borran las usadas hace más tiempo
+    entradas = sorted(glob.glob(os.path.join(RUTA_CACHE, "matriz_*.npz")), key=os.path.getmtime)
+    total = sum(os.path.getsize(e) for e in entradas)
+    for entrada in entradas:
+        if total <= tamano_maximo or entrada == archivo:
+            break
+        total -= os.path.getsize(entrada)
+        os.remove(entrada)
+
+
+def alinear(tickers, desde=None, hasta=None, columna='cierre_ajustado', limite_relleno=0, calendario=None, usar_cache=True):
+    """Matriz densa fechas x activos lista para cálculos con varios activos
+
+    Args:
+        tickers: activos del almacén (o 'spx'/'nasdaq')
+        desde, hasta: rango de fechas (ambos incluidos)
+        columna: columna del almacén ('cierre_ajustado' por defecto)
+        limite_relleno: filas que se arrastra el último precio (0 sin relleno, None sin límite)
+        calendario: bolsa cuyas sesiones forman las filas (unión de fechas si no se indica)
+        usar_cache: reutiliza la matriz sin rellenar guardada para las mismas series
+    """
+    tickers = list(tickers)
+    consulta, versiones = _clave_cache(tickers, desde, hasta, columna, calendario)
+    archivo = os.path.join(RUTA_CACHE, f"matriz_{consulta}_{versiones}.npz")
+    if usar_cache and os.path.exists(archivo):
+        with np.load(archivo) as guardado:
+            matriz = MatrizAlineada(guardado['fechas'], tickers, guardado['valores'], guardado['observado'])
+        os.utime(archivo)
+    else:
+        matriz = construir_matriz(tickers, desde, hasta, columna, calendario)
+        if usar_cache:
+            _guardar_cache(archivo, consulta, matriz)
+    return matriz.rellenar(limite_relleno)
+
+
+if __name__ == "__main__":
+    # python alineacion.py <ticker> [<ticker> ...] : resumen de la alineación
+    matriz = alinear(sys.argv[1:], limite_relleno=None)
+    observados = matriz.observado.sum(axis=0)
+    print(f"Fechas: {len(matriz.fechas)} | filas completas: {matriz.filas_completas().sum()}")
+    for ticker, n in zip(matriz.tickers, observados):
+        print(f"{ticker}: {n} observaciones, {len(matriz.fechas) - n} días sin cotizar")
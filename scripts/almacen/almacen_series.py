@@ -0,0 +1,256 @@
+import os
+import sys
+import csv
+import json
+import pandas as pd
+import pyarrow.parquet as pq
+
+# ==========================================================
+# Almacén local de series de tiempo (un Parquet por activo)
+# ==========================================================
+RAIZ_REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+RUTA_ALMACEN = os.getenv("ALMACEN_SERIES_DIR", os.path.join(RAIZ_REPO, 'data', 'almacen'))
+
+COLUMNAS = ['apertura', 'maximo', 'minimo', 'cierre', 'cierre_ajustado', 'volumen']
+
+# Filas por row group: ~1 año bursátil, permite leer rangos sin recorrer todo el archivo
+FILAS_POR_GRUPO = 256
+COMPRESION = 'zstd'
+
+# CSV históricos de nasdaq.com ya existentes en /data
+CSV_HISTORICOS = {
+    '^SPX': os.path.join(RAIZ_REPO, 'data', 'HistoricalData_spx.csv'),
+    '^NDX': os.path.join(RAIZ_REPO, 'data', 'HistoricalData_nasdaq.csv'),
+}
+
+# Nombres de índice usados por historyAnalysis.py
+INDICES = {
+    'spx': '^SPX',
+    'nasdaq': '^NDX',
+}
+
+
+def ruta_activo(ticker):
+    """Ruta del archivo Parquet de un activo"""
+    return os.path.join(RUTA_ALMACEN, f"{ticker.replace('^', '_')}.parquet")
+
+
+def listar_activos():
+    """Tickers con serie en el almacén"""
+    if not os.path.exists(RUTA_ALMACEN):
+        return []
+    return sorted(
+        f[:-len('.parquet')].replace('_', '^', 1) if f.startswith('_') else f[:-len('.parquet')]
+        for f in os.listdir(RUTA_ALMACEN)
+        if f.endswith('.parquet') and not f.endswith('.eventos.parquet')
+    )
+
+
+def existe_serie(ticker):
+    return os.path.exists(ruta_activo(ticker))
+
+
+def version_serie(ticker):
+    """Identificador de la versión de los datos de un activo (cambia con cada escritura)"""
+    if not existe_serie(ticker):
+        return None
+    estado = os.stat(ruta_activo(ticker))
+    return f"{estado.st_mtime_ns:x}-{estado.st_size:x}"
+
+
+def rango_serie(ticker):
+    """Primera y última fecha almacenadas, leídas de las estadísticas del Parquet"""
+    if not existe_serie(ticker):
+        return None, None
+    metadatos = pq.ParquetFile(ruta_activo(ticker)).metadata
+    if metadatos.num_rows == 0:
+        return None, None
+    columna = metadatos.schema.names.index('fecha')
+    primera = metadatos.row_group(0).column(columna).statistics.min
+    ultima = metadatos.row_group(metadatos.num_row_groups - 1).column(columna).statistics.max
+    return pd.Timestamp(primera), pd.Timestamp(ultima)
+
+
+def leer_serie(ticker, desde=None, hasta=None, columnas=None):
+    """Lee un rango de fechas de un activo; solo se descomprimen los row groups necesarios"""
+    if not existe_serie(ticker):
+        return pd.DataFrame(columns=COLUMNAS, index=pd.DatetimeIndex([], name='fecha'))
+
+    filtros = []
+    if desde is not None:
+        filtros.append(('fecha', '>=', pd.Timestamp(desde)))
+    if hasta is not None:
+        filtros.append(('fecha', '<=', pd.Timestamp(hasta)))
+
+    df = pd.read_parquet(
+        ruta_activo(ticker),
+        columns=['fecha'] + (columnas or COLUMNAS),
+        filters=filtros or None
+    )
+    return df.set_index('fecha')
+
+
+def leer_cierres(ticker, desde=None, hasta=None, columna='cierre'):
+    """Fechas (datetime64[D]) y cierres (float64) como arreglos de NumPy"""
+    df = leer_serie(ticker, desde, hasta, [columna]).dropna()
+    return df.index.to_numpy(dtype='datetime64[D]'), df[columna].to_numpy(dtype='float64')
+
+
+def guardar_serie(ticker, datos):
+    """Inserta o actualiza filas (por fecha) en el archivo del activo"""
+    nuevos = datos.copy()
+    indice = pd.to_datetime(nuevos.index)
+    if indice.tz is not None:
+        indice = indice.tz_localize(None)
+    nuevos.index = indice.normalize()
+    nuevos.index.name = 'fecha'
+    nuevos = nuevos.reindex(columns=COLUMNAS)
+
+    if existe_serie(ticker):
+        actuales = leer_serie(ticker)
+        # Los datos nuevos reemplazan a los existentes en fechas repetidas
+        nuevos = pd.concat([actuales[~actuales.index.isin(nuevos.index)], nuevos])
+
+    nuevos = nuevos[~nuevos.index.duplicated(keep='last')].sort_index()
+    nuevos = nuevos.astype({c: 'float64' for c in COLUMNAS if c != 'volumen'})
+    nuevos['volumen'] = pd.to_numeric(nuevos['volumen'], errors='coerce').astype('Int64')
+
+    os.makedirs(RUTA_ALMACEN, exist_ok=True)
+    destino = ruta_activo(ticker)
+    temporal = destino + '.tmp'
+    nuevos.reset_index().to_parquet(
+        temporal,
+        index=False,
+        compression=COMPRESION,
+        row_group_size=FILAS_POR_GRUPO
+    )
+    os.replace(temporal, destino)
+    return len(nuevos)
+
+
+def ruta_eventos(ticker):
+    """Ruta del archivo Parquet de dividendos y splits de un activo"""
+    return os.path.join(RUTA_ALMACEN, f"{ticker.replace('^', '_')}.eventos.parquet")
+
+
+def leer_eventos(ticker):
+    """Dividendos y splits de un activo ordenados por fecha (columnas fecha, tipo, evento y factor)"""
+    if not os.path.exists(ruta_eventos(ticker)):
+        return pd.DataFrame({
+            'fecha': pd.Series(dtype='datetime64[ns]'),
+            'tipo': pd.Series(dtype='object'),
+            'evento': pd.Series(dtype='float64'),
+            'factor': pd.Series(dtype='float64')
+        })
+    return pd.read_parquet(ruta_eventos(ticker))
+
+
+def guardar_eventos(ticker, eventos):
+    """Inserta o actualiza eventos (por fecha y tipo) del activo
+
+    eventos tiene columnas fecha, tipo ('dividendo' o 'split'), evento y,
+    opcionalmente, factor (el factor de ajuste ya calculado).
+    """
+    nuevos = eventos.reset_index(drop=True)
+    nuevos['fecha'] = pd.to_datetime(nuevos['fecha']).dt.normalize()
+    nuevos['tipo'] = nuevos['tipo'].str.lower()
+    if 'factor' not in nuevos.columns:
+        nuevos['factor'] = float('nan')
+    actuales = leer_eventos(ticker)
+    if not actuales.empty:
+        # Un evento repetido con el mismo valor conserva su factor; uno corregido lo pierde
+        previos = nuevos[['fecha', 'tipo']].merge(actuales, on=['fecha', 'tipo'], how='left')
+        mismo = (previos['evento'].to_numpy() == nuevos['evento'].to_numpy()) & nuevos['factor'].isna().to_numpy()
+        nuevos.loc[mismo, 'factor'] = previos['factor'].to_numpy()[mismo]
+        nuevos = pd.concat([actuales, nuevos], ignore_index=True)
+        nuevos = nuevos.drop_duplicates(subset=['fecha', 'tipo'], keep='last')
+    nuevos = nuevos[['fecha', 'tipo', 'evento', 'factor']].astype({'evento': 'float64', 'factor': 'float64'})
+    nuevos = nuevos.sort_values(['fecha', 'tipo'], ignore_index=True)
+
+    os.makedirs(RUTA_ALMACEN, exist_ok=True)
+    destino = ruta_eventos(ticker)
+    temporal = destino + '.tmp'
+    nuevos.to_parquet(temporal, index=False, compression=COMPRESION)
+    os.replace(temporal, destino)
+    return len(nuevos)
+
+
+def desde_yfinance(datos):
+    """Normaliza un DataFrame de yfinance (simple o MultiIndex por ticker) al esquema del almacén"""
+    if isinstance(datos.columns, pd.MultiIndex):
+        # group_by='ticker' deja el nombre del campo en el segundo nivel
+        nivel = 1 if 'Close' in datos.columns.get_level_values(1) else 0
+        datos = datos.droplevel(1 - nivel, axis=1)
+    return pd.DataFrame({
+        'apertura': datos.get('Open'),
+        'maximo': datos.get('High'),
+        'minimo': datos.get('Low'),
+        'cierre': datos.get('Close'),
+        'cierre_ajustado': datos.get('Adj Close', datos.get('Close')),
+        'volumen': datos.get('Volume'),
+    }, index=datos.index)
+
+
+def desde_csv_nasdaq(archivo):
+    """Convierte un CSV HistoricalData_*.csv (formato nasdaq.com) al esquema del almacén"""
+    filas = []
+    with open(archivo, 'r') as f:
+        for fila in csv.reader(f):
+            # Las filas antiguas traen Volume ('--'); las agregadas por history_index.py no
+            if len(fila) == 6:
+                fila = fila[:2] + fila[3:]
+            if len(fila) == 5:
+                filas.append(fila)
+    df = pd.DataFrame(filas, columns=['Date', 'Close', 'Open', 'High', 'Low'])
+    datos = pd.DataFrame({
+        'apertura': pd.to_numeric(df['Open'], errors='coerce'),
+        'maximo': pd.to_numeric(df['High'], errors='coerce'),
+        'minimo': pd.to_numeric(df['Low'], errors='coerce'),
+        'cierre': pd.to_numeric(df['Close'], errors='coerce'),
+    })
+    datos['cierre_ajustado'] = datos['cierre']
+    datos.index = pd.to_datetime(df['Date'], format='%m/%d/%Y', errors='coerce')
+    return datos[datos.index.notna() & datos['cierre'].notna()]
+
+
+def importar_csv_historicos():
+    """Carga al almacén los CSV de /data (S&P 500 y Nasdaq-100)"""
+    for ticker, archivo in CSV_HISTORICOS.items():
+        if os.path.exists(archivo):
+            total = guardar_serie(ticker, desde_csv_nasdaq(archivo))
+            print(f"✅ {ticker}: {total} registros en {ruta_activo(ticker)}")
+
+
+def importar_datos_completos(carpeta_datos, activos):
+    """Carga al almacén el Datos_Completos más reciente de cada activo"""
+    for activo in activos:
+        carpeta = os.path.join(carpeta_datos, activo['nombre'], 'datos_completos')
+        if not os.path.exists(carpeta):
+            continue
+        archivos = [os.path.join(carpeta, f) for f in os.listdir(carpeta)
+                    if f.startswith('Datos_Completos') and f.endswith(('.csv', '.fac'))]
+        if not archivos:
+            continue
+        reciente = max(archivos, key=os.path.getmtime)
+        if reciente.endswith('.fac'):
+            # Las versiones compactas ya tienen el esquema del almacén
+            from almacen.archivo_compacto import leer_archivo
+            total = guardar_serie(activo['ticker'], leer_archivo(reciente))
+            print(f"✅ {activo['nombre']}: {total} registros")
+            continue
+        df = pd.read_csv(reciente)
+        fecha_col = next(c for c in df.columns if 'date' in c.lower() or 'fecha' in c.lower())
+        df = df.set_index(pd.to_datetime(df.pop(fecha_col), errors='coerce'))
+        # guardar_datos_completos aplana el MultiIndex como <ticker>_<campo>
+        df.columns = [c.split('_', 1)[1] if c.startswith(activo['ticker'] + '_') else c for c in df.columns]
+        df.columns = [c.replace('_', ' ') for c in df.columns]
+        total = guardar_serie(activo['ticker'], desde_yfinance(df[df.index.notna()]))
+        print(f"✅ {activo['nombre']}: {total} registros")
+
+
+if __name__ == "__main__":
+    importar_csv_historicos()
+    if len(sys.argv) > 1:
+        # python almacen_series.py <carpeta datos> : importa también las descargas de dividendos.py
+        with open(os.path.join(RAIZ_REPO, 'stock_symbols.json'), 'r') as f:
+            importar_datos_completos(sys.argv[1], json.load(f))
@@ -0,0 +1,220 @@
+import os
+import sys
+import struct
+import numpy as np
+import pandas as pd
+
+# Añadir la ruta del almacén local manualmente
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from almacen.almacen_series import RAIZ_REPO, COLUMNAS, INDICES, leer_serie, desde_csv_nasdaq
+
+# ==========================================================
+# Archivo compacto de históricos (enteros delta + varint)
+# ==========================================================
+# Formato (little-endian):
+#   'FACP', versión (u1), filas (u4), columnas (u1)
+#   por columna: largo del nombre (u1), nombre, decimales (i1), con_mascara (u1), bytes (u4)
+#   por columna: [máscara de presentes (packbits)] + enteros delta, zigzag y varint
+# Las fechas son días desde 1970-01-01; los precios se guardan como enteros
+# escalados por 10^decimales (los decimales mínimos que representan la serie).
+MAGICO = b'FACP'
+VERSION = 1
+DECIMALES_MAXIMOS = 6
+EXTENSION = '.fac'
+
+RUTA_ARCHIVOS = os.getenv("ARCHIVO_COMPACTO_DIR", os.path.join(RAIZ_REPO, 'data', 'archivo'))
+
+
+def zigzag(enteros):
+    """Enteros con signo a sin signo: 0, -1, 1, -2, ... -> 0, 1, 2, 3, ..."""
+    enteros = np.asarray(enteros, dtype=np.int64)
+    return ((enteros << 1) ^ (enteros >> 63)).astype(np.uint64)
+
+
+def deszigzag(valores):
+    valores = np.asarray(valores, dtype=np.uint64)
+    return ((valores >> np.uint64(1)).astype(np.int64)) ^ -((valores & np.uint64(1)).astype(np.int64))
+
+
+def codificar_varint(valores):
+    """Varint LEB128 de un arreglo de enteros sin signo, 7 bits por byte (vectorizado)
+
+    Cada valor ocupa tantos bytes como grupos de 7 bits necesita; el bit alto
+    indica que sigue otro byte. Se escribe un byte por valor y por vuelta, a lo
+    sumo 10 vueltas.
+    """
+    valores = np.asarray(valores, dtype=np.uint64)
+    if len(valores) == 0:
+        return b''
+    bits = np.zeros(len(valores), dtype=np.int64)
+    restantes = valores.copy()
+    while restantes.any():
+        bits += restantes > 0
+        restantes >>= np.uint64(7)
+    largos = np.maximum(bits, 1)
+    inicios = np.cumsum(largos) - largos
+    salida = np.empty(int(largos.sum()), dtype=np.uint8)
+    for k in range(int(largos.max())):
+        activos = largos > k
+        byte = (valores[activos] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        continua = (largos[activos] > k + 1).astype(np.uint64) << np.uint64(7)
+        salida[inicios[activos] + k] = (byte | continua).astype(np.uint8)
+    return salida.tobytes()
+
+
+def decodificar_varint(datos):
+    """Inverso de codificar_varint: bytes -> arreglo de enteros sin signo (vectorizado)"""
+    b = np.frombuffer(datos, dtype=np.uint8)
+    if len(b) == 0:
+        return np.empty(0, dtype=np.uint64)
+    ultimos = b < 0x80
+    # Posición de cada byte dentro de su valor
+    valor = np.r_[0, np.cumsum(ultimos)[:-1]]
+    inicios = np.flatnonzero(np.r_[True, ultimos[:-1]])
+    posicion = np.arange(len(b)) - inicios[valor]
+    partes = (b & 0x7f).astype(np.uint64) << (7 * posicion).astype(np.uint64)
+    return np.bitwise_or.reduceat(partes, inicios)
+
+
+def _decimales(valores, maximo=DECIMALES_MAXIMOS):
+    """Menor número de decimales que representa exactamente los valores (hasta maximo)
+
+    Exacto quiere decir que el entero escalado, al decodificarse con la misma
+    división, devuelve el mismo float; si ninguno lo logra se usa maximo.
+    """
+    for d in range(maximo + 1):
+        if np.array_equal(np.rint(valores * 10.0 ** d) / 10.0 ** d, valores):
+            return d
+    return maximo
+
+
+def _codificar_columna(nombre, valores, decimales=None):
+    valores = np.asarray(valores, dtype=np.float64)
+    presentes = np.isfinite(valores)
+    finitos = valores[presentes]
+    if decimales is None:
+        decimales = _decimales(finitos)
+    enteros = np.rint(finitos * 10.0 ** decimales).astype(np.int64)
+    # Delta: cada valor se guarda como la diferencia con el anterior
+    cuerpo = codificar_varint(zigzag(np.diff(enteros, prepend=0)))
+    con_mascara = not presentes.all()
+    if con_mascara:
+        cuerpo = np.packbits(presentes).tobytes() + cuerpo
+    nombre = nombre.encode('utf-8')
+    cabecera = struct.pack('<B', len(nombre)) + nombre + struct.pack('<bBI', decimales, con_mascara, len(cuerpo))
+    return cabecera, cuerpo
+
+
+def codificar(fechas, columnas):
+    """Bytes del archivo compacto
+
+    Args:
+        fechas: fechas de las filas (convertibles a datetime64[D])
+        columnas: dict {nombre: arreglo numérico alineado con fechas}, NaN si falta
+    """
+    dias = np.asarray(fechas, dtype='datetime64[D]').astype(np.int64)
+    partes = [_codificar_columna('fecha', dias, 0)]
+    partes += [_codificar_columna(nombre, valores) for nombre, valores in columnas.items()]
+    cabecera = MAGICO + struct.pack('<BIB', VERSION, len(dias), len(partes))
+    return b''.join([cabecera] + [c for c, _ in partes] + [cuerpo for _, cuerpo in partes])
+
+
+def decodificar(datos):
+    """Fechas (datetime64[D]) y dict {nombre: arreglo float64} de unos bytes del archivo compacto"""
+    if datos[:4] != MAGICO:
+        raise ValueError("No es un archivo compacto de históricos")
+    version, filas, n_columnas = struct.unpack_from('<BIB', datos, 4)
+    if version != VERSION:
+        raise ValueError(f"Versión de archivo compacto no soportada: {version}")
+    posicion = 4 + struct.calcsize('<BIB')
+    descriptores = []
+    for _ in range(n_columnas):
+        largo = datos[posicion]
+        nombre = datos[posicion + 1:posicion + 1 + largo].decode('utf-8')
+        posicion += 1 + largo
+        decimales, con_mascara, tamano = struct.unpack_from('<bBI', datos, posicion)
+        posicion += struct.calcsize('<bBI')
+        descriptores.append((nombre, decimales, con_mascara, tamano))
+
+    columnas = {}
+    for nombre, decimales, con_mascara, tamano in descriptores:
+        cuerpo = datos[posicion:posicion + tamano]
+        posicion += tamano
+        presentes = None
+        if con_mascara:
+            bytes_mascara = (filas + 7) // 8
+            presentes = np.unpackbits(np.frombuffer(cuerpo[:bytes_mascara], dtype=np.uint8), count=filas).astype(bool)
+            cuerpo = cuerpo[bytes_mascara:]
+        enteros = np.cumsum(deszigzag(decodificar_varint(cuerpo)))
+        if nombre == 'fecha':
+            fechas = enteros.astype('datetime64[D]')
+            continue
+        valores = enteros / 10.0 ** decimales
+        if presentes is not None:
+            completos = np.full(filas, np.nan)
+            completos[presentes] = valores
+            valores = completos
+        columnas[nombre] = valores
+    return fechas, columnas
+
+
+def guardar_archivo(ruta, datos):
+    """Guarda un DataFrame indexado por fecha (columnas numéricas) en formato compacto"""
+    columnas = {c: pd.to_numeric(datos[c], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+                for c in datos.columns}
+    indice = pd.DatetimeIndex(datos.index)
+    if indice.tz is not None:
+        indice = indice.tz_localize(None)
+    contenido = codificar(indice.to_numpy(dtype='datetime64[D]'), columnas)
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+    return len(contenido)
+
+
+def leer_arreglos(ruta):
+    """Fechas y columnas de un archivo compacto como arreglos de NumPy"""
+    with open(ruta, 'rb') as f:
+        return decodificar(f.read())
+
+
+def leer_archivo(ruta):
+    """Un archivo compacto como DataFrame indexado por fecha"""
+    fechas, columnas = leer_arreglos(ruta)
+    datos = pd.DataFrame(columnas, index=pd.DatetimeIndex(fechas, name='fecha'))
+    if 'volumen' in datos.columns:
+        datos['volumen'] = datos['volumen'].round().astype('Int64')
+    return datos
+
+
+def archivar_serie(ticker, carpeta=RUTA_ARCHIVOS, fecha=None):
+    """Guarda una versión del activo del almacén local: <carpeta>/<ticker>_<AAAAMMDD>.fac"""
+    ticker = INDICES.get(ticker, ticker)
+    fecha = fecha or pd.Timestamp.today().strftime('%Y%m%d')
+    datos = leer_serie(ticker, columnas=COLUMNAS).dropna(axis=1, how='all')
+    ruta = os.path.join(carpeta, f"{ticker.replace('^', '_')}_{fecha}{EXTENSION}")
+    guardar_archivo(ruta, datos)
+    return ruta
+
+
+def convertir_csv_nasdaq(archivo, destino=None):
+    """Convierte un CSV HistoricalData_*.csv (formato nasdaq.com) a formato compacto"""
+    destino = destino or os.path.splitext(archivo)[0] + EXTENSION
+    guardar_archivo(destino, desde_csv_nasdaq(archivo).sort_index().drop(columns=['cierre_ajustado']))
+    return destino
+
+
+if __name__ == "__main__":
+    # python archivo_compacto.py <ticker|archivo.csv> [...] : guarda versiones compactas y compara tamaños
+    for argumento in sys.argv[1:]:
+        if argumento.endswith('.csv'):
+            ruta = convertir_csv_nasdaq(argumento)
+            original = os.path.getsize(argumento)
+        else:
+            ruta = archivar_serie(argumento)
+            original = None
+        tamano = os.path.getsize(ruta)
+        detalle = f" ({original / tamano:.1f}x menor que el CSV)" if original else ""
+        print(f"{ruta}: {tamano} bytes{detalle}")
@@ -0,0 +1,321 @@
+import os
+import sys
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+import numpy as np
+import pytz
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# ==============================================================
+# Calendarios bursátiles precalculados y detección de sesiones faltantes
+# ==============================================================
+ANIO_INICIO = 1970
+ANIO_FIN = 2100
+
+# Bolsa de cada índice; las acciones de stock_symbols.json cotizan en EE.UU.
+BOLSA_TICKER = {
+    '^SPX': 'NYSE', '^NDX': 'NYSE', '^DJI': 'NYSE', '^VIX': 'NYSE',
+    '^FTSE': 'LSE',
+    '^GDAXI': 'XETRA',
+    '^FCHI': 'EURONEXT',
+    '^N225': 'JPX',
+    # Sin reglas de feriados todavía: solo lunes a viernes
+    '^MXX': 'LUNES_A_VIERNES', '^HSI': 'LUNES_A_VIERNES', '^BSESN': 'LUNES_A_VIERNES',
+}
+
+# Zona horaria y hora local de cierre de cada bolsa
+HORARIOS_CIERRE = {
+    'NYSE': ('America/New_York', time(16, 0)),
+    'LSE': ('Europe/London', time(16, 30)),
+    'XETRA': ('Europe/Berlin', time(17, 30)),
+    'EURONEXT': ('Europe/Paris', time(17, 30)),
+    'JPX': ('Asia/Tokyo', time(15, 30)),
+    'LUNES_A_VIERNES': ('UTC', time(23, 59)),
+}
+
+# Cierres extraordinarios que no siguen ninguna regla
+CIERRES_ESPECIALES = {
+    'NYSE': [
+        '1985-09-27', '1994-04-27', '2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14',
+        '2004-06-11', '2007-01-02', '2012-10-29', '2012-10-30', '2018-12-05', '2025-01-09',
+    ],
+    'LSE': ['1999-12-31', '2011-04-29', '2012-06-05', '2022-06-03', '2022-09-19', '2023-05-08'],
+}
+
+
+def _pascua(anio):
+    """Domingo de Pascua (algoritmo anónimo gregoriano)"""
+    a, b, c = anio % 19, anio // 100, anio % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes = (h + l - 7 * m + 114) // 31
+    dia = (h + l - 7 * m + 114) % 31 + 1
+    return date(anio, mes, dia)
+
+
+def _enesimo_dia(anio, mes, dia_semana, n):
+    """n-ésimo dia_semana (0 = lunes) del mes; n = -1 es el último"""
+    if n > 0:
+        primero = date(anio, mes, 1)
+        return primero + timedelta(days=(dia_semana - primero.weekday()) % 7 + 7 * (n - 1))
+    ultimo = date(anio + mes // 12, mes % 12 + 1, 1) - timedelta(days=1)
+    return ultimo - timedelta(days=(ultimo.weekday() - dia_semana) % 7)
+
+
+def _observado(dia):
+    """Regla de EE.UU.: sábado se observa el viernes, domingo el lunes"""
+    if dia.weekday() == 5:
+        return dia - timedelta(days=1)
+    if dia.weekday() == 6:
+        return dia + timedelta(days=1)
+    return dia
+
+
+def _feriados_nyse(anio):
+    pascua = _pascua(anio)
+    feriados = [
+        _enesimo_dia(anio, 9, 0, 1),     # Labor Day
+        _enesimo_dia(anio, 11, 3, 4),    # Thanksgiving
+        pascua - timedelta(days=2),      # Good Friday
+        _observado(date(anio, 7, 4)),
+        _observado(date(anio, 12, 25)),
+    ]
+    # Año nuevo en sábado no se recorre al viernes anterior
+    if date(anio, 1, 1).weekday() != 5:
+        feriados.append(_observado(date(anio, 1, 1)))
+    feriados.append(_enesimo_dia(anio, 2, 0, 3) if anio >= 1971 else _observado(date(anio, 2, 22)))
+    feriados.append(_enesimo_dia(anio, 5, 0, -1) if anio >= 1971 else _observado(date(anio, 5, 30)))
+    if anio >= 1998:
+        feriados.append(_enesimo_dia(anio, 1, 0, 3))   # Martin Luther King Jr. Day
+    if anio >= 2022:
+        feriados.append(_observado(date(anio, 6, 19)))  # Juneteenth
+    return feriados
+
+
+def _feriados_lse(anio):
+    pascua = _pascua(anio)
+    feriados = [pascua - timedelta(days=2), pascua + timedelta(days=1)]
+    # Año nuevo, Navidad y Boxing Day en fin de semana pasan a los siguientes días hábiles
+    anio_nuevo = date(anio, 1, 1)
+    feriados.append(anio_nuevo + timedelta(days={5: 2, 6: 1}.get(anio_nuevo.weekday(), 0)))
+    navidad = date(anio, 12, 25)
+    feriados += {
+        4: [navidad, navidad + timedelta(days=3)],
+        5: [navidad + timedelta(days=2), navidad + timedelta(days=3)],
+        6: [navidad + timedelta(days=1), navidad + timedelta(days=2)],
+    }.get(navidad.weekday(), [navidad, navidad + timedelta(days=1)])
+    # Bancarios de mayo y agosto, con los cambios por jubileos
+    feriados.append({1995: date(1995, 5, 8), 2020: date(2020, 5, 8)}.get(anio, _enesimo_dia(anio, 5, 0, 1)))
+    feriados.append({2002: date(2002, 6, 4), 2012: date(2012, 6, 4), 2022: date(2022, 6, 2)}.get(anio, _enesimo_dia(anio, 5, 0, -1)))
+    feriados.append(_enesimo_dia(anio, 8, 0, -1))
+    return feriados
+
+
+def _feriados_xetra(anio):
+    pascua = _pascua(anio)
+    return [date(anio, 1, 1), pascua - timedelta(days=2), pascua + timedelta(days=1), date(anio, 5, 1),
+            date(anio, 12, 24), date(anio, 12, 25), date(anio, 12, 26), date(anio, 12, 31)]
+
+
+def _feriados_euronext(anio):
+    pascua = _pascua(anio)
+    return [date(anio, 1, 1), pascua - timedelta(days=2), pascua + timedelta(days=1), date(anio, 5, 1),
+            date(anio, 12, 25), date(anio, 12, 26)]
+
+
+def _feriados_jpx(anio):
+    desplazamiento = 0.242194 * (anio - 1980) - (anio - 1980) // 4
+    nacionales = {
+        date(anio, 2, 11), date(anio, 4, 29), date(anio, 5, 3), date(anio, 5, 4), date(anio, 5, 5),
+        date(anio, 11, 3), date(anio, 11, 23),
+        date(anio, 3, int(20.8431 + desplazamiento)),    # equinoccio de primavera
+        date(anio, 9, int(23.2488 + desplazamiento)),    # equinoccio de otoño
+        _enesimo_dia(anio, 1, 0, 2) if anio >= 2000 else date(anio, 1, 15),
+        _enesimo_dia(anio, 9, 0, 3) if anio >= 2003 else date(anio, 9, 15),
+    }
+    if anio >= 2020:
+        nacionales.add(date(anio, 2, 23))
+    elif anio >= 1989:
+        nacionales.add(date(anio, 12, 23))
+    # Día del mar, de la montaña y del deporte, movidos en 2020 y 2021 por los Juegos Olímpicos
+    especiales = {2020: [date(2020, 7, 23), date(2020, 7, 24), date(2020, 8, 10)],
+                  2021: [date(2021, 7, 22), date(2021, 7, 23), date(2021, 8, 9)]}
+    if anio in especiales:
+        nacionales.update(especiales[anio])
+    else:
+        if anio >= 2003:
+            nacionales.add(_enesimo_dia(anio, 7, 0, 3))
+        elif anio >= 1996:
+            nacionales.add(date(anio, 7, 20))
+        if anio >= 2016:
+            nacionales.add(date(anio, 8, 11))
+        nacionales.add(_enesimo_dia(anio, 10, 0, 2) if anio >= 2000 else date(anio, 10, 10))
+    # Feriado en domingo: se recorre al siguiente día que no sea feriado
+    for dia in sorted(nacionales):
+        if dia.weekday() == 6:
+            sustituto = dia + timedelta(days=1)
+            while sustituto in nacionales:
+                sustituto += timedelta(days=1)
+            nacionales.add(sustituto)
+    # Un día entre dos feriados también es feriado
+    for dia in sorted(nacionales):
+        if dia + timedelta(days=2) in nacionales and dia + timedelta(days=1) not in nacionales \
+                and (dia + timedelta(days=1)).weekday() < 5:
+            nacionales.add(dia + timedelta(days=1))
+    # La bolsa cierra además del 31 de diciembre al 3 de enero
+    return list(nacionales) + [date(anio, 1, 2), date(anio, 1, 3), date(anio, 12, 31), date(anio, 1, 1)]
+
+
+REGLAS = {
+    'NYSE': _feriados_nyse,
+    'LSE': _feriados_lse,
+    'XETRA': _feriados_xetra,
+    'EURONEXT': _feriados_euronext,
+    'JPX': _feriados_jpx,
+    'LUNES_A_VIERNES': lambda anio: [],
+}
+
+
+class CalendarioBursatil:
+    """Sesiones de una bolsa entre ANIO_INICIO y ANIO_FIN con búsquedas O(1)
+
+    Para cada día natural del rango se precalcula la posición de la última
+    sesión en o antes de ese día, así sesión anterior/siguiente y el conteo de
+    sesiones entre dos fechas son accesos directos a un arreglo. Las consultas
+    por rango se recortan al rango del calendario: las fechas anteriores a
+    ANIO_INICIO (p. ej. los históricos desde 1800) no se revisan.
+    """
+
+    def __init__(self, bolsa='NYSE', anio_inicio=ANIO_INICIO, anio_fin=ANIO_FIN):
+        if bolsa not in REGLAS:
+            raise ValueError(f"Bolsa desconocida: {bolsa}")
+        self.bolsa = bolsa
+        self.inicio = np.datetime64(f"{anio_inicio}-01-01", 'D')
+        self.fin = np.datetime64(f"{anio_fin}-12-31", 'D')
+        dias = np.arange(self.inicio, self.fin + 1)
+        feriados = [f for anio in range(anio_inicio, anio_fin + 1) for f in REGLAS[bolsa](anio)]
+        feriados = np.array(feriados + CIERRES_ESPECIALES.get(bolsa, []), dtype='datetime64[D]')
+        # 1970-01-01 fue jueves: (días + 3) % 7 da 0 = lunes
+        habiles = ((dias.astype(np.int64) + 3) % 7) < 5
+        self.es_sesion_dia = habiles & ~np.isin(dias, feriados)
+        self.sesiones = dias[self.es_sesion_dia]
+        # Posición (en sesiones) de la última sesión <= cada día; -1 antes de la primera
+        self._ultima = np.cumsum(self.es_sesion_dia) - 1
+
+    def _offset(self, fecha):
+        dia = np.datetime64(fecha, 'D')
+        if dia < self.inicio or dia > self.fin:
+            raise ValueError(f"{dia} fuera del calendario {self.inicio} - {self.fin}")
+        return int((dia - self.inicio).astype(np.int64))
+
+    def _recortar(self, desde, hasta):
+        """[desde, hasta] limitado al rango del calendario, o None si no se cruzan"""
+        desde = max(np.datetime64(desde, 'D'), self.inicio)
+        hasta = min(np.datetime64(hasta, 'D'), self.fin)
+        return (desde, hasta) if desde <= hasta else None
+
+    def es_sesion(self, fecha):
+        return bool(self.es_sesion_dia[self._offset(fecha)])
+
+    def sesion_anterior(self, fecha):
+        """Última sesión estrictamente anterior a fecha"""
+        offset = self._offset(fecha)
+        # En el primer día del calendario no hay sesión anterior (_ultima[-1] sería el último día)
+        if offset == 0:
+            return None
+        posicion = self._ultima[offset - 1]
+        return self.sesiones[posicion] if posicion >= 0 else None
+
+    def sesion_actual_o_anterior(self, fecha):
+        """fecha si es sesión; si no, la sesión anterior"""
+        posicion = self._ultima[self._offset(fecha)]
+        return self.sesiones[posicion] if posicion >= 0 else None
+
+    def sesion_siguiente(self, fecha):
+        """Primera sesión estrictamente posterior a fecha"""
+        posicion = self._ultima[self._offset(fecha)] + 1
+        return self.sesiones[posicion] if posicion < len(self.sesiones) else None
+
+    def sesiones_entre(self, desde, hasta):
+        """Sesiones en [desde, hasta] (solo la parte dentro del calendario)"""
+        rango = self._recortar(desde, hasta)
+        if rango is None:
+            return self.sesiones[:0]
+        desde, hasta = rango
+        primera = self._ultima[self._offset(desde) - 1] + 1 if np.datetime64(desde, 'D') > self.inicio else 0
+        ultima = self._ultima[self._offset(hasta)]
+        return self.sesiones[primera:ultima + 1]
+
+    def sesiones_faltantes(self, fechas, desde=None, hasta=None):
+        """Sesiones del calendario en [desde, hasta] que no aparecen en fechas (vectorizado)
+
+        Por defecto el rango va de la primera a la última fecha de la serie.
+        """
+        fechas = np.asarray(fechas, dtype='datetime64[D]')
+        if len(fechas) == 0 and (desde is None or hasta is None):
+            return np.empty(0, dtype='datetime64[D]')
+        desde = np.datetime64(desde, 'D') if desde is not None else fechas.min()
+        hasta = np.datetime64(hasta, 'D') if hasta is not None else fechas.max()
+        rango = self._recortar(desde, hasta)
+        if rango is None:
+            return np.empty(0, dtype='datetime64[D]')
+        desde, hasta = rango
+        esperadas = self.sesiones_entre(desde, hasta)
+        presentes = np.zeros(len(esperadas), dtype=bool)
+        dentro = fechas[(fechas >= desde) & (fechas <= hasta)]
+        dentro = dentro[self.es_sesion_dia[(dentro - self.inicio).astype(np.int64)]]
+        primera = self._ultima[self._offset(desde) - 1] + 1 if desde > self.inicio else 0
+        presentes[self._ultima[(dentro - self.inicio).astype(np.int64)] - primera] = True
+        return esperadas[~presentes]
+
+
+def proximo_cierre(bolsa='NYSE', despues_de=None):
+    """Fecha y hora (con zona horaria) del siguiente cierre de sesión posterior a despues_de"""
+    zona_nombre, hora_cierre = HORARIOS_CIERRE[bolsa]
+    zona = pytz.timezone(zona_nombre)
+    despues_de = despues_de or datetime.now(pytz.utc)
+    local = despues_de.astimezone(zona)
+    calendario = obtener_calendario(bolsa)
+    dia = calendario.sesion_actual_o_anterior(local.date())
+    if dia is None or dia != np.datetime64(local.date(), 'D') or local.time() >= hora_cierre:
+        dia = calendario.sesion_siguiente(local.date())
+    return zona.localize(datetime.combine(dia.astype(date), hora_cierre))
+
+
+@lru_cache(maxsize=None)
+def obtener_calendario(bolsa='NYSE'):
+    """Calendario compartido (se construye una vez por bolsa)"""
+    return CalendarioBursatil(bolsa)
+
+
+def calendario_ticker(ticker):
+    """Calendario de la bolsa donde cotiza un ticker"""
+    return obtener_calendario(BOLSA_TICKER.get(ticker, 'NYSE'))
+
+
+def huecos_almacen(tickers=None, desde=None, hasta=None):
+    """Sesiones faltantes de cada activo del almacén local
+
+    Devuelve {ticker: arreglo de fechas faltantes} solo para los activos con huecos.
+    """
+    from almacen.almacen_series import listar_activos, leer_serie
+    huecos = {}
+    for ticker in tickers or listar_activos():
+        fechas = leer_serie(ticker, columnas=['cierre']).index.to_numpy(dtype='datetime64[D]')
+        faltantes = calendario_ticker(ticker).sesiones_faltantes(fechas, desde, hasta)
+        if len(faltantes):
+            huecos[ticker] = faltantes
+    return huecos
+
+
+if __name__ == "__main__":
+    # python calendario.py [<ticker> ...] : lista las sesiones faltantes en el almacén
+    for ticker, faltantes in huecos_almacen(sys.argv[1:] or None).items():
+        print(f"⚠️ {ticker}: {len(faltantes)} sesiones faltantes")
+        print("   " + ", ".join(str(f) for f in faltantes[:20]) + (" ..." if len(faltantes) > 20 else ""))
@@ -82,4 +82,10 @@ FROM datos_historicos
 WHERE
     fecha BETWEEN '2024-01-01' AND '2024-12-31'
 GROUP BY
-    activo_nombre;
\ No newline at end of file
+    activo_nombre;
+
+-- Activos en caída de al menos 10%
+SELECT activo, fecha_maximo, valor_maximo, fecha, valor, caida
+FROM caida_actual
+WHERE umbral = 10 AND en_caida
+ORDER BY caida DESC;
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+# ===============================================================
+# Agregados OHLC semanales, mensuales y anuales (tablas *_agregados)
+# ===============================================================
+
+# Resolución -> unidad de date_trunc
+RESOLUCIONES = {
+    'semanal': 'week',
+    'mensual': 'month',
+    'anual': 'year'
+}
+
+# Solo se recalculan los periodos que contienen las fechas cargadas: el rango va
+# del inicio del periodo de la primera fecha al final del periodo de la última
+AGREGAR_HISTORICOS = """
+INSERT INTO datos_agregados (
+    activo_id, resolucion, periodo, fecha_inicio, fecha_fin,
+    apertura, maximo, minimo, cierre, cierre_ajustado, volumen, dias
+)
+SELECT activo_id, %(resolucion)s, date_trunc(%(unidad)s, fecha)::date AS periodo,
+       MIN(fecha), MAX(fecha),
+       (ARRAY_AGG(apertura ORDER BY fecha) FILTER (WHERE apertura IS NOT NULL))[1],
+       MAX(maximo), MIN(minimo),
+       (ARRAY_AGG(cierre ORDER BY fecha DESC) FILTER (WHERE cierre IS NOT NULL))[1],
+       (ARRAY_AGG(cierre_ajustado ORDER BY fecha DESC) FILTER (WHERE cierre_ajustado IS NOT NULL))[1],
+       SUM(volumen), COUNT(*)
+FROM datos_historicos
+WHERE activo_id = %(activo_id)s
+  AND fecha >= date_trunc(%(unidad)s, %(desde)s::date)
+  AND fecha < date_trunc(%(unidad)s, %(hasta)s::date) + ('1 ' || %(unidad)s)::interval
+GROUP BY activo_id, periodo
+ON CONFLICT (activo_id, resolucion, periodo) DO UPDATE SET
+    fecha_inicio = EXCLUDED.fecha_inicio,
+    fecha_fin = EXCLUDED.fecha_fin,
+    apertura = EXCLUDED.apertura,
+    maximo = EXCLUDED.maximo,
+    minimo = EXCLUDED.minimo,
+    cierre = EXCLUDED.cierre,
+    cierre_ajustado = EXCLUDED.cierre_ajustado,
+    volumen = EXCLUDED.volumen,
+    dias = EXCLUDED.dias
+"""
+
+AGREGAR_INDICE = """
+INSERT INTO indices_agregados (
+    indice, resolucion, periodo, fecha_inicio, fecha_fin,
+    open, high, low, close_last, dias
+)
+SELECT %(indice)s, %(resolucion)s, date_trunc(%(unidad)s, date)::date AS periodo,
+       MIN(date), MAX(date),
+       (ARRAY_AGG(open ORDER BY date) FILTER (WHERE open IS NOT NULL))[1],
+       MAX(high), MIN(low),
+       (ARRAY_AGG(close_last ORDER BY date DESC) FILTER (WHERE close_last IS NOT NULL))[1],
+       COUNT(*)
+FROM {tabla}
+WHERE date >= date_trunc(%(unidad)s, %(desde)s::date)
+  AND date < date_trunc(%(unidad)s, %(hasta)s::date) + ('1 ' || %(unidad)s)::interval
+GROUP BY periodo
+ON CONFLICT (indice, resolucion, periodo) DO UPDATE SET
+    fecha_inicio = EXCLUDED.fecha_inicio,
+    fecha_fin = EXCLUDED.fecha_fin,
+    open = EXCLUDED.open,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    close_last = EXCLUDED.close_last,
+    dias = EXCLUDED.dias
+"""
+
+
+def actualizar_agregados_activo(cur, activo_id, desde, hasta):
+    """Recalcula los periodos de un activo de datos_historicos que tocan [desde, hasta]
+
+    Se llama en la misma transacción que el upsert de los datos diarios.
+    """
+    for resolucion, unidad in RESOLUCIONES.items():
+        cur.execute(AGREGAR_HISTORICOS, {
+            'activo_id': activo_id,
+            'resolucion': resolucion,
+            'unidad': unidad,
+            'desde': desde,
+            'hasta': hasta
+        })
+
+
+def actualizar_agregados_indice(cur, tabla, desde, hasta):
+    """Recalcula los periodos de una tabla de índice (sp500, nasdaq) que tocan [desde, hasta]"""
+    if tabla not in ('sp500', 'nasdaq'):
+        raise ValueError(f"Tabla de índice desconocida: {tabla}")
+    for resolucion, unidad in RESOLUCIONES.items():
+        cur.execute(AGREGAR_INDICE.format(tabla=tabla), {
+            'indice': tabla,
+            'resolucion': resolucion,
+            'unidad': unidad,
+            'desde': desde,
+            'hasta': hasta
+        })
+
+
+def agregar_cierres(fechas, valores, resolucion):
+    """Cierre de cada periodo a partir de arreglos diarios ordenados
+
+    Devuelve la última fecha con dato de cada periodo y su valor, igual que la
+    columna fecha_fin/cierre de las tablas de agregados.
+    """
+    if resolucion not in RESOLUCIONES:
+        raise ValueError(f"Resolución desconocida: {resolucion}")
+    if len(fechas) == 0:
+        return fechas, valores
+    periodos = pd.DatetimeIndex(fechas).to_period({'semanal': 'W', 'mensual': 'M', 'anual': 'Y'}[resolucion])
+    codigos = periodos.asi8
+    # Último elemento de cada racha de periodos iguales
+    ultimos = np.flatnonzero(np.append(codigos[1:] != codigos[:-1], True))
+    return fechas[ultimos], valores[ultimos]
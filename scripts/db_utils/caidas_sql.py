@@ -0,0 +1,106 @@
+import pandas as pd
+
+# ===================================================================
+# Caídas desde máximos calculadas dentro de PostgreSQL (window functions)
+# ===================================================================
+
+# Origen de los precios: datos_historicos (todo el universo) o una tabla de índice
+ORIGENES = {
+    'datos_historicos': "SELECT activo_id, fecha, cierre::float8 AS cierre FROM datos_historicos WHERE cierre IS NOT NULL",
+    'sp500': "SELECT 0 AS activo_id, date AS fecha, close_last::float8 AS cierre FROM sp500 WHERE close_last IS NOT NULL",
+    'nasdaq': "SELECT 0 AS activo_id, date AS fecha, close_last::float8 AS cierre FROM nasdaq WHERE close_last IS NOT NULL",
+}
+
+# Cada nuevo máximo histórico abre un grupo; un grupo es una caída si en algún
+# momento cae al menos el umbral desde su máximo. El grupo termina (la caída se
+# recupera) cuando empieza el siguiente, es decir, cuando el cierre vuelve al
+# máximo (>=, igual que findDeclines).
+CONSULTA_CAIDAS = """
+WITH origen AS (
+    {origen}
+),
+base AS (
+    SELECT activo_id, fecha, cierre,
+           MAX(cierre) OVER (PARTITION BY activo_id ORDER BY fecha
+                             ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS maximo_previo
+    FROM origen
+),
+grupos AS (
+    SELECT activo_id, fecha, cierre,
+           SUM(CASE WHEN maximo_previo IS NULL OR cierre >= maximo_previo THEN 1 ELSE 0 END)
+               OVER (PARTITION BY activo_id ORDER BY fecha ROWS UNBOUNDED PRECEDING) AS grupo
+    FROM base
+),
+caidas AS (
+    SELECT activo_id, grupo, fecha, cierre,
+           FIRST_VALUE(fecha) OVER w AS fecha_maximo,
+           FIRST_VALUE(cierre) OVER w AS maximo,
+           1 - cierre / NULLIF(FIRST_VALUE(cierre) OVER w, 0) AS caida
+    FROM grupos
+    WINDOW w AS (PARTITION BY activo_id, grupo ORDER BY fecha)
+),
+resumen AS (
+    SELECT activo_id, grupo,
+           MIN(fecha_maximo) AS fecha_maximo,
+           MAX(maximo) AS maximo,
+           MIN(fecha) FILTER (WHERE caida >= %(umbral)s) AS fecha_caida,
+           (ARRAY_AGG(fecha ORDER BY cierre, fecha))[1] AS fecha_minimo,
+           MIN(cierre) AS minimo,
+           MAX(caida) AS caida_maxima,
+           MAX(fecha) AS fecha_ultima
+    FROM caidas
+    GROUP BY activo_id, grupo
+),
+limites AS (
+    SELECT r.*,
+           LEAD(fecha_maximo) OVER (PARTITION BY activo_id ORDER BY grupo) AS fecha_fin,
+           MAX(fecha_ultima) OVER (PARTITION BY activo_id) AS ultimo_dato
+    FROM resumen r
+)
+SELECT {ticker} AS ticker,
+       l.fecha_maximo, l.maximo, l.fecha_caida, l.fecha_minimo, l.minimo,
+       ROUND((100 * l.caida_maxima)::numeric, 2) AS caida_porcentaje,
+       l.fecha_fin,
+       -- Las caídas abiertas se miden hasta el último dato del activo, como findDeclines
+       (COALESCE(l.fecha_fin, l.ultimo_dato) - l.fecha_maximo) AS duracion_dias,
+       l.fecha_fin IS NULL AS en_curso
+FROM limites l
+{union_activos}
+WHERE l.fecha_caida IS NOT NULL
+ORDER BY 1, l.fecha_maximo
+"""
+
+
+def caidas_sql(conn, porcentaje, origen='datos_historicos', ticker=None):
+    """Ejecuta la detección de caídas en la base de datos y devuelve solo los eventos
+
+      porcentaje: caída mínima desde el máximo (en %)
+      origen: datos_historicos, sp500 o nasdaq
+      ticker: limita datos_historicos a un activo
+    """
+    if origen not in ORIGENES:
+        raise ValueError(f"Origen desconocido: {origen}")
+
+    parametros = {'umbral': porcentaje / 100.0}
+    sql_origen = ORIGENES[origen]
+    if origen == 'datos_historicos':
+        union_activos = "JOIN activos a ON a.id = l.activo_id"
+        columna_ticker = "a.ticker"
+        if ticker:
+            # Filtrar en el origen evita calcular ventanas sobre todo el universo
+            sql_origen += " AND activo_id = (SELECT id FROM activos WHERE ticker = %(ticker)s)"
+            parametros['ticker'] = ticker
+    else:
+        union_activos = ""
+        columna_ticker = f"'{origen}'"
+
+    sql = CONSULTA_CAIDAS.format(
+        origen=sql_origen,
+        ticker=columna_ticker,
+        union_activos=union_activos
+    )
+    with conn.cursor() as cur:
+        cur.execute(sql, parametros)
+        columnas = [d[0] for d in cur.description]
+        filas = cur.fetchall()
+    return pd.DataFrame(filas, columns=columnas)
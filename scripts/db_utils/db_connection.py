@@ -55,4 +55,30 @@ def obtener_conexion(tipo='neon', donde=''):
     if tipo == 'local':
         return conectar_local()
     else:
-        return conectar_neon(donde)
\ No newline at end of file
+        return conectar_neon(donde)
+
+
+class ConexionPersistente:
+    """Conexión que se mantiene abierta entre ejecuciones y se reabre si se cerró o se cayó"""
+
+    def __init__(self, tipo='neon', donde=''):
+        self.tipo = tipo
+        self.donde = donde
+        self.conn = None
+
+    def obtener(self):
+        if self.conn is not None and not self.conn.closed:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                self.conn.rollback()
+                return self.conn
+            except psycopg2.Error:
+                self.cerrar()
+        self.conn = obtener_conexion(self.tipo, self.donde)
+        return self.conn
+
+    def cerrar(self):
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.conn = None
@@ -0,0 +1,130 @@
+import itertools
+import numpy as np
+
+# ==============================================================
+# Lectura en streaming desde PostgreSQL con cursores server-side
+# ==============================================================
+TAMANO_LOTE = 50_000  # filas por viaje al servidor
+
+# Tablas de índices que actualiza history_index.py
+TABLAS_INDICES = {
+    'spx': 'sp500',
+    'nasdaq': 'nasdaq'
+}
+
+
+def _lotes(conn, sql, parametros=None, tamano_lote=TAMANO_LOTE, columnas=2):
+    """Ejecuta la consulta en un cursor con nombre y entrega cada lote como matriz float64
+
+    Las columnas se convierten a float8/int4 en el servidor, así cada lote se
+    copia directamente a NumPy y las tuplas de Python solo viven durante un lote.
+    """
+    with conn.cursor(name='lectura_streaming') as cur:
+        cur.itersize = tamano_lote
+        cur.execute(sql, parametros)
+        while True:
+            filas = cur.fetchmany(tamano_lote)
+            if not filas:
+                break
+            yield np.fromiter(
+                itertools.chain.from_iterable(filas),
+                dtype=np.float64,
+                count=len(filas) * columnas
+            ).reshape(-1, columnas)
+
+
+def _a_fechas(dias):
+    """Días desde 1970-01-01 a datetime64[D]"""
+    return dias.astype(np.int64).astype('datetime64[D]')
+
+
+def leer_indice(conn, tabla, tamano_lote=TAMANO_LOTE, resolucion=None):
+    """Fechas y cierres de una tabla de índice (nasdaq, sp500) en orden cronológico
+
+    Con resolucion (semanal, mensual, anual) se lee indices_agregados: un cierre
+    por periodo, fechado en el último día con dato del periodo.
+    """
+    if tabla not in TABLAS_INDICES.values():
+        raise ValueError(f"Tabla de índice desconocida: {tabla}")
+    parametros = None
+    if resolucion:
+        sql = """
+            SELECT (fecha_fin - DATE '1970-01-01')::int4, close_last::float8
+            FROM indices_agregados
+            WHERE indice = %s AND resolucion = %s AND close_last IS NOT NULL
+            ORDER BY periodo
+        """
+        parametros = (tabla, resolucion)
+    else:
+        sql = f"""
+            SELECT (date - DATE '1970-01-01')::int4, close_last::float8
+            FROM {tabla}
+            WHERE close_last IS NOT NULL
+            ORDER BY date
+        """
+    lotes = list(_lotes(conn, sql, parametros, tamano_lote))
+    datos = np.concatenate(lotes) if lotes else np.empty((0, 2))
+    return _a_fechas(datos[:, 0]), datos[:, 1]
+
+
+def leer_activo(conn, ticker, columna='cierre', tamano_lote=TAMANO_LOTE, resolucion=None):
+    """Fechas y valores de un activo de datos_historicos en orden cronológico
+
+    Con resolucion (semanal, mensual, anual) se lee datos_agregados en lugar de
+    los datos diarios.
+    """
+    if columna not in ('apertura', 'maximo', 'minimo', 'cierre', 'cierre_ajustado'):
+        raise ValueError(f"Columna no válida: {columna}")
+    if resolucion:
+        sql = f"""
+            SELECT (d.fecha_fin - DATE '1970-01-01')::int4, d.{columna}::float8
+            FROM datos_agregados d
+            JOIN activos a ON a.id = d.activo_id
+            WHERE a.ticker = %s AND d.resolucion = %s AND d.{columna} IS NOT NULL
+            ORDER BY d.periodo
+        """
+        parametros = (ticker, resolucion)
+    else:
+        sql = f"""
+            SELECT (d.fecha - DATE '1970-01-01')::int4, d.{columna}::float8
+            FROM datos_historicos d
+            JOIN activos a ON a.id = d.activo_id
+            WHERE a.ticker = %s AND d.{columna} IS NOT NULL
+            ORDER BY d.fecha
+        """
+        parametros = (ticker,)
+    lotes = list(_lotes(conn, sql, parametros, tamano_lote))
+    datos = np.concatenate(lotes) if lotes else np.empty((0, 2))
+    return _a_fechas(datos[:, 0]), datos[:, 1]
+
+
+def iterar_activos(conn, columna='cierre', tamano_lote=TAMANO_LOTE):
+    """Recorre toda la tabla datos_historicos entregando (ticker, fechas, valores) por activo
+
+    Solo se mantiene en memoria el activo en curso, sin importar el tamaño de la tabla.
+    """
+    if columna not in ('apertura', 'maximo', 'minimo', 'cierre', 'cierre_ajustado'):
+        raise ValueError(f"Columna no válida: {columna}")
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, ticker FROM activos")
+        tickers = dict(cur.fetchall())
+
+    sql = f"""
+        SELECT activo_id::int4, (fecha - DATE '1970-01-01')::int4, {columna}::float8
+        FROM datos_historicos
+        WHERE {columna} IS NOT NULL
+        ORDER BY activo_id, fecha
+    """
+    pendiente = []
+    for lote in _lotes(conn, sql, tamano_lote=tamano_lote, columnas=3):
+        # Posiciones donde cambia el activo dentro del lote
+        cortes = np.flatnonzero(np.diff(lote[:, 0])) + 1
+        for parte in np.split(lote, cortes):
+            if pendiente and pendiente[-1][0, 0] != parte[0, 0]:
+                datos = np.concatenate(pendiente)
+                yield tickers.get(int(datos[0, 0])), _a_fechas(datos[:, 1]), datos[:, 2]
+                pendiente = []
+            pendiente.append(parte)
+    if pendiente:
+        datos = np.concatenate(pendiente)
+        yield tickers.get(int(datos[0, 0])), _a_fechas(datos[:, 1]), datos[:, 2]
@@ -0,0 +1,115 @@
+from psycopg2 import extras
+
+# ===================================================================
+# Resultados del análisis de caídas guardados en la base de datos
+# ===================================================================
+# Las tablas (ver la sección de base de datos de scripts/README.MD) se llenan con
+# upserts por lotes y solo para los activos cuyos precios cambiaron desde la
+# última ejecución.
+
+GUARDAR_PERIODOS = """
+INSERT INTO resultados_caidas (
+    activo, umbral, fecha_maximo, valor_maximo, fecha_caida, valor_caida,
+    fecha_minimo, valor_minimo, fecha_fin, fecha_maximo2, valor_maximo2,
+    profundidad, duracion_caida, duracion_periodo, en_caida, actualizado
+)
+VALUES %s
+ON CONFLICT (activo, umbral, fecha_maximo) DO UPDATE SET
+    valor_maximo = EXCLUDED.valor_maximo,
+    fecha_caida = EXCLUDED.fecha_caida,
+    valor_caida = EXCLUDED.valor_caida,
+    fecha_minimo = EXCLUDED.fecha_minimo,
+    valor_minimo = EXCLUDED.valor_minimo,
+    fecha_fin = EXCLUDED.fecha_fin,
+    fecha_maximo2 = EXCLUDED.fecha_maximo2,
+    valor_maximo2 = EXCLUDED.valor_maximo2,
+    profundidad = EXCLUDED.profundidad,
+    duracion_caida = EXCLUDED.duracion_caida,
+    duracion_periodo = EXCLUDED.duracion_periodo,
+    en_caida = EXCLUDED.en_caida,
+    actualizado = EXCLUDED.actualizado
+"""
+
+GUARDAR_CAIDA_ACTUAL = """
+INSERT INTO caida_actual (
+    activo, umbral, fecha, valor, fecha_maximo, valor_maximo, caida,
+    en_caida, fecha_caida, actualizado
+)
+VALUES %s
+ON CONFLICT (activo, umbral) DO UPDATE SET
+    fecha = EXCLUDED.fecha,
+    valor = EXCLUDED.valor,
+    fecha_maximo = EXCLUDED.fecha_maximo,
+    valor_maximo = EXCLUDED.valor_maximo,
+    caida = EXCLUDED.caida,
+    en_caida = EXCLUDED.en_caida,
+    fecha_caida = EXCLUDED.fecha_caida,
+    actualizado = EXCLUDED.actualizado
+"""
+
+GUARDAR_VERSIONES = """
+INSERT INTO resultados_versiones (activo, version, actualizado)
+VALUES %s
+ON CONFLICT (activo) DO UPDATE SET
+    version = EXCLUDED.version,
+    actualizado = EXCLUDED.actualizado
+"""
+
+# now() es la hora de inicio de la transacción: las filas de los activos
+# recalculados que no se tocaron en esta transacción ya no existen (periodos
+# que desaparecieron al corregir precios o umbrales que se dejaron de usar)
+BORRAR_OBSOLETOS = """
+DELETE FROM resultados_caidas
+WHERE activo = ANY(%(activos)s) AND actualizado < now()
+"""
+
+BORRAR_CAIDAS_OBSOLETAS = """
+DELETE FROM caida_actual
+WHERE activo = ANY(%(activos)s) AND actualizado < now()
+"""
+
+# Versión de los datos de cada activo calculada en el servidor: cambia si se
+# agregan, quitan o corrigen filas, y solo viajan unas pocas filas por activo
+VERSIONES_HISTORICOS = """
+SELECT a.ticker,
+       COUNT(*)::text || '-' || MAX(d.fecha)::text || '-' || COALESCE(SUM(d.cierre), 0)::text
+FROM datos_historicos d
+JOIN activos a ON a.id = d.activo_id
+GROUP BY a.ticker
+"""
+
+TAMANO_PAGINA = 1000
+
+
+def _plantilla(columnas):
+    """Plantilla de execute_values con la columna actualizado = now()"""
+    return "(" + ", ".join(["%s"] * columnas) + ", now())"
+
+
+def versiones_historicos(cur):
+    """Versión actual de los precios de cada activo de datos_historicos"""
+    cur.execute(VERSIONES_HISTORICOS)
+    return dict(cur.fetchall())
+
+
+def leer_versiones(cur):
+    """Versión de los precios con la que se calcularon los resultados guardados"""
+    cur.execute("SELECT activo, version FROM resultados_versiones")
+    return dict(cur.fetchall())
+
+
+def guardar_resultados(cur, periodos, caidas_actuales, versiones):
+    """Reemplaza los resultados de los activos recalculados en la transacción en curso
+
+    Args:
+        periodos: filas de resultados_caidas (orden de GUARDAR_PERIODOS sin actualizado)
+        caidas_actuales: filas de caida_actual (orden de GUARDAR_CAIDA_ACTUAL sin actualizado)
+        versiones: dict {activo: versión de los precios usada}
+    """
+    if periodos:
+        extras.execute_values(cur, GUARDAR_PERIODOS, periodos, template=_plantilla(15), page_size=TAMANO_PAGINA)
+    if caidas_actuales:
+        extras.execute_values(cur, GUARDAR_CAIDA_ACTUAL, caidas_actuales, template=_plantilla(9), page_size=TAMANO_PAGINA)
+    cur.execute(BORRAR_OBSOLETOS, {'activos': list(versiones)})
+    cur.execute(BORRAR_CAIDAS_OBSOLETAS, {'activos': list(versiones)})
+    extras.execute_values(cur, GUARDAR_VERSIONES, list(versiones.items()), template=_plantilla(2), page_size=TAMANO_PAGINA)
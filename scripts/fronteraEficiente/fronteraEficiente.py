@@ -1,8 +1,17 @@
-import yfinance as yf
+import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import minimize
+from nube_portafolios import nube_portafolios
+
+# Añadir la ruta del almacén local manualmente
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from almacen.almacen_series import desde_yfinance, guardar_serie, rango_serie
+from almacen.alineacion import alinear
+from fuente_datos import cache_yfinance
+from graficos.reduccion import reducir_dispersion
 
 # ====================
 # Datos de los activos
@@ -13,18 +22,38 @@ end_date = '2025-07-01'
 
 N = len(tickers)
 
+# Número de portafolios aleatorios para la nube del Markowitz Bullet
+N_PORTAFOLIOS_ALEATORIOS = 1_000_000
+
+# Días que se arrastra el último precio de un activo cuyo mercado cerró
+LIMITE_RELLENO = 5
+
 # ==========================================================
 # Obtener Matriz de Covarianza y vector rendimiento esperado
 # ==========================================================
+def obtener_precios(tickers, start_date, end_date):
+    """Precios ajustados desde el almacén local; solo descarga activos faltantes o desactualizados"""
+    limite = min(pd.Timestamp(end_date), pd.Timestamp.today().normalize()) - pd.Timedelta(days=4)
+    faltantes = [t for t in tickers if rango_serie(t)[1] is None or rango_serie(t)[1] < limite]
+    if faltantes:
+        descarga = cache_yfinance.descargar(faltantes, start=start_date, end=end_date, auto_adjust=False, group_by='ticker')
+        for ticker in faltantes:
+            guardar_serie(ticker, desde_yfinance(descarga[ticker].dropna(how='all')))
+
+    # end_date es exclusivo, igual que en yf.download
+    hasta = pd.Timestamp(end_date) - pd.Timedelta(days=1)
+    return alinear(tickers, start_date, hasta, limite_relleno=LIMITE_RELLENO).a_dataframe()
+
 def obtener_datos_y_calculos(tickers, start_date, end_date):
-    datos = yf.download(tickers, start=start_date, end=end_date,auto_adjust=False)['Adj Close']
-    rendimientos = datos.pct_change().dropna()
+    datos = obtener_precios(tickers, start_date, end_date)
+    # Un feriado de un solo mercado ya no elimina el día: su precio se arrastra
+    # (rendimiento 0) y solo quedan fuera las filas sin precio para algún activo
+    rendimientos = datos.pct_change(fill_method=None).iloc[1:]
+    rendimientos = rendimientos[rendimientos.notna().all(axis=1)]
     matriz_covarianzas = rendimientos.cov()
     vector_rendimientos = rendimientos.mean()
     return matriz_covarianzas, vector_rendimientos
 
-Sigma, mu = obtener_datos_y_calculos(tickers, start_date, end_date)
-
 # ==========================
 # Datos para el problema QP
 # ========================== 
@@ -37,60 +66,85 @@ def restriccion_suma_pesos(w):
 def restriccion_rendimiento(w, mu, mu_0):
     return np.dot(w, mu) - mu_0
 
-w_init = np.ones(N) / N
-
-limites = [(0,1)] * N
-
-# ===================================
-# Encontramos dos portafolios óptimos
-# ===================================
-pesos_optimos = []
-for mu_0 in [min(mu),max(mu)]:
-    varianza = minimize(
-        objetivo,
-        w_init,
-        args=(Sigma,),
-        method='SLSQP',
-        bounds=limites,
-        constraints = (
-            {'type': 'eq', 'fun': restriccion_suma_pesos},
-            {'type': 'eq', 'fun': restriccion_rendimiento, 'args': (mu, mu_0)}
-            )
-    )
-    pesos_optimos.append(varianza.x)
-
 
-w_1 = pesos_optimos[0]
-w_2 = pesos_optimos[1]
-
-# ======================================================
-# Parametrización de la la Recta Eficiente en R^N (TMFT) 
-# ======================================================
-t = np.linspace(0, 1, 50) 
-W = t[:, np.newaxis] * w_1 + (1 - t[:, np.newaxis]) * w_2
-
-# Evaluaciones en el plano varianza-rendimiento
-
-Sigma = Sigma.to_numpy() 
-mu = mu.to_numpy()
-
-puntos = []
-for w in W:
-    puntos.append((objetivo(w, Sigma),np.dot(w,mu)))
-
-
-# ============================
-# Grafica del Markowitz Bullet
-# ============================
+def main():
+    Sigma, mu = obtener_datos_y_calculos(tickers, start_date, end_date)
+
+    w_init = np.ones(N) / N
+
+    limites = [(0,1)] * N
+
+    # ===================================
+    # Encontramos dos portafolios óptimos
+    # ===================================
+    pesos_optimos = []
+    for mu_0 in [min(mu),max(mu)]:
+        varianza = minimize(
+            objetivo,
+            w_init,
+            args=(Sigma,),
+            method='SLSQP',
+            bounds=limites,
+            constraints = (
+                {'type': 'eq', 'fun': restriccion_suma_pesos},
+                {'type': 'eq', 'fun': restriccion_rendimiento, 'args': (mu, mu_0)}
+                )
+        )
+        pesos_optimos.append(varianza.x)
+
+
+    w_1 = pesos_optimos[0]
+    w_2 = pesos_optimos[1]
+
+    # ======================================================
+    # Parametrización de la la Recta Eficiente en R^N (TMFT) 
+    # ======================================================
+    t = np.linspace(0, 1, 50) 
+    W = t[:, np.newaxis] * w_1 + (1 - t[:, np.newaxis]) * w_2
+
+    # Evaluaciones en el plano varianza-rendimiento
+
+    Sigma = Sigma.to_numpy() 
+    mu = mu.to_numpy()
+
+    # Forma cuadrática por filas en lugar de evaluar punto por punto
+    puntos = list(zip(np.einsum('ij,ij->i', W @ Sigma, W), W @ mu))
+
+    # ===================================
+    # Nube de portafolios aleatorios (MC)
+    # ===================================
+    nube = nube_portafolios(Sigma, mu, N_PORTAFOLIOS_ALEATORIOS)
+    print(f"Portafolios aleatorios evaluados: {nube['n_portafolios']}")
+    print(f"Varianza mínima encontrada: {nube['varianza_min']:.6f}")
+    print(f"Sharpe máximo encontrado: {nube['max_sharpe']:.4f}")
+
+    # ============================
+    # Grafica del Markowitz Bullet
+    # ============================
+
+    # Extraemos los rendimientos y riesgos de la frontera eficiente
+    target_volatilities, target_returns = zip(*puntos)
+
+    # Graficamos la nube y la frontera eficiente
+    plt.figure(figsize=(10,6))
+    # Un punto por celda del tamaño del marcador: la imagen es la misma con muchos menos puntos
+    visibles = reducir_dispersion(nube['muestra_varianzas'], nube['muestra_rendimientos'], 1000, 600)
+    varianzas = nube['muestra_varianzas'][visibles]
+    rendimientos = nube['muestra_rendimientos'][visibles]
+    plt.scatter(
+        varianzas,
+        rendimientos,
+        c=rendimientos / np.sqrt(varianzas),
+        cmap='viridis', s=2, alpha=0.5, label='Portafolios aleatorios'
+    )
+    plt.plot(target_volatilities, target_returns, label='Frontera Eficiente', color='green')
+    plt.title('Markowitz Bullet')
+    plt.xlabel('Varianza')
+    plt.ylabel('Rendimiento Esperado')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
 
-# Extraemos los rendimientos y riesgos de la frontera eficiente
-target_volatilities, target_returns = zip(*puntos)
 
-# Graficamos la frontera eficiente
-plt.figure(figsize=(10,6))
-plt.plot(target_volatilities, target_returns, label='Frontera Eficiente', color='green')
-plt.title('Markowitz Bullet')
-plt.xlabel('Varianza')
-plt.ylabel('Rendimiento Esperado')
-plt.grid(True)
-plt.show()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# =====================================================
+# Nube de portafolios aleatorios (Monte Carlo, long-only)
+# =====================================================
+TAMANO_BLOQUE = 100_000     # portafolios evaluados por bloque
+TAMANO_MUESTRA = 5_000      # puntos conservados para graficar
+
+
+def generar_bloques(Sigma, mu, n_portafolios, tamano_bloque=TAMANO_BLOQUE, semilla=None, alpha=None):
+    """Genera bloques de portafolios Dirichlet y devuelve (pesos, varianzas, rendimientos) por bloque"""
+    Sigma = np.asarray(Sigma, dtype=np.float64)
+    mu = np.asarray(mu, dtype=np.float64)
+    alpha = np.ones(len(mu)) if alpha is None else np.asarray(alpha, dtype=np.float64)
+    rng = np.random.default_rng(semilla)
+
+    restantes = n_portafolios
+    while restantes > 0:
+        n = min(tamano_bloque, restantes)
+        W = rng.dirichlet(alpha, size=n)
+        # Forma cuadrática por filas: w_i^T Sigma w_i
+        varianzas = np.einsum('ij,ij->i', W @ Sigma, W)
+        rendimientos = W @ mu
+        yield W, varianzas, rendimientos
+        restantes -= n
+
+
+def _resumir_bloque(W, varianzas, rendimientos, tamano_muestra, rng):
+    """Reduce un bloque a estadísticas parciales y una submuestra uniforme"""
+    sharpe = rendimientos / np.sqrt(varianzas)
+    i_min = int(np.argmin(varianzas))
+    i_sharpe = int(np.argmax(sharpe))
+    k = min(tamano_muestra, len(varianzas))
+    muestra = rng.choice(len(varianzas), size=k, replace=False)
+    return {
+        'n': len(varianzas),
+        'suma_var': float(varianzas.sum()),
+        'suma_var2': float(np.square(varianzas).sum()),
+        'suma_ren': float(rendimientos.sum()),
+        'suma_ren2': float(np.square(rendimientos).sum()),
+        'var_max': float(varianzas.max()),
+        'ren_min': float(rendimientos.min()),
+        'ren_max': float(rendimientos.max()),
+        'min_varianza': (float(varianzas[i_min]), float(rendimientos[i_min]), W[i_min].copy()),
+        'max_sharpe': (float(sharpe[i_sharpe]), float(varianzas[i_sharpe]), float(rendimientos[i_sharpe]), W[i_sharpe].copy()),
+        'muestra_var': varianzas[muestra],
+        'muestra_ren': rendimientos[muestra],
+    }
+
+
+def _evaluar_bloque(args):
+    """Tarea de un proceso: genera y resume un bloque completo"""
+    Sigma, mu, n, semilla, alpha, tamano_muestra = args
+    rng = np.random.default_rng(semilla)
+    W, varianzas, rendimientos = next(generar_bloques(Sigma, mu, n, n, rng, alpha))
+    return _resumir_bloque(W, varianzas, rendimientos, tamano_muestra, rng)
+
+
+def _combinar(resumenes):
+    """Combina los resúmenes parciales de todos los bloques"""
+    n = sum(r['n'] for r in resumenes)
+    media_var = sum(r['suma_var'] for r in resumenes) / n
+    media_ren = sum(r['suma_ren'] for r in resumenes) / n
+    std_var = np.sqrt(max(sum(r['suma_var2'] for r in resumenes) / n - media_var ** 2, 0.0))
+    std_ren = np.sqrt(max(sum(r['suma_ren2'] for r in resumenes) / n - media_ren ** 2, 0.0))
+    min_var = min((r['min_varianza'] for r in resumenes), key=lambda x: x[0])
+    max_sharpe = max((r['max_sharpe'] for r in resumenes), key=lambda x: x[0])
+    return {
+        'n_portafolios': n,
+        'varianza_media': media_var,
+        'varianza_std': float(std_var),
+        'varianza_min': min_var[0],
+        'varianza_max': max(r['var_max'] for r in resumenes),
+        'rendimiento_medio': media_ren,
+        'rendimiento_std': float(std_ren),
+        'rendimiento_min': min(r['ren_min'] for r in resumenes),
+        'rendimiento_max': max(r['ren_max'] for r in resumenes),
+        'pesos_min_varianza': min_var[2],
+        'max_sharpe': max_sharpe[0],
+        'pesos_max_sharpe': max_sharpe[3],
+        'muestra_varianzas': np.concatenate([r['muestra_var'] for r in resumenes]),
+        'muestra_rendimientos': np.concatenate([r['muestra_ren'] for r in resumenes]),
+    }
+
+
+def nube_portafolios(Sigma, mu, n_portafolios=1_000_000, tamano_bloque=TAMANO_BLOQUE,
+                     tamano_muestra=TAMANO_MUESTRA, semilla=None, alpha=None, procesos=None):
+    """Evalúa millones de portafolios aleatorios en paralelo con memoria acotada
+
+    Cada bloque se genera y evalúa en un proceso distinto; solo regresan las
+    estadísticas parciales y una submuestra proporcional al tamaño del bloque.
+    """
+    Sigma = np.asarray(Sigma, dtype=np.float64)
+    mu = np.asarray(mu, dtype=np.float64)
+    tamanos = [tamano_bloque] * (n_portafolios // tamano_bloque)
+    if n_portafolios % tamano_bloque:
+        tamanos.append(n_portafolios % tamano_bloque)
+
+    # Semillas independientes por bloque para resultados reproducibles
+    semillas = np.random.SeedSequence(semilla).spawn(len(tamanos))
+    tareas = [
+        (Sigma, mu, n, s, alpha, max(1, round(tamano_muestra * n / n_portafolios)))
+        for n, s in zip(tamanos, semillas)
+    ]
+
+    procesos = procesos or os.cpu_count()
+    if procesos == 1:
+        resumenes = [_evaluar_bloque(t) for t in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos) as executor:
+            resumenes = list(executor.map(_evaluar_bloque, tareas))
+    return _combinar(resumenes)
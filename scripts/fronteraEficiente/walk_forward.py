@@ -0,0 +1,190 @@
+import os
+import argparse
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from concurrent.futures import ProcessPoolExecutor
+from fronteraEficiente import objetivo, obtener_precios, restriccion_suma_pesos, tickers
+
+# ==========================================
+# Backtest walk-forward de la frontera (OOS)
+# ==========================================
+CARPETA_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+FECHA_INICIO = '2005-01-01'
+VENTANA = 252               # días hábiles usados para estimar mu y Sigma
+FRECUENCIAS = {'mensual': 'M', 'semanal': 'W'}
+DIAS_ANUALES = 252
+
+
+def obtener_rendimientos(tickers, start_date, end_date):
+    """Lee los precios del almacén local una sola vez y guarda los rendimientos en cache"""
+    clave = hashlib.sha1(f"{sorted(tickers)}|{start_date}|{end_date}".encode()).hexdigest()[:16]
+    archivo = os.path.join(CARPETA_CACHE, f"rendimientos_{clave}.pkl")
+    if os.path.exists(archivo):
+        return pd.read_pickle(archivo)
+
+    datos = obtener_precios(tickers, start_date, end_date)
+    rendimientos = datos[sorted(tickers)].pct_change().dropna()
+    os.makedirs(CARPETA_CACHE, exist_ok=True)
+    rendimientos.to_pickle(archivo)
+    return rendimientos
+
+
+def fechas_rebalanceo(fechas, frecuencia='mensual'):
+    """Posiciones del último día hábil de cada semana o mes"""
+    periodos = pd.DatetimeIndex(fechas).to_period(FRECUENCIAS[frecuencia])
+    ultimo = np.flatnonzero(periodos[1:] != periodos[:-1])
+    return ultimo
+
+
+class CovarianzaMovil:
+    """Media y covarianza de una ventana deslizante con sumas acumuladas
+
+    Mover la ventana cuesta O(k·N^2) por las k filas que entran y salen,
+    en lugar de recalcular la covarianza completa de la ventana.
+    """
+
+    def __init__(self, R, inicio, fin):
+        self.R = R
+        self.inicio = inicio
+        self.fin = fin
+        bloque = R[inicio:fin]
+        self.suma = bloque.sum(axis=0)
+        self.productos = bloque.T @ bloque
+
+    def mover(self, inicio, fin):
+        """Desplaza la ventana a [inicio, fin) agregando y quitando solo las filas que cambian"""
+        if inicio >= self.fin:
+            self.__init__(self.R, inicio, fin)
+            return
+        salen = self.R[self.inicio:inicio]
+        entran = self.R[self.fin:fin]
+        self.suma += entran.sum(axis=0) - salen.sum(axis=0)
+        self.productos += entran.T @ entran - salen.T @ salen
+        self.inicio, self.fin = inicio, fin
+
+    def media(self):
+        return self.suma / (self.fin - self.inicio)
+
+    def covarianza(self):
+        n = self.fin - self.inicio
+        return (self.productos - np.outer(self.suma, self.suma) / n) / (n - 1)
+
+
+def portafolio_optimo(Sigma, mu, criterio='min_varianza', w_init=None):
+    """Resuelve el portafolio long-only de mínima varianza o de máximo Sharpe"""
+    N = len(mu)
+    w_init = np.ones(N) / N if w_init is None else w_init
+    if criterio == 'max_sharpe':
+        funcion = lambda w, Sigma: -np.dot(w, mu) / np.sqrt(objetivo(w, Sigma))
+    else:
+        funcion = objetivo
+    resultado = minimize(
+        funcion,
+        w_init,
+        args=(Sigma,),
+        method='SLSQP',
+        bounds=[(0, 1)] * N,
+        constraints=({'type': 'eq', 'fun': restriccion_suma_pesos},)
+    )
+    return resultado.x
+
+
+def desempeno_fuera_de_muestra(R, w):
+    """Rendimiento, volatilidad y máxima caída de mantener w sin rebalancear"""
+    crecimiento = np.cumprod(1 + R, axis=0) @ w
+    valor = np.concatenate(([1.0], crecimiento))
+    diarios = valor[1:] / valor[:-1] - 1
+    caida = 1 - valor / np.maximum.accumulate(valor)
+    return {
+        'rendimiento_oos': valor[-1] - 1,
+        'volatilidad_oos': diarios.std(ddof=1) * np.sqrt(DIAS_ANUALES) if len(diarios) > 1 else 0.0,
+        'max_caida_oos': caida.max(),
+    }
+
+
+def _procesar_bloque(args):
+    """Evalúa un bloque contiguo de rebalanceos actualizando la covarianza incrementalmente"""
+    R, posiciones, siguientes, ventana, criterio = args
+    resultados = []
+    cov = None
+    w = None
+    for pos, sig in zip(posiciones, siguientes):
+        inicio, fin = pos + 1 - ventana, pos + 1
+        if cov is None:
+            cov = CovarianzaMovil(R, inicio, fin)
+        else:
+            cov.mover(inicio, fin)
+        mu, Sigma = cov.media(), cov.covarianza()
+        # El portafolio anterior es un buen punto de partida para el optimizador
+        w = portafolio_optimo(Sigma, mu, criterio, w)
+        fila = {'posicion': pos, 'rendimiento_esperado': float(w @ mu), 'varianza_esperada': float(objetivo(w, Sigma))}
+        fila.update(desempeno_fuera_de_muestra(R[pos + 1:sig + 1], w))
+        fila['pesos'] = w.copy()
+        resultados.append(fila)
+    return resultados
+
+
+def walk_forward(rendimientos, frecuencia='mensual', ventana=VENTANA, criterio='min_varianza', procesos=None):
+    """Recalcula el portafolio óptimo en cada fecha de rebalanceo y mide su desempeño OOS"""
+    R = rendimientos.to_numpy(dtype=np.float64)
+    fechas = rendimientos.index
+    posiciones = fechas_rebalanceo(fechas, frecuencia)
+    posiciones = posiciones[posiciones + 1 >= ventana]
+    siguientes = np.append(posiciones[1:], len(R) - 1)
+    # Descartar el último rebalanceo si no tiene días fuera de muestra
+    validos = siguientes > posiciones
+    posiciones, siguientes = posiciones[validos], siguientes[validos]
+
+    # Bloques contiguos por proceso: cada uno inicializa su ventana una sola vez
+    procesos = procesos or os.cpu_count()
+    tareas = [
+        (R, p, s, ventana, criterio)
+        for p, s in zip(np.array_split(posiciones, procesos), np.array_split(siguientes, procesos))
+        if len(p)
+    ]
+    if len(tareas) <= 1:
+        bloques = [_procesar_bloque(t) for t in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos) as executor:
+            bloques = list(executor.map(_procesar_bloque, tareas))
+
+    filas = [fila for bloque in bloques for fila in bloque]
+    resultado = pd.DataFrame(filas)
+    if resultado.empty:
+        return resultado
+    pesos = np.vstack(resultado.pop('pesos').to_numpy())
+    resultado.insert(0, 'fecha_rebalanceo', fechas[resultado['posicion']])
+    resultado.insert(1, 'fecha_fin', fechas[siguientes])
+    for i, ticker in enumerate(rendimientos.columns):
+        resultado[f"peso_{ticker}"] = pesos[:, i]
+    return resultado.drop(columns='posicion')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest walk-forward de la frontera eficiente')
+    parser.add_argument('--tickers', nargs='+', default=tickers)
+    parser.add_argument('--inicio', default=FECHA_INICIO)
+    parser.add_argument('--fin', default=pd.Timestamp.today().strftime('%Y-%m-%d'))
+    parser.add_argument('--frecuencia', choices=list(FRECUENCIAS), default='mensual')
+    parser.add_argument('--ventana', type=int, default=VENTANA)
+    parser.add_argument('--criterio', choices=['min_varianza', 'max_sharpe'], default='min_varianza')
+    parser.add_argument('--procesos', type=int, default=None)
+    parser.add_argument('--salida', default='walk_forward.csv')
+    args = parser.parse_args()
+
+    rendimientos = obtener_rendimientos(args.tickers, args.inicio, args.fin)
+    resultado = walk_forward(rendimientos, args.frecuencia, args.ventana, args.criterio, args.procesos)
+    resultado.to_csv(args.salida, index=False, float_format='%.6f')
+
+    print(f"Ventanas evaluadas: {len(resultado)}")
+    if not resultado.empty:
+        acumulado = np.prod(1 + resultado['rendimiento_oos']) - 1
+        print(f"Rendimiento acumulado fuera de muestra: {acumulado:.2%}")
+        print(f"Máxima caída en una ventana: {resultado['max_caida_oos'].max():.2%}")
+    print(f"Resultados guardados en {args.salida}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+import os
+import time
+import json
+import sqlite3
+import threading
+import hashlib
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from datetime import datetime, timedelta
+import pytz
+
+# ==========================================================
+# Cache persistente en disco delante de las llamadas a yfinance
+# ==========================================================
+RAIZ_REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+RUTA_CACHE = os.getenv("YF_CACHE_DIR", os.path.join(RAIZ_REPO, 'data', 'cache_yfinance'))
+RUTA_FIXTURES = os.getenv("YF_FIXTURES_DIR", os.path.join(RAIZ_REPO, 'data', 'fixtures_yfinance'))
+
+# normal: cache con TTL | grabar: siempre red y guarda fixtures | replay: solo fixtures, sin red
+MODO = os.getenv("YF_CACHE_MODO", "normal")
+TAMANO_MAXIMO = int(os.getenv("YF_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+TTL_MERCADO_ABIERTO = timedelta(minutes=15)   # el último precio sigue cambiando
+TTL_MERCADO_CERRADO = timedelta(hours=12)     # no cambia hasta la siguiente sesión
+TTL_HISTORICO = timedelta(days=7)             # rangos cerrados; solo cambian por ajustes
+TTL_VACIO = timedelta(minutes=2)              # yfinance no lanza errores: una respuesta vacía puede ser una falla
+
+ZONA_NY = pytz.timezone('America/New_York')
+
+
+class ReplaySinFixture(LookupError):
+    """No existe un fixture grabado para la consulta en modo replay"""
+
+
+def mercado_cerrado(ahora=None):
+    """True si la bolsa de Nueva York está cerrada (fin de semana o fuera de 9:30-16:00)"""
+    ahora = ahora or datetime.now(ZONA_NY)
+    if ahora.weekday() > 4:
+        return True
+    minutos = ahora.hour * 60 + ahora.minute
+    return minutos < 9 * 60 + 30 or minutos >= 16 * 60
+
+
+def calcular_ttl(fin=None, ahora=None):
+    """TTL de una respuesta según el final del rango pedido y el estado del mercado"""
+    ahora = ahora or datetime.now(ZONA_NY)
+    hoy = ahora.strftime('%Y-%m-%d')
+    # end es exclusivo: un rango que termina hoy o antes ya no incluye la sesión en curso
+    if fin is not None and fin <= hoy:
+        return TTL_HISTORICO
+    return TTL_MERCADO_CERRADO if mercado_cerrado(ahora) else TTL_MERCADO_ABIERTO
+
+
+def duracion_intervalo(intervalo):
+    """Duración de una barra intradía ('1m', '5m', '1h', ...); None para barras diarias o mayores"""
+    unidades = {'m': 'minutes', 'h': 'hours'}
+    if intervalo[-1:] in unidades and intervalo[:-1].isdigit():
+        return timedelta(**{unidades[intervalo[-1]]: int(intervalo[:-1])})
+    return None
+
+
+def respuesta_vacia(datos):
+    """True si yfinance no devolvió datos (DataFrame/Series vacío o solo NaN)"""
+    return datos is None or datos.dropna(how='all').empty
+
+
+def _fecha(valor):
+    """Normaliza fechas de entrada a texto YYYY-MM-DD (o None)"""
+    if valor is None:
+        return None
+    return pd.Timestamp(valor).strftime('%Y-%m-%d')
+
+
+def _recortar(datos, inicio, fin):
+    """Recorta un DataFrame/Series al rango [inicio, fin)"""
+    if datos.empty or (inicio is None and fin is None):
+        return datos
+    fechas = datos.index.tz_localize(None) if getattr(datos.index, 'tz', None) is not None else datos.index
+    mascara = np.ones(len(fechas), dtype=bool)
+    if inicio is not None:
+        mascara &= fechas >= pd.Timestamp(inicio)
+    if fin is not None:
+        mascara &= fechas < pd.Timestamp(fin)
+    return datos[mascara]
+
+
+class CacheYFinance:
+    """Cache en disco con índice SQLite, TTL por estado del mercado y límite de tamaño LRU
+
+    La clave de cada entrada es (función, ticker, intervalo, rango, banderas de ajuste).
+    Una consulta con rango explícito se sirve desde cualquier entrada vigente que
+    cubra ese rango, recortándola. Se puede usar desde varios hilos: el índice se
+    protege con un candado y las descargas ocurren fuera de él.
+    """
+
+    def __init__(self, ruta=RUTA_CACHE, tamano_maximo=TAMANO_MAXIMO, modo=MODO):
+        self.modo = modo
+        # En grabar/replay las entradas viven en el directorio de fixtures
+        self.ruta = RUTA_FIXTURES if modo in ('grabar', 'replay') else ruta
+        self.tamano_maximo = tamano_maximo
+        os.makedirs(self.ruta, exist_ok=True)
+        self._candado = threading.RLock()
+        self.db = sqlite3.connect(os.path.join(self.ruta, 'indice.sqlite'), timeout=30, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entradas (
+                clave TEXT PRIMARY KEY,
+                funcion TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                intervalo TEXT NOT NULL,
+                banderas TEXT NOT NULL,
+                periodo TEXT,
+                inicio TEXT,
+                fin TEXT,
+                archivo TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                expira REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+
+    # ------------------------------------------------------------------
+    # Índice
+    # ------------------------------------------------------------------
+    def _buscar(self, funcion, ticker, intervalo, banderas, periodo, inicio, fin):
+        """Busca una entrada exacta o una que cubra el rango pedido"""
+        ahora = time.time()
+        vigente = "" if self.modo == 'replay' else "AND expira > ?"
+        parametros = [funcion, ticker, intervalo, banderas]
+        if periodo is not None:
+            sql = f"SELECT clave, archivo, inicio, fin FROM entradas WHERE funcion=? AND ticker=? AND intervalo=? AND banderas=? AND periodo=? {vigente}"
+            parametros.append(periodo)
+        else:
+            # Entradas sin límite se guardan como '' (inicio) y '9999-12-31' (fin)
+            sql = f"""
+                SELECT clave, archivo, inicio, fin FROM entradas
+                WHERE funcion=? AND ticker=? AND intervalo=? AND banderas=? AND periodo IS NULL
+                  AND inicio <= ? AND fin >= ? {vigente}
+                ORDER BY fin DESC LIMIT 1
+            """
+            parametros += [inicio or '', fin or '9999-12-31']
+        if vigente:
+            parametros.append(ahora)
+        with self._candado:
+            fila = self.db.execute(sql, parametros).fetchone()
+            if fila:
+                self.db.execute("UPDATE entradas SET ultimo_acceso=? WHERE clave=?", (ahora, fila[0]))
+                self.db.commit()
+        return fila
+
+    def _guardar(self, funcion, ticker, intervalo, banderas, periodo, inicio, fin, datos):
+        clave = hashlib.sha1(json.dumps([funcion, ticker, intervalo, banderas, periodo, inicio, fin]).encode()).hexdigest()
+        archivo = os.path.join(self.ruta, f"{clave}.pkl")
+        datos.to_pickle(archivo)
+        # Los fixtures grabados no expiran; las respuestas vacías se vuelven a pedir pronto
+        if self.modo == 'grabar':
+            ttl = timedelta(days=36500)
+        elif respuesta_vacia(datos):
+            ttl = TTL_VACIO
+        else:
+            ttl = calcular_ttl(fin)
+            # Mientras el rango siga abierto llega una barra intradía nueva por intervalo
+            barra = duracion_intervalo(intervalo)
+            if barra is not None and ttl != TTL_HISTORICO:
+                ttl = min(ttl, barra)
+        ahora = time.time()
+        with self._candado:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entradas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (clave, funcion, ticker, intervalo, banderas, periodo,
+                 '' if periodo is None and inicio is None else inicio,
+                 '9999-12-31' if periodo is None and fin is None else fin,
+                 archivo, os.path.getsize(archivo), ahora + ttl.total_seconds(), ahora)
+            )
+            self.db.commit()
+            if self.modo == 'normal':
+                self._aplicar_limite()
+
+    def _aplicar_limite(self):
+        """Elimina las entradas usadas hace más tiempo hasta respetar el tamaño máximo (con el candado tomado)"""
+        total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM entradas").fetchone()[0]
+        if total <= self.tamano_maximo:
+            return
+        for clave, archivo, tamano in self.db.execute(
+                "SELECT clave, archivo, bytes FROM entradas ORDER BY ultimo_acceso").fetchall():
+            if total <= self.tamano_maximo:
+                break
+            if os.path.exists(archivo):
+                os.remove(archivo)
+            self.db.execute("DELETE FROM entradas WHERE clave=?", (clave,))
+            total -= tamano
+        self.db.commit()
+
+    def _leer(self, funcion, ticker, intervalo, banderas, periodo, inicio, fin):
+        """Datos en cache para la consulta, o None si no hay una entrada vigente"""
+        if self.modo == 'grabar':
+            return None
+        fila = self._buscar(funcion, ticker, intervalo, banderas, periodo, inicio, fin)
+        if not fila or not os.path.exists(fila[1]):
+            return None
+        datos = pd.read_pickle(fila[1])
+        return _recortar(datos, inicio, fin) if periodo is None else datos
+
+    def _obtener(self, funcion, ticker, intervalo, banderas, periodo, inicio, fin, descargar, refrescar=False):
+        """Sirve desde cache si hay una entrada vigente; si no (o con refrescar), descarga y guarda"""
+        if not refrescar or self.modo == 'replay':
+            datos = self._leer(funcion, ticker, intervalo, banderas, periodo, inicio, fin)
+            if datos is not None:
+                return datos
+        if self.modo == 'replay':
+            raise ReplaySinFixture(f"Sin fixture para {funcion} {ticker} {intervalo} {periodo or (inicio, fin)}")
+        datos = descargar()
+        self._guardar(funcion, ticker, intervalo, banderas, periodo, inicio, fin, datos)
+        return datos
+
+    # ------------------------------------------------------------------
+    # API equivalente a yfinance
+    # ------------------------------------------------------------------
+    def historial(self, ticker, start=None, end=None, period=None, interval='1d', auto_adjust=True, actions=True,
+                  refrescar=False):
+        """Equivalente a yf.Ticker(ticker).history(...); refrescar ignora la entrada en cache"""
+        inicio, fin = _fecha(start), _fecha(end)
+        if period is None and inicio is None and fin is None:
+            period = '1mo'  # mismo valor por defecto que yfinance
+        banderas = f"auto_adjust={auto_adjust},actions={actions}"
+        return self._obtener(
+            'historial', ticker, interval, banderas, period, inicio, fin,
+            lambda: yf.Ticker(ticker).history(start=inicio, end=fin, period=period, interval=interval,
+                                              auto_adjust=auto_adjust, actions=actions),
+            refrescar
+        )
+
+    def descargar(self, tickers, start=None, end=None, interval='1d', auto_adjust=False, group_by='column', **kwargs):
+        """Equivalente a yf.download(...) con cache por ticker
+
+        Los tickers sin entrada vigente se piden juntos en una sola llamada;
+        el resultado siempre tiene columnas MultiIndex, como yfinance reciente.
+        """
+        lista = [tickers] if isinstance(tickers, str) else list(tickers)
+        inicio, fin = _fecha(start), _fecha(end)
+        banderas = f"auto_adjust={auto_adjust}"
+        partes = {}
+        faltantes = []
+        for ticker in lista:
+            parte = self._leer('descargar', ticker, interval, banderas, None, inicio, fin)
+            if parte is not None:
+                partes[ticker] = parte
+            elif self.modo == 'replay':
+                raise ReplaySinFixture(f"Sin fixture para descargar {ticker} {interval} {(inicio, fin)}")
+            else:
+                faltantes.append(ticker)
+
+        if faltantes:
+            kwargs.setdefault('progress', False)
+            datos = yf.download(faltantes, start=inicio, end=fin, interval=interval, auto_adjust=auto_adjust,
+                                group_by='ticker', **kwargs)
+            for ticker in faltantes:
+                if isinstance(datos.columns, pd.MultiIndex):
+                    parte = datos[ticker] if ticker in datos.columns.get_level_values(0) else pd.DataFrame()
+                else:
+                    parte = datos
+                parte = parte.dropna(how='all')
+                self._guardar('descargar', ticker, interval, banderas, None, inicio, fin, parte)
+                partes[ticker] = parte
+
+        combinado = pd.concat({t: partes[t] for t in lista}, axis=1) if partes else pd.DataFrame()
+        if group_by != 'ticker' and not combinado.empty:
+            combinado = combinado.swaplevel(0, 1, axis=1).sort_index(axis=1, level=0, sort_remaining=False)
+        return combinado
+
+    def dividendos(self, ticker):
+        """Equivalente a yf.Ticker(ticker).dividends"""
+        return self._obtener('dividendos', ticker, '1d', '', 'max', None, None,
+                             lambda: yf.Ticker(ticker).dividends)
+
+    def splits(self, ticker):
+        """Equivalente a yf.Ticker(ticker).splits"""
+        return self._obtener('splits', ticker, '1d', '', 'max', None, None,
+                             lambda: yf.Ticker(ticker).splits)
+
+
+_cache = None
+_candado_cache = threading.Lock()
+
+def obtener_cache():
+    """Instancia compartida configurada por variables de entorno"""
+    global _cache
+    with _candado_cache:
+        if _cache is None:
+            _cache = CacheYFinance()
+    return _cache
+
+
+def historial(ticker, **kwargs):
+    return obtener_cache().historial(ticker, **kwargs)
+
+
+def descargar(tickers, **kwargs):
+    return obtener_cache().descargar(tickers, **kwargs)
+
+
+def dividendos(ticker):
+    return obtener_cache().dividendos(ticker)
+
+
+def splits(ticker):
+    return obtener_cache().splits(ticker)
@@ -0,0 +1,104 @@
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from graficos.reduccion import reducir
+
+# ==========================================================
+# Gráficas de series largas con un presupuesto fijo de puntos
+# ==========================================================
+RAIZ_REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+RUTA_GRAFICOS = os.getenv("GRAFICOS_DIR", os.path.join(RAIZ_REPO, 'data', 'graficos'))
+
+ANCHO_PX = 1600
+ALTO_PX = 900
+DPI = 100
+
+
+def puntos_para(ancho_px, metodo='lttb'):
+    """Presupuesto de puntos: uno por columna de píxeles (dos con min_max)"""
+    return 2 * ancho_px if metodo == 'min_max' else ancho_px
+
+
+def graficar_serie(ax, fechas, valores, ancho_px=ANCHO_PX, metodo='lttb', **kwargs):
+    """Dibuja una serie en ax después de reducirla al ancho de la gráfica en píxeles"""
+    x, y = reducir(np.asarray(fechas), np.asarray(valores), puntos_para(ancho_px, metodo), metodo)
+    return ax.plot(x, y, **kwargs)
+
+
+def dibujar(ax, grafico, ancho_px=ANCHO_PX, metodo='lttb'):
+    """Dibuja en ax la descripción de una gráfica
+
+    grafico es un dict con:
+      series: lista de (fechas, valores, etiqueta)
+      marcas: lista opcional de (fecha, valor, etiqueta) que se señalan con un punto
+      titulo, ylabel: textos opcionales
+    """
+    for fechas, valores, etiqueta in grafico['series']:
+        graficar_serie(ax, fechas, valores, ancho_px, metodo, label=etiqueta, linewidth=0.8)
+    for fecha, valor, etiqueta in grafico.get('marcas', []):
+        ax.scatter([fecha], [valor], s=20, zorder=3)
+        ax.annotate(etiqueta, (fecha, valor), textcoords='offset points', xytext=(4, 4), fontsize=8)
+    ax.set_title(grafico.get('titulo', grafico.get('nombre', '')))
+    if 'ylabel' in grafico:
+        ax.set_ylabel(grafico['ylabel'])
+    if len(grafico['series']) > 1:
+        ax.legend()
+    ax.grid(True)
+
+
+def _renderizar(graficos, carpeta, ancho_px, alto_px, metodo, formato):
+    """Renderiza una lista de gráficas reutilizando una sola figura (sin pyplot)"""
+    figura = Figure(figsize=(ancho_px / DPI, alto_px / DPI), dpi=DPI)
+    FigureCanvasAgg(figura)
+    ax = figura.add_subplot()
+    archivos = []
+    for grafico in graficos:
+        ax.clear()
+        dibujar(ax, grafico, ancho_px, metodo)
+        archivo = os.path.join(carpeta, f"{grafico['nombre'].replace('^', '_')}.{formato}")
+        figura.savefig(archivo, format=formato)
+        archivos.append(archivo)
+    return archivos
+
+
+def renderizar_lote(graficos, carpeta=RUTA_GRAFICOS, ancho_px=ANCHO_PX, alto_px=ALTO_PX,
+                    metodo='lttb', formato='png', procesos=None):
+    """Renderiza muchas gráficas a archivos de imagen
+
+    Las series se reducen antes de llegar a matplotlib; con procesos > 1 las
+    gráficas se reparten en bloques entre varios procesos.
+    Devuelve la lista de archivos escritos.
+    """
+    graficos = list(graficos)
+    os.makedirs(carpeta, exist_ok=True)
+    procesos = procesos or 1
+    if procesos == 1 or len(graficos) < 2:
+        return _renderizar(graficos, carpeta, ancho_px, alto_px, metodo, formato)
+
+    bloques = [graficos[i::procesos] for i in range(procesos) if graficos[i::procesos]]
+    archivos = []
+    with ProcessPoolExecutor(max_workers=len(bloques)) as ejecutor:
+        for parte in ejecutor.map(_renderizar, bloques, [carpeta] * len(bloques), [ancho_px] * len(bloques),
+                                  [alto_px] * len(bloques), [metodo] * len(bloques), [formato] * len(bloques)):
+            archivos += parte
+    return archivos
+
+
+def graficos_almacen(tickers, desde=None, hasta=None, columna='cierre'):
+    """Descripciones de gráficas de los activos del almacén local, listas para renderizar_lote"""
+    from almacen.almacen_series import leer_cierres
+    for ticker in tickers:
+        fechas, valores = leer_cierres(ticker, desde, hasta, columna)
+        if len(fechas):
+            yield {'nombre': ticker, 'titulo': ticker, 'series': [(fechas, valores, columna)]}
+
+
+if __name__ == "__main__":
+    # python graficos.py <ticker> [<ticker> ...] : grafica activos del almacén en /data/graficos
+    for archivo in renderizar_lote(graficos_almacen(sys.argv[1:]), procesos=os.cpu_count()):
+        print(f"✅ {archivo}")
@@ -0,0 +1,105 @@
+import numpy as np
+
+# ========================================================
+# Reducción de series a un presupuesto de puntos por gráfica
+# ========================================================
+
+
+def _a_numeros(x):
+    """Eje x como float64; las fechas se convierten a días desde 1970-01-01"""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[D]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def _validos(x, y):
+    """Descarta los puntos sin valor"""
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+    mascara = ~np.isnan(y)
+    if mascara.all():
+        return x, y
+    return x[mascara], y[mascara]
+
+
+def lttb(x, y, n_puntos):
+    """Largest-Triangle-Three-Buckets: conserva la forma visual con n_puntos
+
+    El primer y último punto se conservan; de cada cubeta intermedia se elige el
+    punto que forma el triángulo de mayor área con el punto elegido antes y el
+    promedio de la cubeta siguiente. Devuelve los índices elegidos.
+    """
+    n = len(y)
+    if n_puntos >= n or n_puntos < 3:
+        return np.arange(n)
+    xf = _a_numeros(x)
+    bordes = np.linspace(1, n - 1, n_puntos - 1).astype(np.int64)
+    indices = np.empty(n_puntos, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_puntos - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        siguiente = slice(bordes[i + 1], bordes[i + 2]) if i + 2 < len(bordes) else slice(n - 1, n)
+        mx, my = xf[siguiente].mean(), y[siguiente].mean()
+        area = np.abs((xf[a] - mx) * (y[inicio:fin] - y[a]) - (xf[a] - xf[inicio:fin]) * (my - y[a]))
+        a = inicio + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def min_max(y, n_puntos):
+    """Mínimo y máximo de cada cubeta (dos puntos por columna de píxeles)
+
+    Conserva exactamente los extremos de la serie, útil para caídas y máximos.
+    Devuelve los índices elegidos en orden cronológico.
+    """
+    n = len(y)
+    n_cubetas = max(n_puntos // 2, 1)
+    if n <= n_puntos:
+        return np.arange(n)
+    tamano = -(-n // n_cubetas)
+    n_cubetas = -(-n // tamano)
+    # Se rellena con NaN para que todas las cubetas tengan el mismo tamaño
+    matriz = np.full(n_cubetas * tamano, np.nan)
+    matriz[:n] = y
+    matriz = matriz.reshape(n_cubetas, tamano)
+    desplazamiento = np.arange(n_cubetas) * tamano
+    minimos = np.nanargmin(matriz, axis=1) + desplazamiento
+    maximos = np.nanargmax(matriz, axis=1) + desplazamiento
+    return np.unique(np.concatenate(([0, n - 1], minimos, maximos)))
+
+
+def reducir(x, y, n_puntos, metodo='lttb'):
+    """Reduce una serie (x, y) a lo sumo a n_puntos con lttb o min_max"""
+    x, y = _validos(x, y)
+    if metodo == 'lttb':
+        indices = lttb(x, y, n_puntos)
+    elif metodo == 'min_max':
+        indices = min_max(y, n_puntos)
+    else:
+        raise ValueError(f"Método de reducción desconocido: {metodo}")
+    return x[indices], y[indices]
+
+
+def reducir_dispersion(x, y, ancho_px, alto_px, tamano_punto_px=2):
+    """Deja un solo punto por celda del tamaño de un marcador en una nube de dispersión
+
+    Los puntos que caen en la misma celda se dibujan uno encima de otro, así que
+    la imagen casi no cambia y matplotlib dibuja a lo sumo una fracción fija de
+    los píxeles. Devuelve los índices conservados.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    columnas = max(ancho_px // tamano_punto_px, 1)
+    filas = max(alto_px // tamano_punto_px, 1)
+    if len(x) <= columnas:
+        return np.arange(len(x))
+
+    def _celda(v, n):
+        rango = np.ptp(v)
+        if rango == 0:
+            return np.zeros(len(v), dtype=np.int64)
+        return np.minimum(((v - v.min()) / rango * n).astype(np.int64), n - 1)
+
+    celdas = _celda(x, columnas) * filas + _celda(y, filas)
+    _, indices = np.unique(celdas, return_index=True)
+    return np.sort(indices)
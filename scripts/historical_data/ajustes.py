@@ -0,0 +1,92 @@
+import os
+import sys
+import numpy as np
+
+# Añadir la ruta del almacén local manualmente
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from almacen.almacen_series import INDICES, leer_serie, leer_eventos, guardar_eventos
+
+# ==============================================================
+# Precios ajustados reconstruidos con los dividendos y splits guardados
+# ==============================================================
+
+
+def factores_eventos(fechas, cierres, eventos, ajustar_splits=False):
+    """Factor de ajuste de cada evento (el que se aplica a los precios anteriores a su fecha)
+
+      dividendo D: 1 - D / cierre del día anterior a la fecha ex-dividendo
+      split S:     1 / S, solo con ajustar_splits (los cierres de yfinance ya
+                   vienen ajustados por splits)
+
+    Solo se calculan los eventos sin factor; los ya calculados se conservan.
+    """
+    eventos = eventos.copy()
+    pendientes = eventos['factor'].isna().to_numpy()
+    if not pendientes.any():
+        return eventos
+    posiciones = np.searchsorted(fechas, eventos['fecha'].to_numpy(dtype='datetime64[D]'))
+    dividendo = (eventos['tipo'] == 'dividendo').to_numpy()
+    valores = eventos['evento'].to_numpy(dtype=np.float64)
+
+    factores = np.ones(len(eventos))
+    previo = posiciones - 1
+    validos = dividendo & (previo >= 0)
+    factores[validos] = 1.0 - valores[validos] / cierres[previo[validos]]
+    if ajustar_splits:
+        split = ~dividendo & (valores > 0)
+        factores[split] = 1.0 / valores[split]
+    eventos.loc[pendientes, 'factor'] = factores[pendientes]
+    return eventos
+
+
+def factor_diario(fechas, eventos):
+    """Factor de ajuste acumulado de cada día
+
+    El factor de un día es el producto de los factores de todos los eventos
+    posteriores: un producto acumulado en orden inverso sobre un arreglo con
+    un factor por posición, aplicado a toda la serie en una sola operación.
+    """
+    n = len(fechas)
+    por_posicion = np.ones(n + 1)
+    posiciones = np.searchsorted(fechas, eventos['fecha'].to_numpy(dtype='datetime64[D]'))
+    np.multiply.at(por_posicion, posiciones, eventos['factor'].fillna(1.0).to_numpy(dtype=np.float64))
+    # Un evento en la posición p ajusta los días anteriores a p
+    acumulado = np.cumprod(por_posicion[::-1])[::-1]
+    return acumulado[1:]
+
+
+def precios_ajustados(ticker, desde=None, hasta=None, ajustar_splits=False):
+    """Serie del activo con cierre_reconstruido = cierre * factor acumulado de sus eventos
+
+    Los factores de los eventos nuevos se calculan una sola vez y se guardan
+    junto a los eventos; los precios no se vuelven a descargar.
+    """
+    ticker = INDICES.get(ticker, ticker)
+    serie = leer_serie(ticker)
+    fechas = serie.index.to_numpy(dtype='datetime64[D]')
+    cierres = serie['cierre'].to_numpy(dtype=np.float64)
+
+    eventos = leer_eventos(ticker)
+    if not eventos.empty and eventos['factor'].isna().any():
+        eventos = factores_eventos(fechas, cierres, eventos, ajustar_splits)
+        guardar_eventos(ticker, eventos)
+
+    serie['factor_ajuste'] = factor_diario(fechas, eventos)
+    serie['cierre_reconstruido'] = serie['cierre'] * serie['factor_ajuste']
+    if desde is not None or hasta is not None:
+        serie = serie.loc[desde:hasta]
+    return serie
+
+
+def comparar_ajustes(ticker):
+    """Diferencia relativa máxima entre el cierre reconstruido y el cierre ajustado de yfinance"""
+    serie = precios_ajustados(ticker).dropna(subset=['cierre_ajustado', 'cierre_reconstruido'])
+    if serie.empty:
+        return float('nan')
+    return float(np.max(np.abs(serie['cierre_reconstruido'] / serie['cierre_ajustado'] - 1)))
+
+
+if __name__ == "__main__":
+    # python ajustes.py <ticker> [<ticker> ...] : compara la reconstrucción con yfinance
+    for ticker in sys.argv[1:]:
+        print(f"{ticker}: diferencia máxima {comparar_ajustes(ticker):.6%}")
@@ -1,14 +1,36 @@
 import os
-import yfinance as yf
 import pandas as pd
 from datetime import datetime
 import numpy as np
 import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Añadir la ruta del almacén local manualmente
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from almacen.almacen_series import guardar_serie, desde_yfinance
+from almacen.almacen_series import guardar_eventos as guardar_eventos_almacen
+from almacen.archivo_compacto import guardar_archivo
+from fuente_datos import cache_yfinance
+from instrumentacion.metricas import Instrumentacion
 
 # Definir fecha de inicio para los datos históricos
 FECHA_INICIO = "2000-01-01"
 FECHA_INICIO_MAXIMA = "1800-01-01"
 
+# Formato de los Datos_Completos: 'csv' (texto) o 'compacto' (almacen/archivo_compacto.py)
+FORMATO_DATOS_COMPLETOS = os.getenv("DATOS_COMPLETOS_FORMATO", "csv")
+
+# Activos por llamada a yf.download e hilos para descargar dividendos y splits
+TAMANO_LOTE = int(os.getenv("DIVIDENDOS_TAMANO_LOTE", "25"))
+HILOS_EVENTOS = int(os.getenv("DIVIDENDOS_HILOS", "8"))
+# Reintentos de un lote fallido antes de descargar sus activos uno por uno
+REINTENTOS_LOTE = 2
+
+# Tiempos, filas y bytes por etapa y activo
+instrumentacion = Instrumentacion('dividendos')
+
 def crear_estructura_carpetas(nombre_activo):
     """Crea la estructura de carpetas para un activo"""
     carpetas = {
@@ -27,6 +49,13 @@ def guardar_datos_completos(datos, nombre_activo):
     """Guarda todos los datos históricos en la carpeta correspondiente"""
     try:
         carpetas = crear_estructura_carpetas(nombre_activo)
+        fecha_actual = datetime.now().strftime('%Y%m%d')
+
+        if FORMATO_DATOS_COMPLETOS == 'compacto':
+            # Fechas y precios como enteros delta: varias veces menor que el CSV
+            nombre_archivo = f"{carpetas['datos_completos']}/Datos_Completos_{nombre_activo}_{fecha_actual}.fac"
+            guardar_archivo(nombre_archivo, desde_yfinance(datos).dropna(axis=1, how='all'))
+            return nombre_archivo
         
         # Preparar DataFrame
         df_completo = datos.copy()
@@ -37,7 +66,6 @@ def guardar_datos_completos(datos, nombre_activo):
             df_completo.columns = ['_'.join(col).replace(' ', '_') for col in df_completo.columns]
         
         # Guardar CSV
-        fecha_actual = datetime.now().strftime('%Y%m%d')
         nombre_archivo = f"{carpetas['datos_completos']}/Datos_Completos_{nombre_activo}_{fecha_actual}.csv"
         df_completo.to_csv(nombre_archivo, index=False, float_format='%.6f')
         
@@ -46,21 +74,63 @@ def guardar_datos_completos(datos, nombre_activo):
         print(f"Error guardando datos completos: {str(e)}")
         return None
 
-def guardar_eventos(ticker, nombre_activo):
-    """Descarga y guarda eventos (dividendos/splits) en archivo separado"""
+def descargar_eventos(ticker):
+    """Dividendos y splits de un activo (los índices no tienen eventos)"""
+    if ticker.startswith('^'):
+        return None, None
+    return cache_yfinance.dividendos(ticker), cache_yfinance.splits(ticker)
+
+def descargar_lote(tickers, hilos=HILOS_EVENTOS):
+    """Descarga los históricos de varios activos en una sola llamada y sus eventos en paralelo
+
+    Returns:
+        DataFrame con columnas (ticker, campo) y dict {ticker: Future con (dividendos, splits)}.
+        Un error al descargar los eventos de un activo queda en su Future.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    with instrumentacion.etapa('fetch', ','.join(tickers)) as medicion:
+        # Los eventos son una petición por activo: se piden mientras baja el lote de precios
+        with ThreadPoolExecutor(max_workers=hilos) as executor:
+            eventos = {ticker: executor.submit(descargar_eventos, ticker) for ticker in tickers}
+            datos = cache_yfinance.descargar(
+                tickers,
+                start=FECHA_INICIO_MAXIMA,
+                end=datetime.now().strftime('%Y-%m-%d'),
+                auto_adjust=False,
+                progress=False,
+                group_by='ticker'
+            )
+        medicion.filas = len(datos)
+        medicion.bytes = int(datos.memory_usage(deep=True).sum())
+    return datos, eventos
+
+def datos_activo(datos, ticker):
+    """Columnas de un activo del DataFrame de un lote, sin las fechas en que no cotizó
+
+    None si el lote no se pudo descargar: procesar_activo descarga el activo solo.
+    """
+    if datos is None:
+        return None
+    if datos.empty or ticker not in datos.columns.get_level_values(0):
+        return pd.DataFrame()
+    return datos[[ticker]].dropna(how='all')
+
+def guardar_eventos(ticker, nombre_activo, descarga=None):
+    """Guarda eventos (dividendos/splits) en archivo separado
+
+    descarga es el Future de descargar_lote; sin él, los eventos se descargan aquí.
+    """
     try:
         carpetas = crear_estructura_carpetas(nombre_activo)
         eventos = []
+        dividendos, splits = descarga.result() if descarga is not None else descargar_eventos(ticker)
         
         # Para índices, no hay eventos
         if ticker.startswith('^'):
             # Guardar DataFrame vacío para consistencia
             df_eventos = pd.DataFrame(columns=['Fecha', 'Evento', 'Tipo'])
         else:
-            obj = yf.Ticker(ticker)
-            
             # Dividendos
-            dividendos = obj.dividends
             if not dividendos.empty:
                 for fecha, valor in dividendos.items():
                     if hasattr(fecha, 'tz'):
@@ -68,7 +138,6 @@ def guardar_eventos(ticker, nombre_activo):
                     eventos.append({'Fecha': fecha, 'Evento': valor, 'Tipo': 'Dividendo'})
             
             # Splits
-            splits = obj.splits
             if not splits.empty:
                 for fecha, valor in splits.items():
                     if hasattr(fecha, 'tz'):
@@ -76,6 +145,9 @@ def guardar_eventos(ticker, nombre_activo):
                     eventos.append({'Fecha': fecha, 'Evento': valor, 'Tipo': 'Split'})
             
             df_eventos = pd.DataFrame(eventos)
+            # Los eventos guardados en el almacén permiten reconstruir los precios ajustados (ajustes.py)
+            if not df_eventos.empty:
+                guardar_eventos_almacen(ticker, df_eventos.rename(columns={'Fecha': 'fecha', 'Evento': 'evento', 'Tipo': 'tipo'}))
         
         # Guardar eventos
         fecha_reporte = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -145,35 +217,60 @@ def generar_reporte_ajustes(datos, nombre_activo):
         print(f"Error generando reporte de ajustes: {str(e)}")
         return None
 
-def procesar_activo(ticker, nombre_activo):
-    """Función principal para procesar un activo"""
+def guardar_en_almacen(datos, ticker):
+    """Actualiza el archivo columnar del activo en el almacén local"""
+    try:
+        return guardar_serie(ticker, desde_yfinance(datos))
+    except Exception as e:
+        print(f"Error guardando en almacén local: {str(e)}")
+        return None
+
+def procesar_activo(ticker, nombre_activo, datos=None, eventos=None):
+    """Función principal para procesar un activo
+
+    datos y eventos son la parte del activo de descargar_lote; sin ellos, el
+    activo se descarga solo.
+    """
     try:
         # Descargar datos históricos
-        datos = yf.download(
-            ticker, 
-            start=FECHA_INICIO_MAXIMA, 
-            end=datetime.now().strftime('%Y-%m-%d'),
-            auto_adjust=False,
-            progress=False,
-            group_by='ticker'
-        )
+        if datos is None:
+            lote, descargas = descargar_lote([ticker])
+            datos, eventos = datos_activo(lote, ticker), descargas[ticker]
         
         if datos.empty:
             print(f"No se encontraron datos para {nombre_activo}")
             return None, None, None
         
         # Guardar datos completos
-        archivo_completo = guardar_datos_completos(datos, nombre_activo)
+        with instrumentacion.etapa('csv', ticker) as medicion:
+            archivo_completo = guardar_datos_completos(datos, nombre_activo)
+            if archivo_completo:
+                medicion.filas = len(datos)
+                medicion.bytes = os.path.getsize(archivo_completo)
         if archivo_completo:
             print(f"Datos completos guardados: {archivo_completo}")
+
+        # Actualizar almacén local compartido
+        with instrumentacion.etapa('almacen', ticker) as medicion:
+            registros = guardar_en_almacen(datos, ticker)
+            medicion.filas = registros or 0
+        if registros:
+            print(f"Almacén local actualizado: {registros} registros")
         
         # Generar reporte de ajustes
-        archivo_ajustes = generar_reporte_ajustes(datos, nombre_activo)
+        with instrumentacion.etapa('ajustes', ticker) as medicion:
+            archivo_ajustes = generar_reporte_ajustes(datos, nombre_activo)
+            medicion.filas = len(datos)
+            if archivo_ajustes:
+                medicion.bytes = os.path.getsize(archivo_ajustes)
         if archivo_ajustes:
             print(f"Reporte de ajustes guardado: {archivo_ajustes}")
         
         # Guardar eventos
-        archivo_eventos = guardar_eventos(ticker, nombre_activo)
+        with instrumentacion.etapa('eventos', ticker) as medicion:
+            archivo_eventos = guardar_eventos(ticker, nombre_activo, eventos)
+            if archivo_eventos:
+                medicion.bytes = os.path.getsize(archivo_eventos)
         if archivo_eventos:
             print(f"Reporte de eventos guardado: {archivo_eventos}")
         
@@ -188,15 +285,33 @@ def procesar_activo(ticker, nombre_activo):
 # Configuración de activos a procesar
 activos = json.load(open('../../stock_symbols.json', 'r'))
 
-# Procesar cada activo
-for activo in activos:
-    print("\n" + "="*70)
-    print(f" Procesando {activo['nombre']} ".center(70, '#'))
-    completo, ajustes, eventos = procesar_activo(activo['ticker'], activo['nombre'])
-    print(f"\nResultados para {activo['nombre']}:")
-    print(f" - Datos completos: {completo}")
-    print(f" - Reporte ajustes: {ajustes}")
-    print(f" - Reporte eventos: {eventos}")
-    print("="*70 + "\n")
-
-print("Proceso completado".center(70, '='))
\ No newline at end of file
+# Descargar por lotes y procesar cada activo con su parte del lote
+for inicio in range(0, len(activos), TAMANO_LOTE):
+    lote = activos[inicio:inicio + TAMANO_LOTE]
+    datos_lote, eventos_lote = None, {}
+    for intento in range(REINTENTOS_LOTE + 1):
+        try:
+            datos_lote, eventos_lote = descargar_lote([activo['ticker'] for activo in lote])
+            break
+        except Exception as e:
+            print(f"Error descargando el lote {inicio // TAMANO_LOTE + 1} (intento {intento + 1}): {str(e)}")
+            if intento < REINTENTOS_LOTE:
+                time.sleep(10 * (intento + 1))
+    if datos_lote is None:
+        print("Se descargará cada activo del lote por separado")
+
+    for activo in lote:
+        print("\n" + "="*70)
+        print(f" Procesando {activo['nombre']} ".center(70, '#'))
+        completo, ajustes, eventos = procesar_activo(
+            activo['ticker'], activo['nombre'],
+            datos_activo(datos_lote, activo['ticker']), eventos_lote.get(activo['ticker'])
+        )
+        print(f"\nResultados para {activo['nombre']}:")
+        print(f" - Datos completos: {completo}")
+        print(f" - Reporte ajustes: {ajustes}")
+        print(f" - Reporte eventos: {eventos}")
+        print("="*70 + "\n")
+
+print("Proceso completado".center(70, '='))
+instrumentacion.guardar_reporte()
\ No newline at end of file
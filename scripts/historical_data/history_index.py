@@ -1,20 +1,31 @@
-import yfinance as yf
 import pandas as pd
 import os
 import psycopg2
 from datetime import datetime, time, timedelta
 import pytz
 import sys
+import argparse
+from time import sleep
+from psycopg2 import extras
 
 # Añadir la ruta del modulo de conexion manualmente
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from db_utils.db_connection import obtener_conexion
+from db_utils.db_connection import obtener_conexion, ConexionPersistente
+from db_utils.agregados import actualizar_agregados_indice
+from almacen.almacen_series import guardar_serie, leer_serie
+from almacen.calendario import obtener_calendario, proximo_cierre, BOLSA_TICKER
+from fuente_datos import cache_yfinance
+from instrumentacion.metricas import Instrumentacion
 TIPO_CONEXION = 'neon' # 'neon' o 'local'
 
-def get_index_data(symbol, specific_date=None):
-    """Obtiene los datos diarios del índice"""
+def get_index_data(symbol, specific_date=None, refresh=False):
+    """Obtiene los datos diarios del índice
+
+    Con specific_date solo se acepta la barra de esa sesión: si Yahoo todavía
+    sirve la anterior se devuelve None. refresh ignora la cache de yfinance
+    (los reintentos deben volver a la red).
+    """
     try:
-        ticker = yf.Ticker(symbol)
         ny_tz = pytz.timezone('America/New_York')
         now_ny = datetime.now(ny_tz)
         
@@ -23,25 +34,26 @@ def get_index_data(symbol, specific_date=None):
             yahoo_date = datetime.strptime(specific_date, '%m/%d/%Y').strftime('%Y-%m-%d')
             start_date = yahoo_date
             end_date = (datetime.strptime(yahoo_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
-            data = ticker.history(start=start_date, end=end_date)
+            data = cache_yfinance.historial(symbol, start=start_date, end=end_date, refrescar=refresh)
         else:
             # Determinar qué fecha necesitamos
-            if now_ny.time() < time(16, 0) and now_ny.weekday() <= 4:  # Antes de las 4 PM en día hábil
-                # Obtener datos del día hábil anterior
-                yesterday = now_ny - timedelta(days=1)
-                # Si ayer fue fin de semana, retroceder hasta el viernes
-                if yesterday.weekday() > 4:  # Sábado o domingo
-                    yesterday = yesterday - timedelta(days=(yesterday.weekday() - 4))
+            calendario = obtener_calendario('NYSE')
+            if now_ny.time() < time(16, 0) and calendario.es_sesion(now_ny.date()):  # Antes de las 4 PM en día de sesión
+                # Obtener datos de la sesión anterior (salta fines de semana y feriados)
+                yesterday = calendario.sesion_anterior(now_ny.date()).astype(datetime)
                 
                 start_date = yesterday.strftime('%Y-%m-%d')
                 end_date = (yesterday + timedelta(days=1)).strftime('%Y-%m-%d')
-                data = ticker.history(start=start_date, end=end_date)
+                data = cache_yfinance.historial(symbol, start=start_date, end=end_date, refrescar=refresh)
             else:
                 # Obtener datos del día actual (después del cierre)
-                data = ticker.history(period="1d")
+                data = cache_yfinance.historial(symbol, period="1d", refrescar=refresh)
         
         if data.empty:
             return None
+        if specific_date and data.index[-1].strftime('%m/%d/%Y') != specific_date:
+            print(f"Yahoo aún no publica la sesión {specific_date} de {symbol} (última: {data.index[-1]:%m/%d/%Y})")
+            return None
             
         # Convertir valores NumPy a Python nativo y redondear
         close_val = round(float(data['Close'].iloc[-1]), 2)
@@ -89,10 +101,35 @@ def save_to_csv(data, filename):
         print(f"Error al guardar datos: {e}")
         return False
 
+def save_to_store(data, symbol):
+    """Guarda el cierre en el almacén local compartido"""
+    try:
+        fecha = pd.to_datetime(data['Date'], format='%m/%d/%Y')
+        row = pd.DataFrame({
+            'apertura': [data['Open']],
+            'maximo': [data['High']],
+            'minimo': [data['Low']],
+            'cierre': [data['Close/Last']],
+            'cierre_ajustado': [data['Close/Last']],
+        }, index=[fecha])
+        guardar_serie(symbol, row)
+        print(f"Almacén local actualizado: {symbol} | {data['Date']}")
+        return True
+    except Exception as e:
+        print(f"Error al guardar en almacén local: {e}")
+        return False
+
 
-def save_to_database(data, index_name):
-    """Guarda datos en la base de datos Neon"""
-    conn = obtener_conexion(TIPO_CONEXION, "INDICE")
+def save_to_database(data, index_name, instrumentacion=None, conn=None):
+    """Guarda datos en la base de datos Neon
+
+    Si se pasa conn (conexión persistente del modo daemon) no se cierra al terminar.
+    """
+    propia = conn is None
+    if propia:
+        conn = obtener_conexion(TIPO_CONEXION, "INDICE")
+    if instrumentacion:
+        conn = instrumentacion.conexion(conn)
     if not conn:
         return False
     
@@ -121,11 +158,132 @@ def save_to_database(data, index_name):
                 float(data['High']),
                 float(data['Low'])
             ))
+            # Recalcular solo la semana, el mes y el año de esta fecha
+            actualizar_agregados_indice(cur, table, db_date, db_date)
         
         conn.commit()
         print(f"Datos guardados en DB: {index_name} | {data['Date']}")
         return True
     
+    except Exception as e:
+        print(f"Error guardando en DB: {e}")
+        if not propia and not conn.closed:
+            conn.rollback()
+        return False
+    finally:
+        if propia:
+            conn.close()
+
+def get_index_range(symbol, start_date, end_date):
+    """Obtiene todas las sesiones de un rango (MM/DD/AAAA, ambos incluidos) en una sola solicitud"""
+    try:
+        start = datetime.strptime(start_date, '%m/%d/%Y')
+        end = datetime.strptime(end_date, '%m/%d/%Y') + timedelta(days=1)
+        data = cache_yfinance.historial(symbol, start=start.strftime('%Y-%m-%d'), end=end.strftime('%Y-%m-%d'))
+        if data.empty:
+            return []
+        data = data.dropna(subset=['Close'])
+        return [
+            {
+                'Date': fecha.strftime('%m/%d/%Y'),
+                'Close/Last': round(float(fila['Close']), 2),
+                'Open': round(float(fila['Open']), 2),
+                'High': round(float(fila['High']), 2),
+                'Low': round(float(fila['Low']), 2)
+            }
+            for fecha, fila in data.iterrows()
+        ]
+    except Exception as e:
+        print(f"Error al obtener datos del rango: {e}")
+        return []
+
+def save_range_to_csv(rows, filename):
+    """Agrega al CSV las fechas que no existen, reescribiéndolo una sola vez
+
+    Se trabaja sobre las líneas de texto: el archivo mezcla filas con y sin
+    la columna Volume, que pandas no puede releer sin desalinearlas.
+    """
+    try:
+        lines = []
+        terminator = '\n'
+        if os.path.exists(filename):
+            # Se conserva el fin de línea del archivo (los de nasdaq.com usan CRLF)
+            with open(filename, 'r', newline='') as f:
+                raw = f.readlines()
+            if raw and raw[0].endswith('\r\n'):
+                terminator = '\r\n'
+            lines = [line.rstrip('\r\n') for line in raw if line.strip()]
+        header = lines[0] if lines else 'Date,Close/Last,Volume,Open,High,Low'
+        body = lines[1:]
+        existing = {line.split(',', 1)[0] for line in body}
+        new_lines = [
+            f"{row['Date']},{row['Close/Last']:.2f},{row['Open']:.2f},{row['High']:.2f},{row['Low']:.2f}"
+            for row in rows if row['Date'] not in existing
+        ]
+        if not new_lines:
+            print(f"No hay fechas nuevas para {filename}.")
+            return 0
+        # Los datos más recientes primero
+        body = sorted(body + new_lines, key=lambda line: datetime.strptime(line.split(',', 1)[0], '%m/%d/%Y'), reverse=True)
+        with open(filename, 'w', newline='') as f:
+            f.write(terminator.join([header] + body) + terminator)
+        print(f"Datos actualizados: {filename} | {len(new_lines)} fechas nuevas")
+        return len(new_lines)
+    except Exception as e:
+        print(f"Error al guardar datos: {e}")
+        return 0
+
+def save_range_to_store(rows, symbol):
+    """Guarda todas las sesiones del rango en el almacén local con una sola escritura"""
+    try:
+        fechas = pd.to_datetime([row['Date'] for row in rows], format='%m/%d/%Y')
+        datos = pd.DataFrame({
+            'apertura': [row['Open'] for row in rows],
+            'maximo': [row['High'] for row in rows],
+            'minimo': [row['Low'] for row in rows],
+            'cierre': [row['Close/Last'] for row in rows],
+            'cierre_ajustado': [row['Close/Last'] for row in rows],
+        }, index=fechas)
+        guardar_serie(symbol, datos)
+        print(f"Almacén local actualizado: {symbol} | {len(rows)} sesiones")
+        return True
+    except Exception as e:
+        print(f"Error al guardar en almacén local: {e}")
+        return False
+
+def save_range_to_database(rows, index_name, instrumentacion=None):
+    """Guarda todas las sesiones del rango en la base de datos con un solo upsert por lotes"""
+    conn = obtener_conexion(TIPO_CONEXION, "INDICE")
+    if instrumentacion:
+        conn = instrumentacion.conexion(conn)
+    if not conn:
+        return False
+    
+    try:
+        table = "sp500" if index_name == 'S&P 500' else "nasdaq"
+        values = [
+            (datetime.strptime(row['Date'], '%m/%d/%Y').strftime('%Y-%m-%d'),
+             float(row['Close/Last']), float(row['Open']), float(row['High']), float(row['Low']))
+            for row in rows
+        ]
+        with conn.cursor() as cur:
+            sql = f"""
+            INSERT INTO {table} (date, close_last, open, high, low)
+            VALUES %s
+            ON CONFLICT (date) DO UPDATE
+            SET close_last = EXCLUDED.close_last,
+                open = EXCLUDED.open,
+                high = EXCLUDED.high,
+                low = EXCLUDED.low
+            """
+            extras.execute_values(cur, sql, values, page_size=1000)
+            # Recalcular solo los periodos que tocan el rango
+            actualizar_agregados_indice(cur, table, min(v[0] for v in values), max(v[0] for v in values))
+        
+        conn.commit()
+        print(f"Datos guardados en DB: {index_name} | {len(values)} sesiones")
+        return True
+    
     except Exception as e:
         print(f"Error guardando en DB: {e}")
         return False
@@ -138,8 +296,8 @@ def should_run_auto():
         ny_tz = pytz.timezone('America/New_York')
         now_ny = datetime.now(ny_tz)
         
-        # Verificar si es día hábil (Lunes a Viernes)
-        if now_ny.weekday() > 4:  # Sábado y Domingo
+        # Verificar si hoy hubo sesión (fines de semana y feriados de NYSE no)
+        if not obtener_calendario('NYSE').es_sesion(now_ny.date()):
             return False
 
         # Verificar si la hora actual está después del cierre (4:00 PM ET)
@@ -160,18 +318,139 @@ CSV_FILES = {
     'NASDAQ-100': '../../data/HistoricalData_nasdaq.csv'
 }
 
-def update_indices(specific_date=None):
-    """Actualiza los índices para la fecha actual o específica"""
+def with_retries(function, *args, retries=4, delay=30, **kwargs):
+    """Reintenta function con espera exponencial (delay, 2*delay, ...) mientras devuelva None o False"""
+    for attempt in range(retries + 1):
+        result = function(*args, **kwargs)
+        if result is not None and result is not False:
+            return result
+        if attempt < retries:
+            wait = delay * 2 ** attempt
+            print(f"Reintentando en {wait} s ({attempt + 1}/{retries})...")
+            sleep(wait)
+    return result
+
+def update_indices(specific_date=None, conn=None, symbols=None, retries=0):
+    """Actualiza los índices para la fecha actual o específica
+
+    Args:
+        specific_date: fecha MM/DD/AAAA (la última sesión si no se indica)
+        conn: conexión persistente a reutilizar (se abre una por guardado si no se indica)
+        symbols: símbolos de INDEX_SYMBOLS a actualizar (todos si no se indica)
+        retries: reintentos con espera exponencial de la descarga y del guardado en DB;
+            con reintentos la descarga siempre va a la red, sin pasar por la cache
+    """
+    instrumentacion = Instrumentacion('history_index')
     for name, symbol in INDEX_SYMBOLS.items():
+        if symbols and symbol not in symbols:
+            continue
         print(f"\nObteniendo {name}....")
-        data = get_index_data(symbol, specific_date)
+        with instrumentacion.etapa('fetch', symbol) as medicion:
+            data = with_retries(get_index_data, symbol, specific_date, retries > 0, retries=retries)
+            medicion.filas = 1 if data else 0
         
         if data:
             print(f"Datos obtenidos: {data['Date']} | Cierre: {data['Close/Last']}")
-            save_to_csv(data, CSV_FILES[name])
-            save_to_database(data, name)
+            with instrumentacion.etapa('csv', symbol) as medicion:
+                if save_to_csv(data, CSV_FILES[name]):
+                    # save_to_csv reescribe el archivo completo
+                    medicion.filas = 1
+                    medicion.bytes = os.path.getsize(CSV_FILES[name])
+            with instrumentacion.etapa('almacen', symbol) as medicion:
+                medicion.filas = 1 if save_to_store(data, symbol) else 0
+            with instrumentacion.etapa('db_upsert', symbol) as medicion:
+                if conn is not None:
+                    saved = with_retries(lambda: save_to_database(data, name, instrumentacion, conn.obtener()), retries=retries)
+                else:
+                    saved = with_retries(save_to_database, data, name, instrumentacion, retries=retries)
+                medicion.filas = 1 if saved else 0
         else:
             print(f"No se pudieron obtener datos para {name}.")
+    instrumentacion.guardar_reporte()
+
+def daemon(margin_minutes=15, retries=4):
+    """Proceso residente: despierta en cada cierre de bolsa y actualiza sus símbolos
+
+    Cada símbolo se agrupa por la bolsa donde cotiza (almacen.calendario); el
+    proceso duerme hasta el cierre más próximo más margin_minutes y actualiza
+    solo los símbolos de esa bolsa, reintentando hasta que Yahoo publique la
+    barra de esa sesión. La conexión a la base de datos y la sesión
+    HTTP de yfinance se conservan entre ejecuciones: pandas, yfinance y el
+    saludo TLS se cargan una sola vez.
+    """
+    exchanges = {}
+    for symbol in INDEX_SYMBOLS.values():
+        exchanges.setdefault(BOLSA_TICKER.get(symbol, 'NYSE'), []).append(symbol)
+    conn = ConexionPersistente(TIPO_CONEXION, "INDICE")
+    margin = timedelta(minutes=margin_minutes)
+    try:
+        while True:
+            now = datetime.now(pytz.utc)
+            # Cierre más reciente ya pasado (más el margen) de cada bolsa: el siguiente después de now - margen
+            closes = {exchange: proximo_cierre(exchange, now - margin) for exchange in exchanges}
+            exchange = min(closes, key=closes.get)
+            wake_up = closes[exchange] + margin
+            print(f"\nPróxima ejecución: {exchange} {wake_up.astimezone(pytz.timezone('America/New_York')):%m/%d/%Y %H:%M} (hora de Nueva York)")
+            # Se duerme en tramos para tolerar suspensiones del equipo y cambios de reloj
+            while True:
+                remaining = (wake_up - datetime.now(pytz.utc)).total_seconds()
+                if remaining <= 0:
+                    break
+                sleep(min(remaining, 3600))
+            # Solo se acepta la barra de la sesión que acaba de cerrar, no la anterior
+            session = closes[exchange].strftime('%m/%d/%Y')
+            print(f"\nCierre de {exchange} ({session}): actualizando {', '.join(exchanges[exchange])}")
+            update_indices(session, conn=conn, symbols=exchanges[exchange], retries=retries)
+    except KeyboardInterrupt:
+        print("\nDeteniendo el modo daemon...")
+    finally:
+        conn.cerrar()
+
+def missing_range(symbol, start_date, end_date):
+    """Reduce el rango a la primera y última sesión que faltan en el almacén local (None si no falta ninguna)"""
+    start = datetime.strptime(start_date, '%m/%d/%Y')
+    end = datetime.strptime(end_date, '%m/%d/%Y')
+    fechas = leer_serie(symbol, start, end, ['cierre']).index.to_numpy(dtype='datetime64[D]')
+    faltantes = obtener_calendario('NYSE').sesiones_faltantes(fechas, start, end)
+    if len(faltantes) == 0:
+        return None
+    return faltantes[0].astype(datetime).strftime('%m/%d/%Y'), faltantes[-1].astype(datetime).strftime('%m/%d/%Y')
+
+def backfill(start_date, end_date, symbols=None, only_missing=False):
+    """Rellena un rango de fechas: una solicitud, una escritura de CSV y un upsert por símbolo
+
+    Args:
+        start_date, end_date: rango en formato MM/DD/AAAA (ambos incluidos)
+        symbols: símbolos de INDEX_SYMBOLS a rellenar (todos si no se indica)
+        only_missing: limita el rango a las sesiones que faltan en el almacén local
+    """
+    instrumentacion = Instrumentacion('history_index_backfill')
+    for name, symbol in INDEX_SYMBOLS.items():
+        if symbols and symbol not in symbols:
+            continue
+        start, end = start_date, end_date
+        if only_missing:
+            rango = missing_range(symbol, start_date, end_date)
+            if rango is None:
+                print(f"\n{name}: no faltan sesiones entre {start_date} y {end_date}")
+                continue
+            start, end = rango
+        print(f"\nRellenando {name} de {start} a {end}....")
+        with instrumentacion.etapa('fetch', symbol) as medicion:
+            rows = get_index_range(symbol, start, end)
+            medicion.filas = len(rows)
+        if not rows:
+            print(f"No se pudieron obtener datos para {name}.")
+            continue
+        with instrumentacion.etapa('csv', symbol) as medicion:
+            medicion.filas = save_range_to_csv(rows, CSV_FILES[name])
+            if medicion.filas:
+                medicion.bytes = os.path.getsize(CSV_FILES[name])
+        with instrumentacion.etapa('almacen', symbol) as medicion:
+            medicion.filas = len(rows) if save_range_to_store(rows, symbol) else 0
+        with instrumentacion.etapa('db_upsert', symbol) as medicion:
+            medicion.filas = len(rows) if save_range_to_database(rows, name, instrumentacion) else 0
+    instrumentacion.guardar_reporte()
 
 def main(auto_mode=True, specific_date=None):
     if specific_date:
@@ -223,5 +502,22 @@ def display_menu():
         input("\nPresione Enter para continuar...")
 
 if __name__ == "__main__":
-    # Siempre mostrar el menú principal
-    display_menu()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Actualización de índices bursátiles")
+    parser.add_argument('--backfill', nargs=2, metavar=('DESDE', 'HASTA'),
+                        help="rellena el rango MM/DD/AAAA MM/DD/AAAA sin pasar por el menú")
+    parser.add_argument('--symbols', nargs='+', choices=list(INDEX_SYMBOLS.values()),
+                        help="símbolos a rellenar (todos por defecto)")
+    parser.add_argument('--faltantes', action='store_true',
+                        help="solo las sesiones que faltan en el almacén local")
+    parser.add_argument('--daemon', action='store_true',
+                        help="proceso residente que actualiza los índices después de cada cierre")
+    parser.add_argument('--margen', type=int, default=15,
+                        help="minutos después del cierre para actualizar en modo daemon (15 por defecto)")
+    args = parser.parse_args()
+    if args.daemon:
+        daemon(args.margen)
+    elif args.backfill:
+        backfill(args.backfill[0], args.backfill[1], args.symbols, args.faltantes)
+    else:
+        # Sin argumentos se muestra el menú principal
+        display_menu()
\ No newline at end of file
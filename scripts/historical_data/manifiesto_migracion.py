@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+from datetime import datetime
+
+# Añadir la ruta del almacén local manualmente
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from almacen.almacen_series import RAIZ_REPO
+
+# ==============================================================
+# Avance de las migraciones por unidad (activo, archivo) en disco
+# ==============================================================
+# Cada unidad guarda la huella de su origen, las filas ya confirmadas en la
+# base de datos y si terminó. Se escribe después de cada commit: si el proceso
+# se corta entre el commit y la escritura, al reanudar se repite a lo sumo un
+# bloque, y los upserts hacen que repetirlo no cambie nada.
+RUTA_MANIFIESTOS = os.getenv("MIGRACION_MANIFIESTO_DIR", os.path.join(RAIZ_REPO, 'data', 'migraciones'))
+
+# Filas por transacción en las cargas masivas
+TAMANO_BLOQUE = 5000
+
+
+def huella_archivo(ruta):
+    """Identificador del contenido de un archivo (cambia si se vuelve a escribir)"""
+    if not os.path.exists(ruta):
+        return None
+    estado = os.stat(ruta)
+    return f"{estado.st_mtime_ns:x}-{estado.st_size:x}"
+
+
+class ManifiestoMigracion:
+    """Archivo JSON con el avance de una migración: <RUTA_MANIFIESTOS>/<nombre>.json"""
+
+    def __init__(self, nombre, reiniciar=False, carpeta=RUTA_MANIFIESTOS):
+        self.ruta = os.path.join(carpeta, f"{nombre}.json")
+        self.unidades = {}
+        if reiniciar and os.path.exists(self.ruta):
+            os.remove(self.ruta)
+        elif os.path.exists(self.ruta):
+            with open(self.ruta, 'r') as f:
+                self.unidades = json.load(f).get('unidades', {})
+
+    def _vigente(self, clave, huella):
+        unidad = self.unidades.get(clave)
+        # Si el origen cambió, la unidad se migra de nuevo desde el principio
+        return unidad if unidad is not None and unidad.get('huella') == huella else None
+
+    def completo(self, clave, huella=None):
+        unidad = self._vigente(clave, huella)
+        return bool(unidad and unidad.get('completo'))
+
+    def avance(self, clave, huella=None):
+        """Filas de la unidad ya confirmadas en la base de datos (0 si no hay avance vigente)"""
+        unidad = self._vigente(clave, huella)
+        return unidad.get('filas', 0) if unidad else 0
+
+    def registrar(self, clave, huella=None, filas=0, completo=False):
+        """Guarda el avance de una unidad; llamar después del commit correspondiente"""
+        self.unidades[clave] = {
+            'huella': huella,
+            'filas': int(filas),
+            'completo': completo,
+            'actualizado': datetime.now().isoformat(timespec='seconds')
+        }
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        temporal = self.ruta + '.tmp'
+        with open(temporal, 'w') as f:
+            json.dump({'unidades': self.unidades}, f, indent=2)
+        os.replace(temporal, self.ruta)
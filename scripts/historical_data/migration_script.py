@@ -1,13 +1,47 @@
 import pandas as pd
 import psycopg2
+from psycopg2 import extras
 import os
-from datetime import datetime
+import sys
+import argparse
 from dotenv import load_dotenv
 
+# Añadir la ruta del almacén local manualmente
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from almacen.almacen_series import existe_serie, leer_serie, version_serie
+from instrumentacion.metricas import Instrumentacion
+from db_utils.agregados import actualizar_agregados_indice
+from manifiesto_migracion import ManifiestoMigracion, TAMANO_BLOQUE, huella_archivo
+
 load_dotenv()
 
-def migrate_csv_to_db():
-    """Migra todos los datos históricos de CSV a Neon DB"""
+# Ticker de cada tabla en el almacén local
+TICKERS_TABLA = {
+    'nasdaq': '^NDX',
+    'sp500': '^SPX'
+}
+
+def leer_desde_almacen(ticker):
+    """Lee la serie del almacén con las columnas que espera la migración"""
+    serie = leer_serie(ticker, columnas=['cierre', 'apertura', 'maximo', 'minimo'])
+    return pd.DataFrame({
+        'date': serie.index.strftime('%m/%d/%Y'),
+        'close_last': serie['cierre'].to_numpy(),
+        'open': serie['apertura'].to_numpy(),
+        'high': serie['maximo'].to_numpy(),
+        'low': serie['minimo'].to_numpy()
+    })
+
+def migrate_csv_to_db(reiniciar=False, tamano_bloque=TAMANO_BLOQUE):
+    """Migra todos los datos históricos de CSV a Neon DB
+
+    Cada archivo (o serie del almacén) se inserta en bloques de tamano_bloque
+    filas con un commit por bloque. El avance queda en un manifiesto local:
+    si la migración se interrumpe, la siguiente ejecución salta los archivos
+    terminados y continúa desde el último bloque confirmado.
+    """
+    instrumentacion = Instrumentacion('migracion_indices')
+    manifiesto = ManifiestoMigracion('migracion_indices', reiniciar=reiniciar)
     # Tablas y archivos
     tables = {
         'nasdaq': [
@@ -22,14 +56,24 @@ def migrate_csv_to_db():
     
     try:
         # Conectar a Neon
-        conn = psycopg2.connect(os.getenv("NEON_DB_URL"))
+        conn = instrumentacion.conexion(psycopg2.connect(os.getenv("NEON_DB_URL")))
         cur = conn.cursor()
         
         for table, filenames in tables.items():
-            for filename in filenames:
-                if os.path.exists(filename):
-                    # Leer CSV con estructura limpia
-                    df = pd.read_csv(filename)
+            ticker = TICKERS_TABLA[table]
+            # Si el almacén local tiene la serie, se migra desde ahí en lugar de los CSV
+            origenes = [ticker] if existe_serie(ticker) else filenames
+            for filename in origenes:
+                if filename == ticker or os.path.exists(filename):
+                    clave = f"{table}/{os.path.basename(filename)}"
+                    huella = version_serie(ticker) if filename == ticker else huella_archivo(filename)
+                    if manifiesto.completo(clave, huella):
+                        print(f"{filename} ya migrado a {table}")
+                        continue
+                    with instrumentacion.etapa('lectura', table) as medicion:
+                        # Leer CSV con estructura limpia (o la serie del almacén)
+                        df = leer_desde_almacen(ticker) if filename == ticker else pd.read_csv(filename)
+                        medicion.filas = len(df)
                     
                     print(f"Migrando {len(df)} registros de {filename} a {table}...")
                     
@@ -48,49 +92,54 @@ def migrate_csv_to_db():
                     required_columns = ['date', 'close_last', 'open', 'high', 'low']
                     df = df[required_columns]
                     
-                    # Insertar datos
-                    for _, row in df.iterrows():
-                        try:
-                            # Convertir fecha a formato PostgreSQL (YYYY-MM-DD)
-                            db_date = datetime.strptime(row['date'], '%m/%d/%Y').strftime('%Y-%m-%d')
-                            
-                            insert_sql = f"""
-                            INSERT INTO {table} (date, close_last, open, high, low)
-                            VALUES (%s, %s, %s, %s, %s)
-                            ON CONFLICT (date) DO UPDATE
-                            SET close_last = EXCLUDED.close_last,
-                                open = EXCLUDED.open,
-                                high = EXCLUDED.high,
-                                low = EXCLUDED.low
-                            """
-                            
-                            # Manejar valores faltantes (reemplazar NaN con 0.0)
-                            close_val = float(row['close_last']) if pd.notna(row['close_last']) else 0.0
-                            open_val = float(row['open']) if pd.notna(row['open']) else 0.0
-                            high_val = float(row['high']) if pd.notna(row['high']) else 0.0
-                            low_val = float(row['low']) if pd.notna(row['low']) else 0.0
-                            
-                            cur.execute(insert_sql, (
-                                db_date,
-                                close_val,
-                                open_val,
-                                high_val,
-                                low_val
-                            ))
-                        except ValueError as e:
-                            print(f"Error de valor en fila: {row} - {str(e)}")
-                            continue
-                        except Exception as e:
-                            print(f"Error insertando {row.get('date', 'fecha desconocida')}: {str(e)}")
-                            continue
+                    # Convertir fecha a formato PostgreSQL (YYYY-MM-DD); las fechas inválidas se descartan
+                    fechas = pd.to_datetime(df['date'], format='%m/%d/%Y', errors='coerce')
+                    invalidas = int(fechas.isna().sum())
+                    if invalidas:
+                        print(f"Se descartan {invalidas} filas con fecha inválida en {filename}")
+                    # Manejar valores faltantes (reemplazar NaN con 0.0)
+                    valores = df[['close_last', 'open', 'high', 'low']].apply(pd.to_numeric, errors='coerce').fillna(0.0)
+                    validas = fechas.notna().to_numpy()
+                    filas = list(zip(
+                        fechas[validas].dt.strftime('%Y-%m-%d'),
+                        *(valores[c].to_numpy()[validas].tolist() for c in valores.columns)
+                    ))
+
+                    insert_sql = f"""
+                    INSERT INTO {table} (date, close_last, open, high, low)
+                    VALUES %s
+                    ON CONFLICT (date) DO UPDATE
+                    SET close_last = EXCLUDED.close_last,
+                        open = EXCLUDED.open,
+                        high = EXCLUDED.high,
+                        low = EXCLUDED.low
+                    """
+
+                    # Insertar datos en bloques, un commit por bloque
+                    inicio = manifiesto.avance(clave, huella)
+                    if inicio:
+                        print(f"Reanudando {filename} desde la fila {inicio}")
+                    for desde in range(inicio, len(filas), tamano_bloque):
+                        bloque = filas[desde:desde + tamano_bloque]
+                        with instrumentacion.etapa('db_upsert', table) as medicion:
+                            extras.execute_values(cur, insert_sql, bloque, page_size=1000)
+                            medicion.filas = len(bloque)
+                        with instrumentacion.etapa('agregados', table):
+                            # Mismo commit que el bloque: los agregados nunca quedan atrás de los datos diarios
+                            fechas_bloque = [fila[0] for fila in bloque]
+                            actualizar_agregados_indice(cur, table, min(fechas_bloque), max(fechas_bloque))
+                        conn.commit()
+                        manifiesto.registrar(clave, huella, desde + len(bloque))
+                    manifiesto.registrar(clave, huella, len(filas), completo=True)
                     
                     print(f"{table} migrado exitosamente desde {filename}")
         
-        conn.commit()
         print("Migración completa!")
+        instrumentacion.guardar_reporte()
     
     except Exception as e:
         print(f"Error en migración: {str(e)}")
+        print("Vuelva a ejecutar el script para continuar desde el último bloque confirmado")
     finally:
         if 'cur' in locals():
             cur.close()
@@ -98,4 +147,10 @@ def migrate_csv_to_db():
             conn.close()
 
 if __name__ == "__main__":
-    migrate_csv_to_db()
+    parser = argparse.ArgumentParser(description="Migración de los índices a la base de datos")
+    parser.add_argument('--reiniciar', action='store_true',
+                        help="ignora el avance guardado y migra todo desde el principio")
+    parser.add_argument('--bloque', type=int, default=TAMANO_BLOQUE,
+                        help=f"filas por transacción ({TAMANO_BLOQUE} por defecto)")
+    args = parser.parse_args()
+    migrate_csv_to_db(args.reiniciar, args.bloque)
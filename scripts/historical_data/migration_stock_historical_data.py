@@ -3,14 +3,21 @@ import pandas as pd
 import os
 import sys
 import json
+import argparse
 # Añadir la ruta del modulo de conexion manualmente
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from db_utils.db_connection import obtener_conexion
+from db_utils.agregados import actualizar_agregados_activo
+from almacen.almacen_series import existe_serie, leer_serie, version_serie
+from instrumentacion.metricas import Instrumentacion
+from manifiesto_migracion import ManifiestoMigracion, TAMANO_BLOQUE, huella_archivo
 
 # Cargar Tipo de conexión de base de datos
 TIPO_CONEXION = "local" # 'local' o 'neon'
+# Tiempos, filas y viajes a la base de datos por etapa y activo
+instrumentacion = Instrumentacion('migracion_historicos')
 # Conectar a la base de datos
-conn = obtener_conexion(TIPO_CONEXION, "HISTORICAL")
+conn = instrumentacion.conexion(obtener_conexion(TIPO_CONEXION, "HISTORICAL"))
 
 def cargar_activos(conn, activos):
     """Carga los activos en la base de datos"""
@@ -40,8 +47,12 @@ def cargar_activos(conn, activos):
         print(f"❌ Error cargando activos: {e}")
         return False
 
-def cargar_eventos(conn, activos):
-    """Carga los eventos desde archivos CSV a la base de datos"""
+def cargar_eventos(conn, activos, manifiesto):
+    """Carga los eventos desde archivos CSV a la base de datos
+
+    Cada activo se confirma por separado; los activos cuyo archivo de eventos
+    ya se cargó sin cambios desde entonces se saltan.
+    """
     try:
         cur = conn.cursor()
         for activo in activos:
@@ -63,6 +74,12 @@ def cargar_eventos(conn, activos):
                 key=os.path.getmtime
             )
             
+            clave = f"eventos/{activo['ticker']}"
+            huella = huella_archivo(archivo_reciente)
+            if manifiesto.completo(clave, huella):
+                print(f"⏭️ Eventos de {activo['nombre']} ya cargados")
+                continue
+
             # Verificar tamaño después de tener archivo_reciente
             if os.path.getsize(archivo_reciente) == 0:
                 print(f"ℹ️ Archivo vacío para eventos de {activo['nombre']}")
@@ -95,12 +112,15 @@ def cargar_eventos(conn, activos):
                         row['Evento'],
                         row['Tipo']
                     ))
+                conn.commit()
+                manifiesto.registrar(clave, huella, len(df), completo=True)
                     
             except Exception as e:
                 print(f"❌ Error procesando eventos para {activo['nombre']}: {e}")
+                # Solo se pierde el activo en curso: los anteriores ya se confirmaron
+                conn.rollback()
                 continue
         
-        conn.commit()
         print("✅ Eventos cargados exitosamente")
         return True
     except Exception as e:
@@ -108,90 +128,140 @@ def cargar_eventos(conn, activos):
         print(f"❌ Error cargando eventos: {e}")
         return False
 
-from psycopg2 import extras  # Añadir al inicio del script
+def archivo_datos_csv(activo):
+    """Ruta del archivo Datos_Completos más reciente de un activo (None si no hay)"""
+    carpeta = f"./datos/{activo['nombre']}/datos_completos"
+    if not os.path.exists(carpeta):
+        print(f"⚠️ Carpeta no encontrada para datos: {carpeta}")
+        return None
+    
+    # Buscar archivo más reciente
+    archivos = [f for f in os.listdir(carpeta) 
+            if f.startswith('Datos_Completos') and f.endswith('.csv')]
+    if not archivos:
+        print(f"ℹ️ No se encontraron datos para {activo['nombre']}")
+        return None
+    
+    return max(
+        [os.path.join(carpeta, f) for f in archivos],
+        key=os.path.getmtime
+    )
+
+def leer_datos_csv(activo):
+    """Lee y normaliza el archivo Datos_Completos más reciente de un activo"""
+    archivo_reciente = archivo_datos_csv(activo)
+    if archivo_reciente is None:
+        return None
+    
+    # Leer y procesar datos
+    df = pd.read_csv(archivo_reciente)
+    if df.empty:
+        print(f"ℹ️ DataFrame vacío para datos de {activo['nombre']}")
+        return None
+    
+    # Normalizar nombres de columnas
+    df.columns = df.columns.str.lower().str.replace(' ', '_')
+    
+    # Buscar columna de fecha
+    fecha_col = next((col for col in df.columns if 'fecha' in col or 'date' in col), None)
+    if not fecha_col:
+        print(f"❌ Columna de fecha no encontrada en {archivo_reciente}")
+        return None
+    
+    # Mapeo de columnas
+    col_map = {
+        'open': next((c for c in df.columns if 'open' in c), None),
+        'high': next((c for c in df.columns if 'high' in c), None),
+        'low': next((c for c in df.columns if 'low' in c), None),
+        'close': next((c for c in df.columns if 'close' in c), None),
+        'adj_close': next((c for c in df.columns if 'adj_close' in c or 'ajustado' in c), None),
+        'volume': next((c for c in df.columns if 'volume' in c or 'volumen' in c), None)
+    }
+    
+    # Crear DataFrame limpio
+    df_clean = pd.DataFrame({
+        'fecha': pd.to_datetime(df[fecha_col], errors='coerce'),
+        'open': df[col_map['open']] if col_map['open'] else None,
+        'high': df[col_map['high']] if col_map['high'] else None,
+        'low': df[col_map['low']] if col_map['low'] else None,
+        'close': df[col_map['close']] if col_map['close'] else None,
+        'adj_close': df[col_map['adj_close']] if col_map['adj_close'] else None,
+        'volume': df[col_map['volume']] if col_map['volume'] else None
+    })
+    
+    # Filtrar fechas inválidas
+    df_clean = df_clean.dropna(subset=['fecha'])
+    df_clean['fecha'] = df_clean['fecha'].dt.date
+    
+    # Convertir volumen a Int64 (permite enteros y NaN)
+    if 'volume' in df_clean.columns:
+        df_clean['volume'] = pd.to_numeric(df_clean['volume'], errors='coerce').astype(pd.Int64Dtype())
+    
+    return df_clean
+
+def leer_datos_almacen(activo):
+    """Lee los datos de un activo desde el almacén local con el formato de carga"""
+    serie = leer_serie(activo['ticker'])
+    if serie.empty:
+        print(f"ℹ️ Serie vacía en almacén para {activo['nombre']}")
+        return None
+    return pd.DataFrame({
+        'fecha': serie.index.date,
+        'open': serie['apertura'].to_numpy(),
+        'high': serie['maximo'].to_numpy(),
+        'low': serie['minimo'].to_numpy(),
+        'close': serie['cierre'].to_numpy(),
+        'adj_close': serie['cierre_ajustado'].to_numpy(),
+        # psycopg2 no adapta pd.NA: los volúmenes faltantes se envían como NULL
+        'volume': serie['volumen'].astype(object).where(serie['volumen'].notna(), None).to_numpy()
+    })
+
 
-def cargar_datos_historicos(conn, activos):
-    """Carga los datos históricos a la base de datos de manera optimizada"""
+def cargar_datos_historicos(conn, activos, manifiesto, tamano_bloque=TAMANO_BLOQUE):
+    """Carga los datos históricos a la base de datos de manera optimizada
+
+    Cada activo se carga en bloques de tamano_bloque filas, con un commit por
+    bloque; el manifiesto guarda las filas confirmadas, así que una ejecución
+    interrumpida continúa desde el último bloque confirmado del activo en curso
+    y salta los activos terminados (mientras su origen no cambie).
+    """
     try:
         cur = conn.cursor()
         for activo in activos:
             try:
-                carpeta = f"./datos/{activo['nombre']}/datos_completos"
-                if not os.path.exists(carpeta):
-                    print(f"⚠️ Carpeta no encontrada para datos: {carpeta}")
-                    continue
-                
-                # Buscar archivo más reciente
-                archivos = [f for f in os.listdir(carpeta) 
-                        if f.startswith('Datos_Completos') and f.endswith('.csv')]
-                if not archivos:
-                    print(f"ℹ️ No se encontraron datos para {activo['nombre']}")
+                # El almacén local es la fuente principal; el CSV queda como respaldo
+                desde_almacen = existe_serie(activo['ticker'])
+                clave = f"historicos/{activo['ticker']}"
+                huella = version_serie(activo['ticker']) if desde_almacen else huella_archivo(archivo_datos_csv(activo) or '')
+                if manifiesto.completo(clave, huella):
+                    print(f"⏭️ {activo['nombre']} ya cargado")
                     continue
-                
-                archivo_reciente = max(
-                    [os.path.join(carpeta, f) for f in archivos],
-                    key=os.path.getmtime
-                )
-                
-                # Leer y procesar datos
-                df = pd.read_csv(archivo_reciente)
-                if df.empty:
-                    print(f"ℹ️ DataFrame vacío para datos de {activo['nombre']}")
-                    continue
-                
-                # Normalizar nombres de columnas
-                df.columns = df.columns.str.lower().str.replace(' ', '_')
-                
-                # Buscar columna de fecha
-                fecha_col = next((col for col in df.columns if 'fecha' in col or 'date' in col), None)
-                if not fecha_col:
-                    print(f"❌ Columna de fecha no encontrada en {archivo_reciente}")
+                with instrumentacion.etapa('lectura', activo['ticker']) as medicion:
+                    if desde_almacen:
+                        df_clean = leer_datos_almacen(activo)
+                    else:
+                        df_clean = leer_datos_csv(activo)
+                    medicion.filas = 0 if df_clean is None else len(df_clean)
+                if df_clean is None:
                     continue
                 
-                # Mapeo de columnas
-                col_map = {
-                    'open': next((c for c in df.columns if 'open' in c), None),
-                    'high': next((c for c in df.columns if 'high' in c), None),
-                    'low': next((c for c in df.columns if 'low' in c), None),
-                    'close': next((c for c in df.columns if 'close' in c), None),
-                    'adj_close': next((c for c in df.columns if 'adj_close' in c or 'ajustado' in c), None),
-                    'volume': next((c for c in df.columns if 'volume' in c or 'volumen' in c), None)
-                }
-                
-                # Crear DataFrame limpio
-                df_clean = pd.DataFrame({
-                    'fecha': pd.to_datetime(df[fecha_col], errors='coerce'),
-                    'open': df[col_map['open']] if col_map['open'] else None,
-                    'high': df[col_map['high']] if col_map['high'] else None,
-                    'low': df[col_map['low']] if col_map['low'] else None,
-                    'close': df[col_map['close']] if col_map['close'] else None,
-                    'adj_close': df[col_map['adj_close']] if col_map['adj_close'] else None,
-                    'volume': df[col_map['volume']] if col_map['volume'] else None
-                })
-                
-                # Filtrar fechas inválidas
-                df_clean = df_clean.dropna(subset=['fecha'])
-                df_clean['fecha'] = df_clean['fecha'].dt.date
-                
-                # Convertir volumen a Int64 (permite enteros y NaN)
-                if 'volume' in df_clean.columns:
-                    df_clean['volume'] = pd.to_numeric(df_clean['volume'], errors='coerce').astype(pd.Int64Dtype())
-                
                 # Preparar datos para inserción masiva
-                data_tuples = [
-                    (
-                        activo['id'],
-                        activo['ticker'],
-                        row['fecha'],
-                        row['open'],
-                        row['high'],
-                        row['low'],
-                        row['close'],
-                        row['adj_close'],
-                        row['volume'] if 'volume' in df_clean.columns else None
-                    )
-                    for _, row in df_clean.iterrows()
-                ]
+                with instrumentacion.etapa('limpieza', activo['ticker']) as medicion:
+                    data_tuples = [
+                        (
+                            activo['id'],
+                            activo['ticker'],
+                            row['fecha'],
+                            row['open'],
+                            row['high'],
+                            row['low'],
+                            row['close'],
+                            row['adj_close'],
+                            row['volume'] if 'volume' in df_clean.columns else None
+                        )
+                        for _, row in df_clean.iterrows()
+                    ]
+                    medicion.filas = len(data_tuples)
                 
                 if not data_tuples:
                     print(f"ℹ️ No hay datos válidos para {activo['nombre']}")
@@ -213,19 +283,33 @@ def cargar_datos_historicos(conn, activos):
                         cierre_ajustado = EXCLUDED.cierre_ajustado,
                         volumen = EXCLUDED.volumen
                 """
-                extras.execute_values(
-                    cur,
-                    query,
-                    data_tuples,
-                    page_size=50  # Ajustar según necesidades
-                )
+                inicio = manifiesto.avance(clave, huella)
+                if inicio:
+                    print(f"↪️ Reanudando {activo['nombre']} desde la fila {inicio}")
+                for desde in range(inicio, len(data_tuples), tamano_bloque):
+                    bloque = data_tuples[desde:desde + tamano_bloque]
+                    with instrumentacion.etapa('db_upsert', activo['ticker']) as medicion:
+                        extras.execute_values(
+                            cur,
+                            query,
+                            bloque,
+                            page_size=1000
+                        )
+                        conn.commit()
+                        medicion.filas = len(bloque)
+                    manifiesto.registrar(clave, huella, desde + len(bloque))
+                with instrumentacion.etapa('agregados', activo['ticker']):
+                    # Solo los periodos que contienen las fechas cargadas
+                    actualizar_agregados_activo(cur, activo['id'], df_clean['fecha'].min(), df_clean['fecha'].max())
+                    conn.commit()
+                manifiesto.registrar(clave, huella, len(data_tuples), completo=True)
                 print(f"✅ Datos cargados para {activo['nombre']} - {len(data_tuples)} registros")
                 
             except Exception as e:
                 print(f"❌ Error procesando {activo['nombre']}: {e}")
+                # Solo se pierde el bloque en curso: los anteriores ya se confirmaron
                 conn.rollback()
         
-        conn.commit()
         print("✅ Datos históricos cargados exitosamente")
         return True
         
@@ -235,6 +319,15 @@ def cargar_datos_historicos(conn, activos):
         return False
     
 
+parser = argparse.ArgumentParser(description="Migración de activos, eventos y datos históricos")
+parser.add_argument('--reiniciar', action='store_true',
+                    help="ignora el avance guardado y migra todo desde el principio")
+parser.add_argument('--bloque', type=int, default=TAMANO_BLOQUE,
+                    help=f"filas por transacción ({TAMANO_BLOQUE} por defecto)")
+args = parser.parse_args()
+# Avance por activo: una ejecución interrumpida se reanuda donde quedó
+manifiesto = ManifiestoMigracion('migracion_historicos', reiniciar=args.reiniciar)
+
 # Cargar configuración de activos
 try:
     with open('../../stock_symbols.json', 'r') as f:
@@ -253,12 +346,16 @@ print("="*70 + "\n")
 if conn:
     try:
         # Paso 1: Cargar activos
-        if cargar_activos(conn, activos):
+        with instrumentacion.etapa('activos') as medicion:
+            activos_cargados = cargar_activos(conn, activos)
+            medicion.filas = len(activos) if activos_cargados else 0
+        if activos_cargados:
             # Paso 2: Cargar eventos
-            cargar_eventos(conn, activos)
+            with instrumentacion.etapa('eventos'):
+                cargar_eventos(conn, activos, manifiesto)
             
             # Paso 3: Cargar datos históricos
-            cargar_datos_historicos(conn, activos)
+            cargar_datos_historicos(conn, activos, manifiesto, args.bloque)
         else:
             print("⛔ Abortando por error en activos")
         
@@ -267,6 +364,7 @@ if conn:
     finally:
         conn.close()
         print("🔌 Conexión cerrada")
+        instrumentacion.guardar_reporte()
 else:
     print("⛔ No se pudo conectar a la base de datos. Abortando.")
 
@@ -0,0 +1,246 @@
+import os
+import sys
+import csv
+import json
+import heapq
+import argparse
+from collections import namedtuple
+
+# Añadir la ruta del almacén local manualmente
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from almacen.almacen_series import RAIZ_REPO, INDICES, leer_cierres
+from fuente_datos import cache_yfinance
+
+# ==============================================================
+# Seguimiento intradía de caídas desde el máximo (O(1) por precio)
+# ==============================================================
+UMBRALES = (5, 10, 15, 20)
+
+# Estado entre ejecuciones: umbrales ya avisados y último instante procesado por activo
+RUTA_ESTADO = os.getenv("MONITOR_CAIDAS_ESTADO", os.path.join(RAIZ_REPO, 'data', 'monitor_caidas', 'estado.json'))
+
+EventoCaida = namedtuple('EventoCaida', ['ticker', 'instante', 'tipo', 'umbral', 'precio', 'maximo', 'caida'])
+
+
+class EstadoActivo:
+    """Máximo, mínimo y umbrales cruzados de un activo"""
+    __slots__ = ('maximo', 'instante_maximo', 'minimo', 'siguiente', 'niveles', 'ultimo', 'instante')
+
+    def __init__(self, maximo, umbrales, instante=None):
+        self.ultimo = maximo
+        self.instante = instante
+        self.siguiente = 0
+        self.nuevo_maximo(maximo, umbrales, instante)
+
+    def nuevo_maximo(self, maximo, umbrales, instante):
+        self.maximo = maximo
+        self.instante_maximo = instante
+        self.minimo = maximo
+        self.siguiente = 0
+        # Precio de cada umbral: cruzar uno es una sola comparación
+        self.niveles = [maximo * (1.0 - u / 100.0) for u in umbrales]
+
+
+class MonitorCaidas:
+    """Sigue el máximo, la caída actual y los umbrales cruzados de muchos activos
+
+    Cada precio cuesta O(1): una búsqueda en un diccionario y unas pocas
+    comparaciones contra los precios de los umbrales, precalculados cuando
+    cambia el máximo. Un umbral se avisa una sola vez por caída, y la
+    recuperación se avisa con el siguiente máximo histórico (misma regla que
+    findDeclines).
+    """
+
+    def __init__(self, umbrales=UMBRALES, al_evento=None):
+        self.umbrales = tuple(sorted(umbrales))
+        self.estados = {}
+        self.al_evento = al_evento or (lambda evento: None)
+
+    def inicializar(self, ticker, maximo, instante=None, precio=None):
+        """Fija el máximo de partida (p. ej. el máximo histórico) sin emitir eventos"""
+        estado = EstadoActivo(maximo, self.umbrales, instante)
+        self.estados[ticker] = estado
+        if precio is not None:
+            # Los umbrales ya cruzados al inicializar no se vuelven a avisar
+            niveles = estado.niveles
+            while estado.siguiente < len(niveles) and precio <= niveles[estado.siguiente]:
+                estado.siguiente += 1
+            estado.minimo = min(estado.minimo, precio)
+            estado.ultimo = precio
+        return estado
+
+    def inicializar_desde_almacen(self, tickers):
+        """Parte del máximo histórico y del último cierre de cada activo del almacén local"""
+        for ticker in tickers:
+            fechas, cierres = leer_cierres(INDICES.get(ticker, ticker))
+            if len(cierres):
+                posicion = cierres.argmax()
+                self.inicializar(ticker, float(cierres[posicion]), fechas[posicion], float(cierres[-1]))
+
+    def actualizar(self, ticker, instante, precio):
+        """Procesa un precio; devuelve los eventos emitidos (lista vacía casi siempre)"""
+        estado = self.estados.get(ticker)
+        if estado is None:
+            self.inicializar(ticker, precio, instante)
+            return []
+        estado.ultimo = precio
+        estado.instante = instante
+        if precio > estado.maximo:
+            eventos = []
+            if estado.siguiente:
+                eventos.append(self._emitir(ticker, instante, 'recuperacion', self.umbrales[estado.siguiente - 1], precio, estado))
+            estado.nuevo_maximo(precio, self.umbrales, instante)
+            return eventos
+        if precio < estado.minimo:
+            estado.minimo = precio
+        niveles = estado.niveles
+        if estado.siguiente < len(niveles) and precio <= niveles[estado.siguiente]:
+            # Un salto grande puede cruzar varios umbrales a la vez
+            eventos = []
+            while estado.siguiente < len(niveles) and precio <= niveles[estado.siguiente]:
+                eventos.append(self._emitir(ticker, instante, 'caida', self.umbrales[estado.siguiente], precio, estado))
+                estado.siguiente += 1
+            return eventos
+        return []
+
+    def procesado(self, ticker, instante):
+        """True si instante no es posterior al último procesado del activo (p. ej. en una ejecución anterior)"""
+        estado = self.estados.get(ticker)
+        return estado is not None and estado.instante is not None and str(instante) <= str(estado.instante)
+
+    def actualizar_barra(self, ticker, instante, maximo, minimo):
+        """Procesa una barra: primero su máximo y luego su mínimo (el orden dentro de la barra no se conoce)"""
+        return self.actualizar(ticker, instante, maximo) + self.actualizar(ticker, instante, minimo)
+
+    def _emitir(self, ticker, instante, tipo, umbral, precio, estado):
+        evento = EventoCaida(ticker, instante, tipo, umbral, precio, estado.maximo, 100 * (1 - precio / estado.maximo))
+        self.al_evento(evento)
+        return evento
+
+    def caida(self, ticker):
+        """Caída actual (%) desde el máximo"""
+        estado = self.estados[ticker]
+        return 100 * (1 - estado.ultimo / estado.maximo)
+
+    def guardar_estado(self, ruta=RUTA_ESTADO):
+        """Guarda máximos, umbrales avisados e instantes procesados para la siguiente ejecución"""
+        activos = {
+            ticker: {
+                'maximo': e.maximo,
+                'instante_maximo': None if e.instante_maximo is None else str(e.instante_maximo),
+                'minimo': e.minimo,
+                'siguiente': e.siguiente,
+                'ultimo': e.ultimo,
+                'instante': None if e.instante is None else str(e.instante),
+            }
+            for ticker, e in self.estados.items()
+        }
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        temporal = ruta + '.tmp'
+        with open(temporal, 'w') as f:
+            json.dump({'umbrales': list(self.umbrales), 'activos': activos}, f, indent=2)
+        os.replace(temporal, ruta)
+
+    def cargar_estado(self, ruta=RUTA_ESTADO):
+        """Retoma el estado guardado; se ignora si no existe o si se guardó con otros umbrales"""
+        if not os.path.exists(ruta):
+            return False
+        with open(ruta, 'r') as f:
+            guardado = json.load(f)
+        if tuple(guardado.get('umbrales', ())) != self.umbrales:
+            return False
+        for ticker, datos in guardado['activos'].items():
+            estado = EstadoActivo(datos['maximo'], self.umbrales, datos['instante_maximo'])
+            estado.minimo = datos['minimo']
+            estado.siguiente = datos['siguiente']
+            estado.ultimo = datos['ultimo']
+            estado.instante = datos['instante']
+            self.estados[ticker] = estado
+        return True
+
+    def resumen(self):
+        """Estado de todos los activos: máximo, último precio, caída actual y máxima, umbrales cruzados"""
+        return {
+            ticker: {
+                'maximo': e.maximo,
+                'instante_maximo': e.instante_maximo,
+                'ultimo': e.ultimo,
+                'caida': 100 * (1 - e.ultimo / e.maximo),
+                'caida_maxima': 100 * (1 - e.minimo / e.maximo),
+                'umbrales_cruzados': self.umbrales[:e.siguiente],
+            }
+            for ticker, e in self.estados.items()
+        }
+
+
+# ==============================
+# Fuentes de precios intradía
+# ==============================
+def barras_yfinance(tickers, period='1d', interval='1m'):
+    """Barras intradía de yfinance de todos los tickers, intercaladas por instante
+
+    Genera (instante, ticker, maximo, minimo).
+    """
+    def barras(ticker):
+        # Sin cache: cada consulta debe traer las barras más recientes
+        datos = cache_yfinance.historial(ticker, period=period, interval=interval, actions=False, refrescar=True)
+        datos = datos.dropna(subset=['High', 'Low'])
+        for instante, maximo, minimo in zip(datos.index, datos['High'].to_numpy(), datos['Low'].to_numpy()):
+            yield instante, ticker, float(maximo), float(minimo)
+    # Cada serie ya viene ordenada: un merge de k vías las intercala sin ordenar todo
+    return heapq.merge(*(barras(t) for t in tickers), key=lambda barra: barra[0])
+
+
+def precios_archivo(archivo):
+    """Reproduce un archivo local instante,ticker,precio línea por línea (sin cargarlo completo)
+
+    Genera (instante, ticker, precio); las líneas deben venir en orden de instante.
+    """
+    with open(archivo, 'r', newline='') as f:
+        for fila in csv.reader(f):
+            if not fila or fila[0] == 'instante':
+                continue
+            yield fila[0], fila[1], float(fila[2])
+
+
+def imprimir_evento(evento):
+    if evento.tipo == 'caida':
+        print(f"{evento.instante} | {evento.ticker} cruzó -{evento.umbral}%: {evento.precio:.2f} "
+              f"({evento.caida:.2f}% bajo el máximo {evento.maximo:.2f})")
+    else:
+        print(f"{evento.instante} | {evento.ticker} nuevo máximo {evento.precio:.2f} tras caer más de {evento.umbral}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Avisos de caídas intradía desde el máximo")
+    parser.add_argument('--tickers', nargs='+', default=['^SPX', '^NDX'])
+    parser.add_argument('--umbrales', nargs='+', type=float, default=list(UMBRALES))
+    parser.add_argument('--archivo', help="reproduce un archivo instante,ticker,precio en lugar de yfinance")
+    parser.add_argument('--periodo', default='1d', help="periodo de yfinance (1d, 5d, ...)")
+    parser.add_argument('--intervalo', default='1m', help="intervalo de las barras de yfinance (1m, 5m, ...)")
+    parser.add_argument('--sin-almacen', action='store_true',
+                        help="no parte del máximo histórico del almacén local (el primer precio es el máximo)")
+    parser.add_argument('--estado', default=RUTA_ESTADO, help="archivo con el estado entre ejecuciones")
+    parser.add_argument('--reiniciar', action='store_true',
+                        help="ignora el estado guardado: vuelve a avisar los umbrales ya cruzados")
+    args = parser.parse_args()
+
+    monitor = MonitorCaidas(args.umbrales, imprimir_evento)
+    if not args.reiniciar:
+        monitor.cargar_estado(args.estado)
+    if not args.sin_almacen:
+        monitor.inicializar_desde_almacen([t for t in args.tickers if t not in monitor.estados])
+    try:
+        # Los precios ya procesados en una ejecución anterior no se vuelven a avisar
+        if args.archivo:
+            for instante, ticker, precio in precios_archivo(args.archivo):
+                if not monitor.procesado(ticker, instante):
+                    monitor.actualizar(ticker, instante, precio)
+        else:
+            for instante, ticker, maximo, minimo in barras_yfinance(args.tickers, args.periodo, args.intervalo):
+                if not monitor.procesado(ticker, instante):
+                    monitor.actualizar_barra(ticker, instante, maximo, minimo)
+    finally:
+        monitor.guardar_estado(args.estado)
+    for ticker, estado in monitor.resumen().items():
+        print(f"{ticker}: máximo {estado['maximo']:.2f} | último {estado['ultimo']:.2f} | caída {estado['caida']:.2f}%")
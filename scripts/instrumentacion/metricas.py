@@ -0,0 +1,172 @@
+import os
+import time
+import json
+import cProfile
+from datetime import datetime
+from contextlib import contextmanager
+import psycopg2.extensions
+
+# ===========================================================
+# Instrumentación de etapas: tiempos, filas, bytes y consultas
+# ===========================================================
+RAIZ_REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+RUTA_REPORTES = os.getenv("REPORTES_EJECUCION_DIR", os.path.join(RAIZ_REPO, 'data', 'reportes_ejecucion'))
+
+# INSTRUMENTACION_PERFIL=1 guarda además un volcado de cProfile junto al reporte
+PERFIL = os.getenv("INSTRUMENTACION_PERFIL", "0") == "1"
+
+
+class Medicion:
+    """Resultado de una etapa; filas y bytes los asigna quien ejecuta la etapa"""
+
+    def __init__(self, etapa, activo):
+        self.etapa = etapa
+        self.activo = activo
+        self.filas = 0
+        self.bytes = 0
+        self.consultas_db = 0
+        self.duracion = 0.0
+        self.error = None
+
+    def a_dict(self):
+        return {
+            'etapa': self.etapa,
+            'activo': self.activo,
+            'duracion_s': round(self.duracion, 6),
+            'filas': int(self.filas),
+            'bytes': int(self.bytes),
+            'filas_por_s': round(self.filas / self.duracion, 2) if self.duracion > 0 else None,
+            'consultas_db': self.consultas_db,
+            'error': self.error,
+        }
+
+
+class CursorContado(psycopg2.extensions.cursor):
+    """Cursor que cuenta cada viaje de ida y vuelta a la base de datos"""
+
+    instrumentacion = None
+
+    def _contar(self):
+        if self.instrumentacion is not None:
+            self.instrumentacion.contar_consulta()
+
+    def execute(self, query, vars=None):
+        self._contar()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        # psycopg2 ejecuta una consulta por cada elemento
+        vars_list = list(vars_list)
+        for _ in vars_list:
+            self._contar()
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        self._contar()
+        return super().copy_expert(sql, file, size)
+
+
+class ConexionInstrumentada:
+    """Envoltura de una conexión psycopg2 que cuenta consultas, commits y rollbacks"""
+
+    def __init__(self, conn, instrumentacion):
+        self._conn = conn
+        self._instrumentacion = instrumentacion
+
+    def cursor(self, *args, **kwargs):
+        # Los cursores con nombre (server-side) conservan la clase por defecto
+        if args or 'name' in kwargs or 'cursor_factory' in kwargs:
+            return self._conn.cursor(*args, **kwargs)
+        cur = self._conn.cursor(cursor_factory=CursorContado)
+        cur.instrumentacion = self._instrumentacion
+        return cur
+
+    def commit(self):
+        self._instrumentacion.contar_consulta()
+        return self._conn.commit()
+
+    def rollback(self):
+        self._instrumentacion.contar_consulta()
+        return self._conn.rollback()
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+
+class Instrumentacion:
+    """Registra la duración, filas, bytes, filas/s y consultas de cada etapa por activo"""
+
+    def __init__(self, nombre, perfil=PERFIL):
+        self.nombre = nombre
+        self.inicio = time.time()
+        self.mediciones = []
+        self._activas = []
+        self.consultas_db = 0
+        self._perfil = cProfile.Profile() if perfil else None
+        if self._perfil:
+            self._perfil.enable()
+
+    @contextmanager
+    def etapa(self, etapa, activo=None):
+        """Mide una etapa (fetch, limpieza, csv, db_upsert, ...) de un activo"""
+        medicion = Medicion(etapa, activo)
+        self._activas.append(medicion)
+        inicio = time.perf_counter()
+        try:
+            yield medicion
+        except Exception as e:
+            medicion.error = str(e)
+            raise
+        finally:
+            medicion.duracion = time.perf_counter() - inicio
+            self._activas.remove(medicion)
+            self.mediciones.append(medicion)
+
+    def contar_consulta(self):
+        self.consultas_db += 1
+        for medicion in self._activas:
+            medicion.consultas_db += 1
+
+    def conexion(self, conn):
+        """Devuelve la conexión envuelta para contar sus viajes a la base de datos"""
+        if conn is None or isinstance(conn, ConexionInstrumentada):
+            return conn
+        return ConexionInstrumentada(conn, self)
+
+    def resumen_etapas(self):
+        """Totales por tipo de etapa"""
+        totales = {}
+        for m in self.mediciones:
+            t = totales.setdefault(m.etapa, {'duracion_s': 0.0, 'filas': 0, 'bytes': 0, 'consultas_db': 0, 'ejecuciones': 0})
+            t['duracion_s'] += m.duracion
+            t['filas'] += int(m.filas)
+            t['bytes'] += int(m.bytes)
+            t['consultas_db'] += m.consultas_db
+            t['ejecuciones'] += 1
+        for t in totales.values():
+            t['filas_por_s'] = round(t['filas'] / t['duracion_s'], 2) if t['duracion_s'] > 0 else None
+            t['duracion_s'] = round(t['duracion_s'], 6)
+        return totales
+
+    def reporte(self):
+        return {
+            'ejecucion': self.nombre,
+            'inicio': datetime.fromtimestamp(self.inicio).isoformat(),
+            'duracion_total_s': round(time.time() - self.inicio, 6),
+            'consultas_db': self.consultas_db,
+            'etapas': self.resumen_etapas(),
+            'mediciones': [m.a_dict() for m in self.mediciones],
+        }
+
+    def guardar_reporte(self, ruta=RUTA_REPORTES):
+        """Escribe el reporte JSON (y el volcado de cProfile si está activo)"""
+        os.makedirs(ruta, exist_ok=True)
+        base = os.path.join(ruta, f"{self.nombre}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        with open(base + '.json', 'w') as f:
+            json.dump(self.reporte(), f, indent=2, ensure_ascii=False)
+        if self._perfil:
+            self._perfil.disable()
+            self._perfil.dump_stats(base + '.prof')
+            self._perfil.enable()
+        print(f"📊 Reporte de ejecución: {base}.json")
+        return base + '.json'